@@ -0,0 +1,599 @@
+from functools import lru_cache
+
+from scheduler import Event
+
+#  Buffered APU. During a frame $4000-$4017 writes are only appended to a
+#  log with their CPU cycle. run(cycle) replays the log: between two writes
+#  (or frame sequencer clocks) every channel is constant, so each span is
+#  one vectorized NumPy operation per channel, sampled every
+#  CYCLES_PER_SAMPLE CPU cycles into preallocated buffers. end_frame() mixes
+#  the channels through the nonlinear mixer tables, resamples and hands the
+#  block to `audio_callback`. Without a callback only channel state (length
+#  counters, envelopes, DMC position) is advanced and NumPy is never
+#  imported. A $4015 read replays the log up to its cycle first.
+#  Not modelled: DMC DMA stalls and the DMC IRQ line (the status flag is
+#  kept), the $4017 write delay.
+
+CPU_HZ: float = 1789773.0  # NTSC
+CYCLES_PER_SAMPLE: 'usize' = 8  # native rate CPU_HZ / 8, about 224 kHz
+NATIVE_RATE: float = CPU_HZ / CYCLES_PER_SAMPLE
+
+LENGTH_TABLE: '[u8; 32]' = bytes([
+  10, 254, 20, 2, 40, 4, 80, 6, 160, 8, 60, 10, 14, 12, 26, 14,
+  12, 16, 24, 18, 48, 20, 96, 22, 192, 24, 72, 26, 16, 28, 32, 30])
+DUTY_TABLE = (
+  (0, 1, 0, 0, 0, 0, 0, 0),
+  (0, 1, 1, 0, 0, 0, 0, 0),
+  (0, 1, 1, 1, 1, 0, 0, 0),
+  (1, 0, 0, 1, 1, 1, 1, 1),
+)
+TRIANGLE_TABLE = tuple(range(15, -1, -1)) + tuple(range(16))
+NOISE_PERIODS = (4, 8, 16, 32, 64, 96, 128, 160, 202, 254, 380, 508, 762, 1016, 2034, 4068)
+DMC_RATES = (428, 380, 340, 320, 286, 254, 226, 214, 190, 160, 142, 128, 106, 84, 72, 54)
+
+# frame sequencer: (CPU cycles after the $4017 write, half frame clock)
+SEQUENCER_STEPS = {
+  0: ((7457, False), (14913, True), (22371, False), (29829, True)),
+  1: ((7457, False), (14913, True), (22371, False), (37281, True)),
+}
+SEQUENCER_PERIOD = {0: 29830, 1: 37282}
+FRAME_IRQ_DELAY: 'usize' = 29829
+
+APU_REGISTERS: 'u16' = 0x4000
+APU_REGISTERS_END: 'u16' = 0x4013
+APU_STATUS: 'u16' = 0x4015
+APU_FRAME_COUNTER: 'u16' = 0x4017
+
+
+@lru_cache(maxsize=None)
+def noise_sequence(mode: int) -> bytes:
+  # 1 where the channel is audible, one entry per LFSR clock, one period
+  tap = 6 if mode else 1
+  state = start = 1
+  out = bytearray()
+  while True:
+    out.append(0 if state & 1 else 1)
+    feedback = (state ^ (state >> tap)) & 1
+    state = (state >> 1) | (feedback << 14)
+    if state == start or len(out) >= 32767:
+      return bytes(out)
+
+
+@lru_cache(maxsize=None)
+def tables() -> dict:
+  import numpy as np
+  return {
+    'duty': np.array(DUTY_TABLE, dtype=np.intp),
+    'triangle': np.array(TRIANGLE_TABLE, dtype=np.intp),
+    'noise': tuple(np.frombuffer(noise_sequence(m), dtype=np.uint8).astype(np.intp)
+                   for m in (0, 1)),
+    # nonlinear mixer: https://wiki.nesdev.com/w/index.php/APU_Mixer
+    'pulse': np.array([0.0] + [95.52 / (8128.0 / n + 100) for n in range(1, 31)],
+                      dtype=np.float32),
+    'tnd': np.array([0.0] + [163.67 / (24329.0 / n + 100) for n in range(1, 203)],
+                    dtype=np.float32),
+  }
+
+
+class Envelope:
+  def __init__(self):
+    self.start = False
+    self.loop = False  # doubles as the length counter halt flag
+    self.constant = False
+    self.volume: 'u8' = 0
+    self.divider: 'u8' = 0
+    self.decay: 'u8' = 0
+
+  def write(self, value: 'u8'):
+    self.loop = value & 0b0010_0000 != 0
+    self.constant = value & 0b0001_0000 != 0
+    self.volume = value & 0x0f
+
+  def clock(self):
+    if self.start:
+      self.start = False
+      self.decay = 15
+      self.divider = self.volume
+    elif self.divider:
+      self.divider -= 1
+    else:
+      self.divider = self.volume
+      if self.decay:
+        self.decay -= 1
+      elif self.loop:
+        self.decay = 15
+
+  def level(self) -> 'u8':
+    return self.volume if self.constant else self.decay
+
+
+class Pulse:
+  def __init__(self, ones_complement: bool):
+    # pulse 1 negates its sweep with one's complement, pulse 2 with two's
+    self.negate_extra = 1 if ones_complement else 0
+    self.envelope = Envelope()
+    self.enabled = False
+    self.duty: 'u8' = 0
+    self.timer: 'u16' = 0
+    self.length: 'u8' = 0
+    self.sweep_enabled = False
+    self.sweep_period: 'u8' = 0
+    self.sweep_negate = False
+    self.sweep_shift: 'u8' = 0
+    self.sweep_divider: 'u8' = 0
+    self.sweep_reload = False
+    self.phase: float = 0.0  # sequencer step, 0-8
+
+  def write(self, reg: int, value: 'u8'):
+    if reg == 0:
+      self.duty = value >> 6
+      self.envelope.write(value)
+    elif reg == 1:
+      self.sweep_enabled = value & 0x80 != 0
+      self.sweep_period = (value >> 4) & 0b111
+      self.sweep_negate = value & 0b1000 != 0
+      self.sweep_shift = value & 0b111
+      self.sweep_reload = True
+    elif reg == 2:
+      self.timer = (self.timer & 0x700) | value
+    else:
+      self.timer = (self.timer & 0xff) | ((value & 0b111) << 8)
+      if self.enabled:
+        self.length = LENGTH_TABLE[value >> 3]
+      self.envelope.start = True
+      self.phase = 0.0
+
+  def target(self) -> int:
+    delta = self.timer >> self.sweep_shift
+    if self.sweep_negate:
+      return self.timer - delta - self.negate_extra
+    return self.timer + delta
+
+  def muted(self) -> bool:
+    return self.length == 0 or self.timer < 8 or self.target() > 0x7ff
+
+  def quarter(self):
+    self.envelope.clock()
+
+  def half(self):
+    if self.length and not self.envelope.loop:
+      self.length -= 1
+    if self.sweep_divider == 0 and self.sweep_enabled and self.sweep_shift \
+        and not self.muted():
+      self.timer = max(self.target(), 0)
+    if self.sweep_divider == 0 or self.sweep_reload:
+      self.sweep_divider = self.sweep_period
+      self.sweep_reload = False
+    else:
+      self.sweep_divider -= 1
+
+  def advance(self, cycles: 'usize'):
+    self.phase = (self.phase + cycles / ((self.timer + 1) * 2)) % 8
+
+  def render(self, out: 'np.ndarray', times: 'np.ndarray'):
+    level = 0 if self.muted() else self.envelope.level()
+    if not level:
+      out[:] = 0
+      return
+    steps = (self.phase + times / ((self.timer + 1) * 2)).astype(out.dtype) & 7
+    out[:] = tables()['duty'][self.duty][steps] * level
+
+
+class Triangle:
+  def __init__(self):
+    self.enabled = False
+    self.control = False  # also halts the length counter
+    self.linear_reload_value: 'u8' = 0
+    self.linear: 'u8' = 0
+    self.linear_reload = False
+    self.timer: 'u16' = 0
+    self.length: 'u8' = 0
+    self.phase: float = 0.0  # sequence step, 0-32
+
+  def write(self, reg: int, value: 'u8'):
+    if reg == 0:
+      self.control = value & 0x80 != 0
+      self.linear_reload_value = value & 0x7f
+    elif reg == 2:
+      self.timer = (self.timer & 0x700) | value
+    elif reg == 3:
+      self.timer = (self.timer & 0xff) | ((value & 0b111) << 8)
+      if self.enabled:
+        self.length = LENGTH_TABLE[value >> 3]
+      self.linear_reload = True
+
+  def running(self) -> bool:
+    # an ultrasonic period (< 2) is held instead of played
+    return self.length > 0 and self.linear > 0 and self.timer >= 2
+
+  def quarter(self):
+    if self.linear_reload:
+      self.linear = self.linear_reload_value
+    elif self.linear:
+      self.linear -= 1
+    if not self.control:
+      self.linear_reload = False
+
+  def half(self):
+    if self.length and not self.control:
+      self.length -= 1
+
+  def advance(self, cycles: 'usize'):
+    if self.running():
+      self.phase = (self.phase + cycles / (self.timer + 1)) % 32
+
+  def render(self, out: 'np.ndarray', times: 'np.ndarray'):
+    table = tables()['triangle']
+    if not self.running():
+      out[:] = table[int(self.phase)]
+      return
+    out[:] = table[(self.phase + times / (self.timer + 1)).astype(out.dtype) & 31]
+
+
+class Noise:
+  def __init__(self):
+    self.envelope = Envelope()
+    self.enabled = False
+    self.mode = 0
+    self.period: 'u16' = NOISE_PERIODS[0]
+    self.length: 'u8' = 0
+    self.phase: float = 0.0  # index into noise_sequence(mode)
+
+  def write(self, reg: int, value: 'u8'):
+    if reg == 0:
+      self.envelope.write(value)
+    elif reg == 2:
+      self.mode = value >> 7
+      self.period = NOISE_PERIODS[value & 0x0f]
+      self.phase %= len(noise_sequence(self.mode))
+    elif reg == 3:
+      if self.enabled:
+        self.length = LENGTH_TABLE[value >> 3]
+      self.envelope.start = True
+
+  def quarter(self):
+    self.envelope.clock()
+
+  def half(self):
+    if self.length and not self.envelope.loop:
+      self.length -= 1
+
+  def advance(self, cycles: 'usize'):
+    self.phase = (self.phase + cycles / self.period) % len(noise_sequence(self.mode))
+
+  def render(self, out: 'np.ndarray', times: 'np.ndarray'):
+    level = self.envelope.level() if self.length else 0
+    if not level:
+      out[:] = 0
+      return
+    sequence = tables()['noise'][self.mode]
+    out[:] = sequence[(self.phase + times / self.period).astype(out.dtype)
+                      % len(sequence)] * level
+
+
+class Dmc:
+  def __init__(self, read):
+    self.read = read  # bus read for sample bytes
+    self.irq_enabled = False
+    self.interrupt = False
+    self.loop = False
+    self.rate: 'u16' = DMC_RATES[0]
+    self.level: 'u8' = 0
+    self.sample_address: 'u16' = 0xc000
+    self.sample_length: 'u16' = 1
+    self.address: 'u16' = 0xc000
+    self.remaining: 'u16' = 0
+    self.shift: 'u8' = 0
+    self.bits: 'u8' = 8
+    self.silence = True
+    self.timer: 'u16' = self.rate  # CPU cycles until the next output clock
+
+  def write(self, reg: int, value: 'u8'):
+    if reg == 0:
+      self.irq_enabled = value & 0x80 != 0
+      self.loop = value & 0x40 != 0
+      self.rate = DMC_RATES[value & 0x0f]
+      if not self.irq_enabled:
+        self.interrupt = False
+    elif reg == 1:
+      self.level = value & 0x7f
+    elif reg == 2:
+      self.sample_address = 0xc000 + value * 64
+    else:
+      self.sample_length = value * 16 + 1
+
+  def enable(self, on: bool):
+    if not on:
+      self.remaining = 0
+    elif self.remaining == 0:
+      self.restart()
+
+  def restart(self):
+    self.address = self.sample_address
+    self.remaining = self.sample_length
+
+  def fetch(self) -> bool:
+    if not self.remaining:
+      return False
+    self.shift = self.read(self.address)
+    self.address = 0x8000 if self.address == 0xffff else self.address + 1
+    self.remaining -= 1
+    if not self.remaining:
+      if self.loop:
+        self.restart()
+      elif self.irq_enabled:
+        self.interrupt = True
+    return True
+
+  def clock(self):
+    if not self.silence:
+      if self.shift & 1:
+        if self.level <= 125:
+          self.level += 2
+      elif self.level >= 2:
+        self.level -= 2
+      self.shift >>= 1
+    self.bits -= 1
+    if self.bits == 0:
+      self.bits = 8
+      self.silence = not self.fetch()
+
+  def run(self, cycles: 'usize') -> 'Vec<(usize, u8)>':
+    # (cycle offset, new level) for every output clock in the span
+    changes = []
+    if self.silence and not self.remaining:
+      # idle: the timer and bit counter keep running but nothing can change
+      clocks = (cycles - self.timer) // self.rate + 1 if self.timer <= cycles else 0
+      self.timer += clocks * self.rate - cycles
+      self.bits = (self.bits - 1 - clocks) % 8 + 1
+      return changes
+    at = self.timer
+    while at <= cycles:
+      before = self.level
+      self.clock()
+      if self.level != before:
+        changes.append((at, self.level))
+      at += self.rate
+    self.timer = at - cycles
+    return changes
+
+  def render(self, out: 'np.ndarray', times: 'np.ndarray', start_level: 'u8',
+             changes: 'Vec<(usize, u8)>'):
+    import numpy as np
+    if not changes:
+      out[:] = start_level
+      return
+    at = np.array([c for c, _ in changes], dtype=np.float64)
+    levels = np.array([start_level] + [v for _, v in changes], dtype=out.dtype)
+    out[:] = levels[np.searchsorted(at, times, side='right')]
+
+
+class Resampler:
+  #  Box low-pass over one output period, then linear interpolation. The
+  #  read position and filter history carry over between blocks, so frame
+  #  boundaries do not click.
+  def __init__(self, in_rate: float, out_rate: float):
+    self.in_rate = in_rate
+    self.out_rate = out_rate
+    self.step = in_rate / out_rate
+    self.width = max(1, int(self.step))
+    self.position: float = 0.0  # input index of the next output sample
+    self.history = None  # last width - 1 input samples
+    self.last: float = 0.0  # last filtered sample of the previous block
+
+  def process(self, samples: 'np.ndarray') -> 'np.ndarray':
+    import numpy as np
+    n = len(samples)
+    if not n:
+      return np.zeros(0, dtype=np.float32)
+    if self.history is None:
+      self.history = np.full(self.width - 1, samples[0], dtype=np.float64)
+      self.last = float(samples[0])
+    x = np.concatenate((self.history, samples))
+    total = np.concatenate(([0.0], np.cumsum(x, dtype=np.float64)))
+    filtered = (total[self.width:] - total[:-self.width]) / self.width
+    # index -1 is the previous block's last sample
+    y = np.concatenate(([self.last], filtered))
+    count = int((n - 1 - self.position) // self.step) + 1 if self.position <= n - 1 else 0
+    positions = self.position + np.arange(count) * self.step
+    out = np.interp(positions, np.arange(-1, n), y).astype(np.float32)
+    self.position += count * self.step - n
+    self.history = x[len(x) - self.width + 1:]
+    self.last = float(filtered[-1])
+    return out
+
+
+class Apu:
+  def __init__(self, read=None, scheduler: 'Scheduler' = None):
+    self.pulse1 = Pulse(ones_complement=True)
+    self.pulse2 = Pulse(ones_complement=False)
+    self.triangle = Triangle()
+    self.noise = Noise()
+    self.dmc = Dmc(read or (lambda addr: 0))
+    self.scheduler = scheduler
+    self.log: 'Vec<(usize, u16, u8)>' = []
+    self.cycle: 'usize' = 0  # everything before this cycle is replayed
+    # --- frame sequencer
+    self.mode = 0
+    self.irq_inhibit = False
+    self.frame_interrupt = False
+    self.sequencer_origin: 'usize' = 0
+    self.sequencer_step = 0
+    self.sequencer_cycle: 'usize' = SEQUENCER_STEPS[0][0][0]
+    # --- output, see enable_output
+    self.audio_callback = None
+    self.resampler = None
+    self.sample_cycle: 'usize' = 0  # CPU cycle of the next native sample
+    self.filled: 'usize' = 0
+    self.buffers = None
+    self.frames: 'usize' = 0
+
+  # --- CPU side: O(1) per access
+  def write(self, cycle: 'usize', addr: 'u16', data: 'u8'):
+    self.log.append((cycle, addr, data))
+    if addr == APU_FRAME_COUNTER:
+      self.irq_inhibit = data & 0x40 != 0
+      if self.irq_inhibit:
+        self.frame_interrupt = False
+      if self.scheduler is not None:
+        if data & 0xc0:
+          self.scheduler.cancel(Event.APU_FRAME_IRQ)
+        else:
+          self.scheduler.reschedule(cycle + FRAME_IRQ_DELAY, Event.APU_FRAME_IRQ)
+
+  def frame_irq(self, cycle: 'usize'):
+    # scheduler callback, 4-step mode without inhibit
+    self.frame_interrupt = True
+    self.scheduler.schedule(cycle + SEQUENCER_PERIOD[0], Event.APU_FRAME_IRQ)
+
+  def read_status(self, cycle: 'usize') -> 'u8':
+    self.run(cycle)
+    status = (
+      (self.pulse1.length > 0)
+      | (self.pulse2.length > 0) << 1
+      | (self.triangle.length > 0) << 2
+      | (self.noise.length > 0) << 3
+      | (self.dmc.remaining > 0) << 4
+      | self.frame_interrupt << 6
+      | self.dmc.interrupt << 7)
+    self.frame_interrupt = False
+    return status
+
+  # --- replay
+  def channels(self) -> tuple:
+    return (self.pulse1, self.pulse2, self.triangle, self.noise)
+
+  def apply(self, addr: 'u16', data: 'u8'):
+    if addr < 0x4004:
+      self.pulse1.write(addr - 0x4000, data)
+    elif addr < 0x4008:
+      self.pulse2.write(addr - 0x4004, data)
+    elif addr < 0x400c:
+      self.triangle.write(addr - 0x4008, data)
+    elif addr < 0x4010:
+      self.noise.write(addr - 0x400c, data)
+    elif addr < 0x4014:
+      self.dmc.write(addr - 0x4010, data)
+    elif addr == APU_STATUS:
+      for bit, channel in enumerate(self.channels()):
+        channel.enabled = data & (1 << bit) != 0
+        if not channel.enabled:
+          channel.length = 0
+      self.dmc.interrupt = False
+      self.dmc.enable(data & 0x10 != 0)
+    elif addr == APU_FRAME_COUNTER:
+      self.mode = data >> 7
+      self.sequencer_origin = self.cycle
+      self.sequencer_step = 0
+      self.sequencer_cycle = self.cycle + SEQUENCER_STEPS[self.mode][0][0]
+      if self.mode:
+        self.clock_frame(True)
+
+  def clock_frame(self, half: bool):
+    for channel in self.channels():
+      channel.quarter()
+      if half:
+        channel.half()
+
+  def clock_sequencer(self):
+    steps = SEQUENCER_STEPS[self.mode]
+    self.clock_frame(steps[self.sequencer_step][1])
+    self.sequencer_step += 1
+    if self.sequencer_step == len(steps):
+      self.sequencer_step = 0
+      self.sequencer_origin += SEQUENCER_PERIOD[self.mode]
+    self.sequencer_cycle = self.sequencer_origin + steps[self.sequencer_step][0]
+
+  def run(self, until: 'usize'):
+    log = self.log
+    i = 0
+    while True:
+      cycle = until
+      if i < len(log) and log[i][0] < cycle:
+        cycle = log[i][0]
+      tick = self.sequencer_cycle
+      if tick < cycle:
+        cycle = tick
+      self.advance(cycle)
+      if tick == cycle:
+        self.clock_sequencer()
+      elif i < len(log) and log[i][0] == cycle:
+        self.apply(log[i][1], log[i][2])
+        i += 1
+      else:
+        break
+    del log[:i]
+
+  def advance(self, cycle: 'usize'):
+    cycles = cycle - self.cycle
+    if cycles <= 0:
+      return
+    dmc_level = self.dmc.level
+    changes = self.dmc.run(cycles)
+    if self.audio_callback is not None:
+      count = max(0, -(-(cycle - self.sample_cycle) // CYCLES_PER_SAMPLE))
+      if count:
+        start, end = self.filled, self.filled + count
+        self.reserve(end)
+        times = self.ramp[:count] + (self.sample_cycle - self.cycle)
+        for channel, out in zip(self.channels(), self.buffers):
+          channel.render(out[start:end], times)
+        self.dmc.render(self.buffers[4][start:end], times, dmc_level, changes)
+        self.filled = end
+        self.sample_cycle += count * CYCLES_PER_SAMPLE
+    for channel in self.channels():
+      channel.advance(cycles)
+    self.cycle = cycle
+
+  # --- output
+  def enable_output(self, audio_callback, sample_rate: float = 48000,
+                    frame_cycles: 'usize' = 29781):
+    # audio_callback(samples) gets one float32 block (0.0 - 1.0) per frame;
+    # without a sample rate it is the native-rate mix buffer itself, only
+    # valid until the next frame
+    self.audio_callback = audio_callback
+    self.resampler = Resampler(NATIVE_RATE, sample_rate) if sample_rate else None
+    self.sample_cycle = -(-self.cycle // CYCLES_PER_SAMPLE) * CYCLES_PER_SAMPLE
+    self.filled = 0
+    self.reserve(2 * frame_cycles // CYCLES_PER_SAMPLE)
+
+  def disable_output(self):
+    self.audio_callback = None
+    self.resampler = None
+    self.buffers = None
+
+  def reserve(self, samples: 'usize'):
+    # buffers only grow, and only when a frame runs long
+    import numpy as np
+    if self.buffers is not None and len(self.mix) >= samples:
+      return
+    size = max(samples, 2 * len(self.mix) if self.buffers is not None else 0)
+    old = self.buffers
+    self.buffers = tuple(np.zeros(size, dtype=np.intp) for _ in range(5))
+    if old is not None:
+      for new, buffer in zip(self.buffers, old):
+        new[:self.filled] = buffer[:self.filled]
+    self.mix = np.zeros(size, dtype=np.float32)
+    self.scratch = np.zeros(size, dtype=np.intp)
+    self.ramp = np.arange(size, dtype=np.float64) * CYCLES_PER_SAMPLE
+
+  def end_frame(self, cycle: 'usize'):
+    self.run(cycle)
+    self.frames += 1
+    if self.audio_callback is None:
+      return None
+    import numpy as np
+    n = self.filled
+    self.filled = 0
+    mixer = tables()
+    pulse1, pulse2, triangle, noise, dmc = (b[:n] for b in self.buffers)
+    mix, scratch = self.mix[:n], self.scratch[:n]
+    np.add(pulse1, pulse2, out=scratch)
+    np.take(mixer['pulse'], scratch, out=mix)
+    np.multiply(triangle, 3, out=scratch)
+    scratch += noise * 2
+    scratch += dmc
+    mix += mixer['tnd'][scratch]
+    samples = self.resampler.process(mix) if self.resampler is not None else mix
+    self.audio_callback(samples)
+    return samples
@@ -1,5 +1,13 @@
+import struct
+
+from apu import Apu, APU_REGISTERS, APU_REGISTERS_END, APU_STATUS, APU_FRAME_COUNTER
 from cartridge import Rom
+from joypad import Joypad
+from memmap import DIRTY_BLOCK_SHIFT, DIRTY_BLOCKS
 from cpu import Mem
+from ppu import NesPPU
+from scheduler import Scheduler, Event
+from diagnostics import report, Diag
 
 #  _______________ $10000  _______________
 # | PRG-ROM       |       |               |
@@ -33,12 +41,139 @@ RAM: 'u16' = 0x0000
 RAM_MIRRORS_END: 'u16' = 0x1FFF
 PPU_REGISTERS: 'u16' = 0x2000
 PPU_REGISTERS_MIRRORS_END: 'u16' = 0x3FFF
+OAM_DMA: 'u16' = 0x4014
+JOYPAD1: 'u16' = 0x4016
+JOYPAD2: 'u16' = 0x4017
+
+U16 = struct.Struct('<H')
 
 
 class Bus(Mem):
   def __init__(self, rom: 'Rom'):
-    self.cpu_vram: '[u8; 2048]' = [0] * 2048
+    self.cpu_vram: '[u8; 2048]' = bytearray(2048)
     self.rom = rom
+    self.cpu: 'CPU' = None  # set by CPU(bus)
+    # --- dirty tracking, only for blocks inside a watched range
+    self.generation: 'usize' = 0
+    # ids of the regions covering each block, () when unwatched
+    self.watched: '[Vec<usize>; 64]' = [()] * DIRTY_BLOCKS
+    self.block_generation: '[usize; 64]' = [0] * DIRTY_BLOCKS
+    self.region_generation: 'Vec<usize>' = []
+    self.regions: 'Vec<(u16, u16)>' = []
+    self.ppu = NesPPU(rom.chr_rom, rom.screen_mirroring)
+    self.cycles: 'usize' = 0
+    self.irq_sources: 'u8' = 0  # IRQ line is asserted while non-zero
+    self.scheduler = Scheduler()
+    self.scheduler.handlers.update({
+      Event.PPU_SYNC: lambda cycle, data: self.sync_ppu(),
+      Event.MAPPER_IRQ: lambda cycle, data: self.raise_irq(Event.MAPPER_IRQ),
+      Event.APU_FRAME_IRQ: self.apu_frame_irq,
+      Event.DMA_STALL: self.stall,
+      Event.INTERRUPT_POLL: lambda cycle, data: None,
+    })
+    self.apu = Apu(self.mem_read, self.scheduler)
+    self.joypad1 = Joypad()
+    self.joypad2 = Joypad()
+    # --- the PPU is caught up lazily, at the latest on this CPU cycle
+    self.ppu_sync_cycle: 'usize' = self.ppu.next_sync_cycle()
+    self.scheduler.schedule(self.ppu_sync_cycle, Event.PPU_SYNC)
+
+  def tick(self, cycles: 'u8') -> bool:
+    # True when events were dispatched and interrupts need polling
+    self.cycles += cycles
+    if self.cycles < self.scheduler.next_cycle:
+      return False
+    scheduler = self.scheduler
+    while self.cycles >= scheduler.next_cycle:
+      scheduler.run_until(self.cycles)
+    return True
+
+  def stall(self, cycle: 'usize', cycles: 'u16'):
+    self.cycles += cycles
+
+  def request_interrupt_poll(self):
+    self.scheduler.schedule(self.cycles, Event.INTERRUPT_POLL)
+
+  def raise_irq(self, source: 'Event'):
+    self.irq_sources |= 1 << source
+    self.request_interrupt_poll()
+
+  def acknowledge_irq(self, source: 'Event'):
+    self.irq_sources &= ~(1 << source)
+
+  def schedule_mapper_irq(self, cycle: 'usize'):
+    # for mappers with IRQ counters: assert the line on `cycle`
+    self.scheduler.reschedule(cycle, Event.MAPPER_IRQ)
+
+  def acknowledge_mapper_irq(self):
+    # the mapper's acknowledge / disable register: release the line and
+    # drop a pending counter IRQ
+    self.scheduler.cancel(Event.MAPPER_IRQ)
+    self.acknowledge_irq(Event.MAPPER_IRQ)
+
+  def apu_frame_irq(self, cycle: 'usize', data):
+    self.apu.frame_irq(cycle)
+    self.raise_irq(Event.APU_FRAME_IRQ)
+
+  def read_apu_status(self) -> 'u8':
+    self.acknowledge_irq(Event.APU_FRAME_IRQ)
+    return self.apu.read_status(self.cycles)
+
+  def write_apu_frame_counter(self, data: 'u8'):
+    # the inhibit bit clears the frame interrupt flag, and so the IRQ line
+    if data & 0x40:
+      self.acknowledge_irq(Event.APU_FRAME_IRQ)
+    self.apu.write(self.cycles, APU_FRAME_COUNTER, data)
+
+  def sync_ppu(self):
+    ppu = self.ppu
+    frame = ppu.frame_count
+    ppu.catch_up(self.cycles)
+    if ppu.frame_count != frame:
+      # audio for the frame is synthesized in one block
+      self.apu.end_frame(self.cycles)
+    if ppu.nmi_interrupt:
+      self.request_interrupt_poll()
+    sync = ppu.next_sync_cycle()
+    if sync != self.ppu_sync_cycle:
+      self.ppu_sync_cycle = sync
+      self.scheduler.reschedule(sync, Event.PPU_SYNC)
+
+  def poll_nmi_status(self) -> bool:
+    return self.ppu.poll_nmi_interrupt()
+
+  def read_ppu_register(self, addr: 'u16') -> 'u8':
+    self.sync_ppu()
+    if addr == 0x2002:
+      return self.ppu.read_status()
+    elif addr == 0x2004:
+      return self.ppu.read_oam_data()
+    elif addr == 0x2007:
+      return self.ppu.read_data()
+    else:
+      report(Diag.PPU_WRITE_ONLY_READ, addr, '${:04x}', addr)
+      return 0
+
+  def write_ppu_register(self, addr: 'u16', data: 'u8'):
+    self.sync_ppu()
+    if addr == 0x2000:
+      self.ppu.write_to_ctrl(data)
+      if self.ppu.nmi_interrupt:
+        self.request_interrupt_poll()
+    elif addr == 0x2001:
+      self.ppu.write_to_mask(data)
+    elif addr == 0x2002:
+      report(Diag.PPU_READ_ONLY_WRITE, addr, '${:04x}', addr)
+    elif addr == 0x2003:
+      self.ppu.write_to_oam_addr(data)
+    elif addr == 0x2004:
+      self.ppu.write_to_oam_data(data)
+    elif addr == 0x2005:
+      self.ppu.write_to_scroll(data)
+    elif addr == 0x2006:
+      self.ppu.write_to_ppu_addr(data)
+    elif addr == 0x2007:
+      self.ppu.write_to_data(data)
 
   def read_prg_rom(self, addr: 'u16') -> 'u8':
     addr -= 0x8000
@@ -47,28 +182,156 @@ class Bus(Mem):
       addr = addr % 0x4000
     return self.rom.prg_rom[addr]
 
+  def watch(self, start: 'u16', end: 'u16') -> 'usize':
+    # track writes to RAM [start, end); returns a region id
+    region = len(self.regions)
+    self.regions.append((start, end))
+    self.region_generation.append(self.generation)
+    for block in range((start & 0x7ff) >> DIRTY_BLOCK_SHIFT,
+                       (((end - 1) & 0x7ff) >> DIRTY_BLOCK_SHIFT) + 1):
+      self.watched[block] += (region,)
+    return region
+
+  def touch(self, mirror_down_addr: 'u16'):
+    block = mirror_down_addr >> DIRTY_BLOCK_SHIFT
+    self.generation += 1
+    self.block_generation[block] = self.generation
+    for region in self.watched[block]:
+      self.region_generation[region] = self.generation
+
+  def changed_since(self, region: 'usize', generation: 'usize') -> bool:
+    return self.region_generation[region] > generation
+
+  def dirty_rows(self, region: 'usize', generation: 'usize') -> 'Vec<usize>':
+    # 32 byte rows of the region written since `generation`
+    start, end = self.regions[region]
+    first = (start & 0x7ff) >> DIRTY_BLOCK_SHIFT
+    last = ((end - 1) & 0x7ff) >> DIRTY_BLOCK_SHIFT
+    block_generation = self.block_generation
+    return [block - first for block in range(first, last + 1)
+            if block_generation[block] > generation]
+
+  def read_block(self, addr: 'u16', length: 'usize') -> 'Vec<u8>':
+    # resolve the region once per chunk and copy with slices
+    out = bytearray()
+    end = addr + length
+    while addr < end:
+      if addr <= RAM_MIRRORS_END:
+        start = addr & 0x7ff
+        size = min(end - addr, 0x800 - start)
+        out += bytes(self.cpu_vram[start:start + size])
+      elif 0x8000 <= addr <= 0xffff and self.rom.prg_rom:
+        start = addr - 0x8000
+        if len(self.rom.prg_rom) == 0x4000:
+          start &= 0x3fff
+        size = min(end - addr, 0x10000 - addr, len(self.rom.prg_rom) - start)
+        out += self.rom.prg_rom[start:start + size]
+      else:
+        size = 1
+        out.append(self.mem_read(addr & 0xffff))
+      addr += size
+    return bytes(out)
+
+  def write_block(self, addr: 'u16', data: 'Vec<u8>'):
+    end = addr + len(data)
+    pos = 0
+    while addr < end:
+      if addr <= RAM_MIRRORS_END:
+        start = addr & 0x7ff
+        size = min(end - addr, 0x800 - start)
+        chunk = data[pos:pos + size]
+        if any(self.watched[start >> DIRTY_BLOCK_SHIFT:((start + size - 1) >> DIRTY_BLOCK_SHIFT) + 1]):
+          for offset, value in enumerate(chunk):
+            if self.watched[(start + offset) >> DIRTY_BLOCK_SHIFT] and \
+                self.cpu_vram[start + offset] != value:
+              self.touch(start + offset)
+        self.cpu_vram[start:start + size] = chunk
+      elif 0x8000 <= addr <= 0xffff:
+        size = min(end, 0x10000) - addr
+        report(Diag.ROM_WRITE, addr, '${:04x} <- {} bytes', addr, size)
+      else:
+        size = 1
+        self.mem_write(addr & 0xffff, data[pos])
+      addr += size
+      pos += size
+
+  def oam_dma(self, page: 'u8'):
+    self.sync_ppu()
+    data = self.read_block(page << 8, 256)
+    ppu = self.ppu
+    split = 256 - ppu.oam_addr
+    ppu.oam_data[ppu.oam_addr:] = data[:split]
+    ppu.oam_data[:ppu.oam_addr] = data[split:]
+    # the CPU is halted for 513 cycles, +1 when DMA starts on an odd cycle;
+    # the stall lands on the next tick, which then polls interrupts
+    self.scheduler.schedule(self.cycles, Event.DMA_STALL, 513 + (self.cycles & 1))
+
+  def mem_read_u16(self, pos: 'u16') -> 'u16':
+    # one unpack when both bytes sit in the same buffer; a pair that
+    # crosses a mirror or region boundary takes two mem_read calls
+    if pos < RAM_MIRRORS_END:
+      start = pos & 0x7ff
+      if start != 0x7ff:
+        return U16.unpack_from(self.cpu_vram, start)[0]
+    elif pos >= 0x8000:
+      prg_rom = self.rom.prg_rom
+      start = pos - 0x8000
+      if len(prg_rom) == 0x4000:
+        start &= 0x3fff
+      if start < len(prg_rom) - 1:
+        return U16.unpack_from(prg_rom, start)[0]
+    return Mem.mem_read_u16(self, pos)
+
+  def mem_write_u16(self, pos: 'u16', data: 'u16'):
+    if pos < RAM_MIRRORS_END:
+      start = pos & 0x7ff
+      if start != 0x7ff and not self.watched[start >> DIRTY_BLOCK_SHIFT] and \
+          not self.watched[(start + 1) >> DIRTY_BLOCK_SHIFT]:
+        U16.pack_into(self.cpu_vram, start, data)
+        return
+    Mem.mem_write_u16(self, pos, data)
+
   def mem_read(self, addr: 'u16') -> 'u8':
-    if addr in range(RAM, RAM_MIRRORS_END):
+    if addr in range(RAM, RAM_MIRRORS_END + 1):
       mirror_down_addr = addr & 0b0000_0111_1111_1111
       return self.cpu_vram[mirror_down_addr]
-    elif addr in range(PPU_REGISTERS, PPU_REGISTERS_MIRRORS_END):
-      _mirror_down_addr = addr & 0b0010_0000_0000_0111
-      print('PPU is not supported yet')
-    elif addr in range(0x8000, 0xFFFF):
+    elif addr in range(PPU_REGISTERS, PPU_REGISTERS_MIRRORS_END + 1):
+      mirror_down_addr = addr & 0b0010_0000_0000_0111
+      return self.read_ppu_register(mirror_down_addr)
+    elif addr == APU_STATUS:
+      return self.read_apu_status()
+    elif addr == JOYPAD1:
+      return self.joypad1.read()
+    elif addr == JOYPAD2:
+      return self.joypad2.read()
+    elif addr in range(0x8000, 0x10000):
       return self.read_prg_rom(addr)
     else:
-      print(f'Ignoring mem access at addr:{addr}')
+      report(Diag.UNMAPPED_READ, addr, 'ignoring mem access at ${:04x}', addr)
       return 0
 
   def mem_write(self, addr: 'u16', data: 'u8'):
-    if addr in range(RAM, RAM_MIRRORS_END):
+    if addr in range(RAM, RAM_MIRRORS_END + 1):
       mirror_down_addr = addr & 0b0000_0111_1111_1111
+      if self.watched[mirror_down_addr >> DIRTY_BLOCK_SHIFT] and \
+          self.cpu_vram[mirror_down_addr] != data:
+        self.touch(mirror_down_addr)
       self.cpu_vram[mirror_down_addr] = data
-    elif addr in range(PPU_REGISTERS, PPU_REGISTERS_MIRRORS_END):
-      _mirror_down_addr = addr & 0b0010_0000_0000_0111
-      print('PPU is not supported yet')
-    elif addr in range(0x8000, 0xFFFF):
-      print('Attempt to write to Cartridge ROM space')
+    elif addr in range(PPU_REGISTERS, PPU_REGISTERS_MIRRORS_END + 1):
+      mirror_down_addr = addr & 0b0010_0000_0000_0111
+      self.write_ppu_register(mirror_down_addr, data)
+    elif addr == OAM_DMA:
+      self.oam_dma(data)
+    elif addr == JOYPAD1:
+      # the strobe line is shared by both ports
+      self.joypad1.write(data)
+      self.joypad2.write(data)
+    elif APU_REGISTERS <= addr <= APU_REGISTERS_END or addr == APU_STATUS:
+      self.apu.write(self.cycles, addr, data)
+    elif addr == APU_FRAME_COUNTER:
+      self.write_apu_frame_counter(data)
+    elif addr in range(0x8000, 0x10000):
+      report(Diag.ROM_WRITE, addr, '${:04x} <- ${:02x}', addr, data)
     else:
-      print(f'Ignoring mem write-access at addr:{addr}')
+      report(Diag.UNMAPPED_WRITE, addr, 'ignoring mem write-access at ${:04x}', addr)
 
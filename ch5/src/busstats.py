@@ -0,0 +1,121 @@
+from functools import partial
+from typing import NamedTuple
+
+from cpu import Mem
+
+#  Optional per-address read/write counters. install() shadows
+#  bus.mem_read / bus.mem_write with counting wrappers as instance
+#  attributes (around whatever is there, e.g. debugger hooks) and
+#  uninstall() puts the previous state back; nothing is checked on the
+#  default path. Debugger hooks added or cleared while stats are installed
+#  replace these wrappers. Addresses are counted as issued, before
+#  mirroring, so traffic through the RAM mirrors shows up as its own region.
+#  The bus's fused 16-bit accesses are split back into byte accesses while
+#  installed.
+
+HOOKS = ('mem_read', 'mem_write', 'mem_read_u16', 'mem_write_u16')
+
+
+class Region(NamedTuple):
+  name: str
+  start: 'u16'
+  end: 'u16'  # inclusive
+
+
+REGIONS = (
+  Region('zero page', 0x0000, 0x00ff),
+  Region('stack', 0x0100, 0x01ff),
+  Region('ram', 0x0200, 0x07ff),
+  Region('ram mirrors', 0x0800, 0x1fff),
+  Region('ppu registers', 0x2000, 0x3fff),
+  Region('apu / io', 0x4000, 0x401f),
+  Region('cartridge space', 0x4020, 0x7fff),
+  Region('prg rom', 0x8000, 0xffff),
+)
+
+
+class BusStats:
+  def __init__(self, bus: 'Bus', cpu: 'CPU' = None):
+    # the cpu (by default the one on the bus) has its direct zero page /
+    # stack access turned off while installed so that traffic is counted too
+    self.bus = bus
+    self.cpu = cpu if cpu is not None else bus.cpu
+    self.reads = [0] * 0x10000
+    self.writes = [0] * 0x10000
+    self.saved = None
+
+  @property
+  def installed(self) -> bool:
+    return self.saved is not None
+
+  def install(self) -> 'BusStats':
+    if self.installed:
+      return self
+    bus = self.bus
+    attrs = vars(bus)
+    self.saved = {name: attrs[name] for name in HOOKS if name in attrs}
+    read, write = bus.mem_read, bus.mem_write
+    reads, writes = self.reads, self.writes
+
+    def mem_read(addr: 'u16') -> 'u8':
+      reads[addr & 0xffff] += 1
+      return read(addr)
+
+    def mem_write(addr: 'u16', data: 'u8'):
+      writes[addr & 0xffff] += 1
+      write(addr, data)
+
+    bus.mem_read = mem_read
+    bus.mem_write = mem_write
+    bus.mem_read_u16 = partial(Mem.mem_read_u16, bus)
+    bus.mem_write_u16 = partial(Mem.mem_write_u16, bus)
+    if self.cpu is not None:
+      self.cpu.disable_ram_fast_path()
+    return self
+
+  def uninstall(self):
+    if not self.installed:
+      return
+    for name in HOOKS:
+      if name in self.saved:
+        setattr(self.bus, name, self.saved[name])
+      else:
+        vars(self.bus).pop(name, None)
+    if self.cpu is not None:
+      self.cpu.enable_ram_fast_path()
+    self.saved = None
+
+  def __enter__(self):
+    return self.install()
+
+  def __exit__(self, *exc):
+    self.uninstall()
+
+  def reset(self):
+    self.reads[:] = [0] * 0x10000
+    self.writes[:] = [0] * 0x10000
+
+  def regions(self) -> dict:
+    # name -> (reads, writes)
+    return {r.name: (sum(self.reads[r.start:r.end + 1]),
+                     sum(self.writes[r.start:r.end + 1])) for r in REGIONS}
+
+  def pages(self) -> 'Vec<(usize, usize)>':
+    return [(sum(self.reads[page << 8:(page + 1) << 8]),
+             sum(self.writes[page << 8:(page + 1) << 8])) for page in range(256)]
+
+  def hottest(self, n: int = 16) -> 'Vec<(u16, usize, usize)>':
+    totals = sorted(range(0x10000), key=lambda a: self.reads[a] + self.writes[a],
+                    reverse=True)[:n]
+    return [(a, self.reads[a], self.writes[a]) for a in totals
+            if self.reads[a] or self.writes[a]]
+
+  def summary(self, n: int = 16) -> str:
+    total = sum(self.reads) + sum(self.writes) or 1
+    lines = [f'{"region":<16}{"reads":>12}{"writes":>12}{"share":>8}']
+    for name, (reads, writes) in self.regions().items():
+      lines.append(f'{name:<16}{reads:>12}{writes:>12}{(reads + writes) / total:>8.1%}')
+    lines.append('hottest addresses')
+    for addr, reads, writes in self.hottest(n):
+      lines.append(f'  ${addr:04x}{reads:>12}{writes:>12}')
+    return '\n'.join(lines)
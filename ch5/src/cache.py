@@ -0,0 +1,137 @@
+import hashlib
+import importlib.util
+import marshal
+import os
+import pathlib
+import sys
+
+#  Persistent cache for per-ROM analysis and generated code.
+#    entry: MAGIC, sha256 of the payload (32 bytes), marshal payload
+#  Its users are disasm.code_map (code maps for tools like
+#  `python disasm.py rom.nes`) and codegen's fallback for a read-only
+#  install. Game and CPU startup do not read it: the handlers are the same
+#  for every ROM and their warm start is _cpu_ops.py plus the bytecode
+#  Python caches for it, and nothing at run time consumes a code map.
+#  Keys include EMULATOR_VERSION, so a new emulator or Python version
+#  (marshal and code objects are not portable) never sees stale entries.
+#  A corrupt entry is deleted and reported as a miss. After every write the
+#  least recently used entries are evicted until the directory fits in
+#  max_bytes.
+
+MAGIC = b'NESC\x00\x01'
+EMULATOR_VERSION = hashlib.sha1(
+  b'ch5:1:' + importlib.util.MAGIC_NUMBER + sys.version.encode()).hexdigest()[:12]
+CACHE_ENV = 'NES_CACHE_DIR'
+
+
+def default_directory() -> 'pathlib.Path':
+  if os.environ.get(CACHE_ENV):
+    return pathlib.Path(os.environ[CACHE_ENV])
+  return pathlib.Path.home() / '.cache' / 'rust2pysta-nes'
+
+
+class CodeCache:
+  def __init__(self, directory: 'pathlib.Path' = None,
+               max_bytes: 'usize' = 32 * 1024 * 1024):
+    self.directory = pathlib.Path(directory or default_directory())
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+
+  def path(self, kind: str, key: str) -> 'pathlib.Path':
+    return self.directory / f'{kind}-{key}-{EMULATOR_VERSION}.bin'
+
+  def get(self, kind: str, key: str):
+    path = self.path(kind, key)
+    try:
+      raw = path.read_bytes()
+    except OSError:
+      self.misses += 1
+      return None
+    head = len(MAGIC)
+    payload = raw[head + 32:]
+    if raw[:head] != MAGIC or raw[head:head + 32] != hashlib.sha256(payload).digest():
+      self.discard(path)
+      self.misses += 1
+      return None
+    try:
+      value = marshal.loads(payload)
+    except (EOFError, ValueError, TypeError):
+      self.discard(path)
+      self.misses += 1
+      return None
+    try:
+      os.utime(path)  # mark as recently used
+    except OSError:
+      pass
+    self.hits += 1
+    return value
+
+  def put(self, kind: str, key: str, value) -> bool:
+    # best effort: a read-only or full disk only costs the cache
+    payload = marshal.dumps(value)
+    path = self.path(kind, key)
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    try:
+      self.directory.mkdir(parents=True, exist_ok=True)
+      tmp.write_bytes(MAGIC + hashlib.sha256(payload).digest() + payload)
+      os.replace(tmp, path)
+    except OSError:
+      self.discard(tmp)
+      return False
+    self.evict()
+    return True
+
+  def get_or_build(self, kind: str, key: str, build):
+    value = self.get(kind, key)
+    if value is None:
+      value = build()
+      self.put(kind, key, value)
+    return value
+
+  def entries(self) -> 'Vec<pathlib.Path>':
+    try:
+      return list(self.directory.glob('*.bin'))
+    except OSError:
+      return []
+
+  def size(self) -> 'usize':
+    return sum(self._stat(path)[1] for path in self.entries())
+
+  def evict(self):
+    stats = sorted((self._stat(path), path) for path in self.entries())
+    total = sum(size for (_, size), _ in stats)
+    for (_, size), path in stats:
+      if total <= self.max_bytes:
+        break
+      self.discard(path)
+      total -= size
+
+  def clear(self):
+    for path in self.entries():
+      self.discard(path)
+
+  @staticmethod
+  def _stat(path: 'pathlib.Path') -> tuple:
+    try:
+      st = path.stat()
+      return st.st_mtime_ns, st.st_size
+    except OSError:
+      return 0, 0
+
+  @staticmethod
+  def discard(path: 'pathlib.Path'):
+    try:
+      path.unlink()
+    except OSError:
+      pass
+
+
+_default = None
+
+
+def default_cache() -> 'CodeCache':
+  global _default
+  if _default is None:
+    _default = CodeCache()
+  return _default
@@ -15,34 +15,57 @@ class _Mirroring(NamedTuple):
 Mirroring = _Mirroring()
 
 
+class Header(NamedTuple):
+  ines: bool  # starts with NES_TAG
+  ines_ver: 'u8'
+  mapper: 'u8'
+  prg_rom_size: 'usize'
+  chr_rom_size: 'usize'
+  screen_mirroring: 'Mirroring'
+  trainer: bool
+
+
+def parse_header(raw: '&Vec<u8>') -> 'Header':
+  # only looks at the first 16 bytes
+  mapper: 'u8' = (raw[7] & 0b1111_0000) | (raw[6] >> 4)
+  ines_ver = (raw[7] >> 2) & 0b11
+  four_screen = raw[6] & 0b1000 != 0
+  vertical_mirroring = raw[6] & 0b1 != 0
+
+  if four_screen == True:
+    screen_mirroring: 'Mirroring' = Mirroring.FOUR_SCREEN
+  elif vertical_mirroring == True and four_screen == False:
+    screen_mirroring: 'Mirroring' = Mirroring.VERTICAL
+  elif four_screen == False and vertical_mirroring == False:
+    screen_mirroring: 'Mirroring' = Mirroring.HORIZONTAL
+
+  return Header(
+    ines=raw[0:4] == NES_TAG,
+    ines_ver=ines_ver,
+    mapper=mapper,
+    prg_rom_size=raw[4] * PRG_ROM_PAGE_SIZE,
+    chr_rom_size=raw[5] * CHR_ROM_PAGE_SIZE,
+    screen_mirroring=screen_mirroring,
+    trainer=raw[6] & 0b100 != 0)
+
+
 class Rom:
   def __init__(self, raw: '&Vec<u8>'):
-    if raw[0:4] != NES_TAG:
+    header = parse_header(raw)
+    if not header.ines:
       print('File is not in iNES file format')
-    mapper: 'u8' = (raw[7] & 0b1111_0000) | (raw[6] >> 4)
-    ines_ver = (raw[7] >> 2) & 0b11
-    if ines_ver != 0:
+    if header.ines_ver != 0:
       print('NES2.0 format is not supported')
-    four_screen = raw[6] & 0b1000 != 0
-    vertical_mirroring = raw[6] & 0b1 != 0
-
-    if four_screen == True:
-      screen_mirroring: 'Mirroring' = Mirroring.FOUR_SCREEN
-    elif vertical_mirroring == True and four_screen == False:
-      screen_mirroring: 'Mirroring' = Mirroring.VERTICAL
-    elif four_screen == False and vertical_mirroring == False:
-      screen_mirroring: 'Mirroring' = Mirroring.HORIZONTAL
-
-    prg_rom_size = raw[4] * PRG_ROM_PAGE_SIZE
-    chr_rom_size = raw[5] * CHR_ROM_PAGE_SIZE
-    skip_trainer = raw[6] & 0b100 != 0
-    prg_rom_start = 16 + (512 if skip_trainer else 0)
+
+    prg_rom_size = header.prg_rom_size
+    chr_rom_size = header.chr_rom_size
+    prg_rom_start = 16 + (512 if header.trainer else 0)
     chr_rom_start = prg_rom_start + prg_rom_size
 
     self.prg_rom: 'Vec<u8>' = raw[prg_rom_start:(prg_rom_start + prg_rom_size)]
     self.chr_rom: 'Vec<u8>' = raw[chr_rom_start:(chr_rom_start + chr_rom_size)]
-    self.mapper: 'u8' = mapper
-    self.screen_mirroring: 'Mirroring' = screen_mirroring
+    self.mapper: 'u8' = header.mapper
+    self.screen_mirroring: 'Mirroring' = header.screen_mirroring
     self.ok()
 
   def ok(self) -> 'Result<Rom, String>':
@@ -0,0 +1,361 @@
+import hashlib
+import importlib.util
+import os
+import pathlib
+import re
+
+from opcodes import AddressingMode, CPU_OPS_CODES
+from memmap import DIRTY_BLOCK_SHIFT
+
+#  Emits one handler per official opcode (lda_abs_x, adc_ind_y, ...) with
+#  the addressing arithmetic and flag updates written out inline, plus a
+#  256-entry HANDLERS table. Handlers run after the opcode fetch, leave the
+#  program counter on the next instruction and return True only for BRK.
+#  The methods on CPU (step_reference) stay as the reference implementation.
+#
+#  RAM_HANDLERS replaces the handlers that touch $0000-$01FF (zero page
+#  modes, (ind,X)/(ind),Y pointers, stack operations) with variants that
+#  index bus.cpu_vram directly. Writes still go through bus.mem_write when
+#  the block is watched for dirty tracking. The debugger and bus stats
+#  switch back to HANDLERS while they observe the bus.
+#
+#  The source is cached next to this file as _cpu_ops.py and regenerated
+#  when the opcode table or this generator changes; Python's own bytecode
+#  cache makes later imports cheap. Where that directory is read-only the
+#  compiled code object is kept in cache.CodeCache instead.
+#    python codegen.py   # build ahead of time
+
+VERSION = 2
+MODULE_PATH = pathlib.Path(__file__).with_name('_cpu_ops.py')
+
+_SUFFIX = {
+  AddressingMode.Immediate: 'imm',
+  AddressingMode.ZeroPage: 'zp',
+  AddressingMode.ZeroPage_X: 'zp_x',
+  AddressingMode.ZeroPage_Y: 'zp_y',
+  AddressingMode.Absolute: 'abs',
+  AddressingMode.Absolute_X: 'abs_x',
+  AddressingMode.Absolute_Y: 'abs_y',
+  AddressingMode.Indirect_X: 'ind_x',
+  AddressingMode.Indirect_Y: 'ind_y',
+}
+
+_ADDRESS = {
+  AddressingMode.Immediate: ['addr = pc'],
+  AddressingMode.ZeroPage: ['addr = read(pc)'],
+  AddressingMode.ZeroPage_X: ['addr = (read(pc) + cpu.register_x) & 0xff'],
+  AddressingMode.ZeroPage_Y: ['addr = (read(pc) + cpu.register_y) & 0xff'],
+  AddressingMode.Absolute: ['addr = bus.mem_read_u16(pc)'],
+  AddressingMode.Absolute_X: ['addr = (bus.mem_read_u16(pc) + cpu.register_x) & 0xffff'],
+  AddressingMode.Absolute_Y: ['addr = (bus.mem_read_u16(pc) + cpu.register_y) & 0xffff'],
+  AddressingMode.Indirect_X: [
+    'ptr = (read(pc) + cpu.register_x) & 0xff',
+    'addr = read(ptr) | (read((ptr + 1) & 0xff) << 8)'],
+  AddressingMode.Indirect_Y: [
+    'ptr = read(pc)',
+    'addr = ((read(ptr) | (read((ptr + 1) & 0xff) << 8)) + cpu.register_y) & 0xffff'],
+}
+
+_REGISTER = {'A': 'cpu.register_a', 'X': 'cpu.register_x', 'Y': 'cpu.register_y',
+             'S': 'cpu.stack_pointer'}
+
+_BRANCH = {
+  'BPL': 'not st.bits & 0x80', 'BMI': 'st.bits & 0x80',
+  'BVC': 'not st.bits & 0x40', 'BVS': 'st.bits & 0x40',
+  'BCC': 'not st.bits & 0x01', 'BCS': 'st.bits & 0x01',
+  'BNE': 'not st.bits & 0x02', 'BEQ': 'st.bits & 0x02',
+}
+
+_FLAG = {'CLC': '& 0xfe', 'SEC': '| 0x01', 'CLI': '& 0xfb', 'SEI': '| 0x04',
+         'CLD': '& 0xf7', 'SED': '| 0x08', 'CLV': '& 0xbf'}
+
+_TRANSFER = {'TAX': 'XA', 'TAY': 'YA', 'TXA': 'AX', 'TYA': 'AY', 'TSX': 'XS',
+             'TXS': 'SX'}
+
+
+def _nz(value: str, keep: str = '0x7d', extra: str = '') -> str:
+  return f'st.bits = (st.bits & {keep}){extra} | ({value} & 0x80) | (0 if {value} else 2)'
+
+
+def _adc() -> 'Vec<str>':
+  return ['a = cpu.register_a',
+          's = a + v + (st.bits & 1)',
+          'r = s & 0xff',
+          _nz('r', '0x3c', ' | (s > 0xff) | (0x40 if (v ^ r) & (r ^ a) & 0x80 else 0)'),
+          'cpu.register_a = r']
+
+
+def _shift(mnemonic: str) -> 'Vec<str>':
+  # v in, v out, c = carry out
+  return {
+    'ASL': ['c = v >> 7', 'v = (v << 1) & 0xff'],
+    'LSR': ['c = v & 1', 'v = v >> 1'],
+    'ROL': ['c = v >> 7', 'v = ((v << 1) & 0xff) | (st.bits & 1)'],
+    'ROR': ['c = v & 1', 'v = (v >> 1) | ((st.bits & 1) << 7)'],
+  }[mnemonic]
+
+
+def _body(op) -> 'Vec<str>':
+  # statements after the opcode fetch; `addr` is set for memory operands
+  m = op.mnemonic
+  if m in ('LDA', 'LDX', 'LDY'):
+    return ['v = read(addr)', f'{_REGISTER[m[2]]} = v', _nz('v')]
+  if m in ('STA', 'STX', 'STY'):
+    return [f'bus.mem_write(addr, {_REGISTER[m[2]]})']
+  if m == 'ADC':
+    return ['v = read(addr)'] + _adc()
+  if m == 'SBC':
+    return ['v = read(addr) ^ 0xff'] + _adc()
+  if m in ('AND', 'EOR', 'ORA'):
+    operator = {'AND': '&', 'EOR': '^', 'ORA': '|'}[m]
+    return [f'v = cpu.register_a {operator} read(addr)', 'cpu.register_a = v', _nz('v')]
+  if m in ('CMP', 'CPX', 'CPY'):
+    register = _REGISTER['A' if m == 'CMP' else m[2]]
+    return ['v = read(addr)', f'reg = {register}', 'r = (reg - v) & 0xff',
+            _nz('r', '0x7c', ' | (v <= reg)')]
+  if m == 'BIT':
+    return ['v = read(addr)',
+            'st.bits = (st.bits & 0x3d) | (v & 0xc0) | (0 if cpu.register_a & v else 2)']
+  if m in ('ASL', 'LSR', 'ROL', 'ROR'):
+    if op.mode == AddressingMode.NoneAddressing:
+      return ['v = cpu.register_a'] + _shift(m) + \
+        ['cpu.register_a = v', _nz('v', '0x7c', ' | c')]
+    return ['v = read(addr)'] + _shift(m) + \
+      ['bus.mem_write(addr, v)', _nz('v', '0x7c', ' | c')]
+  if m in ('INC', 'DEC'):
+    delta = '+' if m == 'INC' else '-'
+    return [f'v = (read(addr) {delta} 1) & 0xff', 'bus.mem_write(addr, v)', _nz('v')]
+  if m in ('INX', 'INY', 'DEX', 'DEY'):
+    register = _REGISTER[m[2]]
+    delta = '+' if m[0] == 'I' else '-'
+    return [f'v = ({register} {delta} 1) & 0xff', f'{register} = v', _nz('v')]
+  if m in _TRANSFER:
+    to, source = _TRANSFER[m]
+    lines = [f'v = {_REGISTER[source]}', f'{_REGISTER[to]} = v']
+    return lines if m == 'TXS' else lines + [_nz('v')]
+  if m in _FLAG:
+    lines = [f'st.bits = st.bits {_FLAG[m]}']
+    return lines + ['cpu.irq_unmasked()'] if m == 'CLI' else lines
+  if m in _BRANCH:
+    return [f'if {_BRANCH[m]}:',
+            '  v = read(pc)',
+            '  cpu.program_counter = (pc + 1 + (v if v < 0x80 else v - 0x100)) & 0xffff',
+            'else:',
+            '  cpu.program_counter = (pc + 1) & 0xffff']
+  if m == 'JMP' and op.code == 0x4c:
+    return ['cpu.program_counter = bus.mem_read_u16(pc)']
+  if m == 'JMP':
+    # 6502 bug: the pointer does not carry into the high byte
+    return ['ptr = bus.mem_read_u16(pc)',
+            'if (ptr & 0xff) == 0xff:',
+            '  cpu.program_counter = read(ptr) | (read(ptr & 0xff00) << 8)',
+            'else:',
+            '  cpu.program_counter = bus.mem_read_u16(ptr)']
+  if m == 'JSR':
+    return ['cpu.stack_push_u16(pc + 1)', 'cpu.program_counter = bus.mem_read_u16(pc)']
+  if m == 'RTS':
+    return ['cpu.program_counter = cpu.stack_pop_u16() + 1']
+  if m == 'RTI':
+    return ['st.bits = (cpu.stack_pop() & 0xef) | 0x20',
+            'cpu.program_counter = cpu.stack_pop_u16()',
+            'cpu.irq_unmasked()']
+  if m == 'PHA':
+    return ['cpu.stack_push(cpu.register_a)']
+  if m == 'PLA':
+    return ['v = cpu.stack_pop()', 'cpu.register_a = v', _nz('v')]
+  if m == 'PHP':
+    return ['cpu.stack_push(st.bits | 0x30)']
+  if m == 'PLP':
+    return ['st.bits = (cpu.stack_pop() & 0xef) | 0x20', 'cpu.irq_unmasked()']
+  if m == 'BRK':
+    return ['return True']
+  if m == 'NOP':
+    return []
+  raise ValueError(f'no template for {m}')
+
+
+_ZERO_PAGE = (AddressingMode.ZeroPage, AddressingMode.ZeroPage_X,
+              AddressingMode.ZeroPage_Y)
+
+
+def _store(addr: str, value: str) -> 'Vec<str>':
+  # direct RAM write, or the bus when dirty tracking watches the block
+  return [f'if watched[({addr}) >> {DIRTY_BLOCK_SHIFT}]:',
+          f'  bus.mem_write({addr}, {value})',
+          'else:',
+          f'  ram[{addr}] = {value}']
+
+
+def _push(values: 'Vec<str>') -> 'Vec<str>':
+  lines = ['sp = cpu.stack_pointer']
+  for n, value in enumerate(values):
+    if n:
+      lines.append('sp = (sp - 1) & 0xff')
+    lines += _store('0x100 | sp', value)
+  return lines + ['cpu.stack_pointer = (sp - 1) & 0xff']
+
+
+def _pop(names: 'Vec<str>') -> 'Vec<str>':
+  lines = ['sp = cpu.stack_pointer']
+  for n, name in enumerate(names):
+    lines.append(f'{name} = ram[0x100 | ((sp + {n + 1}) & 0xff)]')
+  return lines + [f'cpu.stack_pointer = (sp + {len(names)}) & 0xff']
+
+
+def _ram_body(op) -> 'Vec<str>':
+  # _body() with zero page and stack accesses on bus.cpu_vram, or None
+  m = op.mnemonic
+  if m == 'PHA':
+    return _push(['cpu.register_a'])
+  if m == 'PHP':
+    return _push(['st.bits | 0x30'])
+  if m == 'PLA':
+    return _pop(['v']) + ['cpu.register_a = v', _nz('v')]
+  if m == 'PLP':
+    return _pop(['v']) + ['st.bits = (v & 0xef) | 0x20', 'cpu.irq_unmasked()']
+  if m == 'JSR':
+    return ['ret = pc + 1'] + _push(['ret >> 8', 'ret & 0xff']) + \
+      ['cpu.program_counter = bus.mem_read_u16(pc)']
+  if m == 'RTS':
+    return _pop(['lo', 'hi']) + ['cpu.program_counter = ((hi << 8) | lo) + 1']
+  if m == 'RTI':
+    return _pop(['v', 'lo', 'hi']) + ['st.bits = (v & 0xef) | 0x20',
+                                      'cpu.program_counter = (hi << 8) | lo',
+                                      'cpu.irq_unmasked()']
+  if op.mode in _ZERO_PAGE:
+    body = []
+    for line in _body(op):
+      if line.startswith('bus.mem_write(addr, '):
+        body += _store('addr', line[len('bus.mem_write(addr, '):-1])
+      else:
+        body.append(line.replace('read(addr)', 'ram[addr]'))
+    return body
+  if op.mode in (AddressingMode.Indirect_X, AddressingMode.Indirect_Y):
+    return _body(op)
+  return None
+
+
+def handler_name(op) -> str:
+  suffix = _SUFFIX.get(op.mode)
+  if suffix is None and op.mnemonic in ('ASL', 'LSR', 'ROL', 'ROR'):
+    suffix = 'acc'
+  elif op.code == 0x4c:
+    suffix = 'abs'
+  elif op.code == 0x6c:
+    suffix = 'ind'
+  name = op.mnemonic.lower()
+  return f'{name}_{suffix}' if suffix else name
+
+
+def _handler(op, ram: bool = False) -> 'Vec<str>':
+  body = _ram_body(op) if ram else _body(op)
+  if body is None:
+    return None
+  if op.mode in _ADDRESS and op.mnemonic not in ('JMP', 'JSR'):
+    address = _ADDRESS[op.mode]
+    if ram:
+      # zero page pointer fetches
+      address = [line.replace('read(ptr)', 'ram[ptr]')
+                 .replace('read((ptr + 1) & 0xff)', 'ram[(ptr + 1) & 0xff]')
+                 for line in address]
+    body = address + body
+  flow = op.mnemonic in _BRANCH or op.mnemonic in ('JMP', 'JSR', 'RTS', 'RTI', 'BRK')
+  if not flow and op.len > 1:
+    body.append(f'cpu.program_counter = pc + {op.len - 1}')
+  text = '\n'.join(body)
+  prelude = []
+  if 'bus.' in text or 'read(' in text or 'ram[' in text:
+    prelude.append('bus = cpu.bus')
+  if 'read(' in text:
+    prelude.append('read = bus.mem_read')
+  if 'ram[' in text:
+    prelude.append('ram = bus.cpu_vram')
+  if 'watched[' in text:
+    prelude.append('watched = bus.watched')
+  if re.search(r'\bpc\b', text):
+    prelude.append('pc = cpu.program_counter')
+  if 'st.' in text:
+    prelude.append('st = cpu.status')
+  name = handler_name(op) + ('_ram' if ram else '')
+  lines = [f'def {name}(cpu):  # ${op.code:02x}']
+  lines += ['  ' + line for line in prelude + body] or ['  pass']
+  return lines
+
+
+def cache_key() -> str:
+  table = repr([(op.code, op.mnemonic, op.len, op.cycles, op.mode)
+                for op in CPU_OPS_CODES])
+  source = pathlib.Path(__file__).read_bytes()
+  return hashlib.sha1(f'{VERSION}:{DIRTY_BLOCK_SHIFT}:{table}'.encode() + source).hexdigest()
+
+
+def generate() -> str:
+  lines = [f'# generated by codegen.py, do not edit\n# key: {cache_key()}',
+           'from diagnostics import report, Diag', '', '']
+  ram_table = {}
+  for op in CPU_OPS_CODES:
+    lines += _handler(op) + ['', '']
+    ram = _handler(op, ram=True)
+    if ram is not None:
+      lines += ram + ['', '']
+      ram_table[op.code] = handler_name(op) + '_ram'
+  lines += ['def unknown(cpu):',
+            '  code = cpu.mem_read(cpu.program_counter - 1)',
+            "  report(Diag.UNKNOWN_OPCODE, code, '${:02x} at ${:04x}', code, cpu.program_counter - 1)",
+            '', '']
+  table = {op.code: handler_name(op) for op in CPU_OPS_CODES}
+  lines.append('HANDLERS = (')
+  lines += [f'  {table.get(code, "unknown")},  # ${code:02x}' for code in range(256)]
+  lines.append(')')
+  lines += ['', 'RAM_HANDLERS = list(HANDLERS)']
+  lines += [f'RAM_HANDLERS[0x{code:02x}] = {name}' for code, name in sorted(ram_table.items())]
+  lines.append('RAM_HANDLERS = tuple(RAM_HANDLERS)')
+  return '\n'.join(lines) + '\n'
+
+
+def build(path: 'pathlib.Path' = MODULE_PATH) -> 'pathlib.Path':
+  # written aside and renamed, so a concurrent import never sees half a file
+  path = pathlib.Path(path)
+  tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+  try:
+    tmp.write_text(generate())
+    os.replace(tmp, path)
+  except OSError:
+    try:
+      tmp.unlink()
+    except OSError:
+      pass
+    raise
+  return path
+
+
+def _is_current(path: 'pathlib.Path') -> bool:
+  try:
+    with open(path) as f:
+      f.readline()
+      return f.readline().strip() == f'# key: {cache_key()}'
+  except OSError:
+    return False
+
+
+def load_handlers(path: 'pathlib.Path' = MODULE_PATH) -> tuple:
+  # -> (HANDLERS, RAM_HANDLERS)
+  if not _is_current(path):
+    try:
+      build(path)
+    except OSError:
+      # read-only install: the compiled module lives in the code cache
+      from cache import default_cache
+      code = default_cache().get_or_build(
+        'ops', cache_key(), lambda: compile(generate(), '<_cpu_ops>', 'exec'))
+      namespace = {}
+      exec(code, namespace)
+      return namespace['HANDLERS'], namespace['RAM_HANDLERS']
+  spec = importlib.util.spec_from_file_location('_cpu_ops', path)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module.HANDLERS, module.RAM_HANDLERS
+
+
+if __name__ == '__main__':
+  print(build())
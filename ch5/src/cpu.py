@@ -31,25 +31,28 @@ class CpuFlags(IntFlag):
 
 # fixme: XXX... CpuFlags
 class BitFlags:
+  # bits is a plain int (CpuFlags operands are converted), so the flag
+  # arithmetic in the generated handlers never goes through enum operators
   def __new__(cls):
     self = super().__new__(cls)
-    self.bits = CpuFlags.NULL
+    self.bits = 0
     return self
 
   @classmethod
   def from_bits_truncate(cls, byte: 'u8') -> 'BitFlags':
     obj = cls()
-    obj.bits |= byte
+    obj.bits = int(byte) & 0xff
     return obj
 
   def contains(self, byte: 'u8') -> bool:
+    byte = int(byte)
     return (self.bits & byte) == byte
 
   def insert(self, byte: 'u8'):
-    self.bits |= byte
+    self.bits = self.bits | int(byte)
 
   def remove(self, byte: 'u8'):
-    self.bits &= ~byte
+    self.bits = self.bits & ~int(byte) & 0xff
 
   def set(self, byte: 'u8', value: bool):
     if value:
@@ -61,27 +64,27 @@ class BitFlags:
     return copy.copy(self)
 
 
+from opcodes import AddressingMode, OP_LEN, OP_CYCLES, OP_MODE
 
 
-class _AddressingMode(NamedTuple):
-  Immediate: int = 1
-  ZeroPage: int = 2
-  ZeroPage_X: int = 3
-  ZeroPage_Y: int = 4
-  Absolute: int = 5
-  Absolute_X: int = 6
-  Absolute_Y: int = 7
-  Indirect_X: int = 8
-  Indirect_Y: int = 9
-  NoneAddressing: int = 10
+# opcodes that always set the program counter themselves
+JUMPS = (0x4c, 0x6c, 0x20, 0x60, 0x40,
+         0x10, 0x30, 0x50, 0x70, 0x90, 0xb0, 0xd0, 0xf0)
 
+STACK: 'u16' = 0x0100
+STACK_RESET: 'u8' = 0xfd
 
-AddressingMode = _AddressingMode()
-import opcodes
 
+class Interrupt(NamedTuple):
+  itype: str
+  vector_addr: 'u16'
+  b_flag_mask: 'u8'
+  cpu_cycles: 'u8'
+
+
+NMI = Interrupt('NMI', 0xFFFA, 0b0010_0000, 7)
+IRQ = Interrupt('IRQ', 0xFFFE, 0b0010_0000, 7)
 
-STACK: 'u16' = 0x0100
-STACK_RESET: 'u8' = 0xfd
 
 class Mem:
   def mem_read(self, addr: 'u16') -> 'u8':
@@ -103,7 +106,10 @@ class Mem:
     self.mem_write(pos, lo)
     self.mem_write(pos + 1, hi)
 
-from bus import Bus
+from diagnostics import report, Diag
+from codegen import load_handlers
+
+HANDLERS, RAM_HANDLERS = load_handlers()
 
 class CPU(Mem):
   def __init__(self, bus: '_Bus'):
@@ -114,6 +120,9 @@ class CPU(Mem):
     self.program_counter: 'u16' = 0
     self.status = BitFlags.from_bits_truncate(0b0010_0100)
     self.bus = bus
+    bus.cpu = self
+    self.handlers = RAM_HANDLERS
+    self.ram_fast_path_disabled: 'usize' = 0  # holders of HANDLERS
     #self.memory = [0] * 0xFFFF
   
   def mem_read(self, addr: 'u16') -> 'u8':
@@ -164,7 +173,7 @@ class CPU(Mem):
       base = self.mem_read(self.program_counter)
       ptr = (base + self.register_x) & 0xff
       lo = self.mem_read(ptr)
-      hi = self.mem_read((ptr + 1) & 0xffff)
+      hi = self.mem_read((ptr + 1) & 0xff)
       return (hi) << 8 | (lo)
     # --- 9 -> Indirect_Y
     elif mode == 9:
@@ -176,7 +185,7 @@ class CPU(Mem):
       return deref
     # --- 10 -> NoneAddressing
     elif mode == 10:
-      print(f'mode {mode} is not supported')
+      report(Diag.UNSUPPORTED_MODE, mode, 'mode {} is not supported', mode)
 
   def ldy(self, mode: '&AddressingMode'):
     addr = self.get_operand_address(mode)
@@ -309,7 +318,7 @@ class CPU(Mem):
       self.set_carry_flag()
     else:
       self.clear_carry_flag()
-    data = data << 1
+    data = (data << 1) & 0xff
     self.set_register_a(data)
 
   def asl(self, mode: '&AddressingMode') -> 'u8':
@@ -319,7 +328,7 @@ class CPU(Mem):
       self.set_carry_flag()
     else:
       self.clear_carry_flag()
-    data = data << 1
+    data = (data << 1) & 0xff
     self.mem_write(addr, data)
     self.update_zero_and_negative_flags(data)
     return data
@@ -353,11 +362,11 @@ class CPU(Mem):
       self.set_carry_flag()
     else:
       self.clear_carry_flag()
-    data = data << 1
+    data = (data << 1) & 0xff
     if old_carry:
       data = data | 1
     self.mem_write(addr, data)
-    self.update_negative_flags(data)
+    self.update_zero_and_negative_flags(data)
     return data
 
   def rol_accumulator(self):
@@ -367,7 +376,7 @@ class CPU(Mem):
       self.set_carry_flag()
     else:
       self.clear_carry_flag()
-    data = data << 1
+    data = (data << 1) & 0xff
     if old_carry:
       data = data | 1
     self.set_register_a(data)
@@ -376,7 +385,7 @@ class CPU(Mem):
     addr = self.get_operand_address(mode)
     data = self.mem_read(addr)
     old_carry = self.status.contains(CpuFlags.CARRY)
-    if (data & 7) == 1:
+    if (data & 1) == 1:
       self.set_carry_flag()
     else:
       self.clear_carry_flag()
@@ -384,7 +393,7 @@ class CPU(Mem):
     if old_carry:
       data = data | 0b1000_0000
     self.mem_write(addr, data)
-    self.update_negative_flags(data)
+    self.update_zero_and_negative_flags(data)
     return data
 
   def ror_accumulator(self):
@@ -465,14 +474,40 @@ class CPU(Mem):
       jump = mem if mem < 0x80 else mem - 0x100
       self.program_counter = (self.program_counter + 1) & 0xffff
       self.program_counter = (self.program_counter + jump) & 0xffff
+    else:
+      self.program_counter = (self.program_counter + 1) & 0xffff
       
+  def interrupt(self, interrupt: 'Interrupt'):
+    self.stack_push_u16(self.program_counter)
+    flag = self.status.clone()
+    flag.set(CpuFlags.BREAK, interrupt.b_flag_mask & 0b0001_0000 != 0)
+    flag.set(CpuFlags.BREAK2, interrupt.b_flag_mask & 0b0010_0000 != 0)
+    self.stack_push(flag.bits)
+    self.status.insert(CpuFlags.INTERRUPT_DISABLE)
+    self.program_counter = self.mem_read_u16(interrupt.vector_addr)
+    # an NMI that becomes due during the 7 entry cycles is taken right away
+    if self.bus.tick(interrupt.cpu_cycles):
+      self.poll_interrupts()
+
+  def poll_interrupts(self):
+    # only called when the scheduler dispatched something, never per step
+    if self.bus.poll_nmi_status():
+      self.interrupt(NMI)
+    elif self.bus.irq_sources and not self.status.contains(
+        CpuFlags.INTERRUPT_DISABLE):
+      self.interrupt(IRQ)
+
+  def irq_unmasked(self):
+    if self.bus.irq_sources:
+      self.bus.request_interrupt_poll()
+
   def load_and_run(self, program: 'Vec<u8>'):
     self.load(program)
     self.reset()
     self.run()
 
   def load(self, program: 'Vec<u8>'):
-    [self.mem_write(0x8600 + n, i) for n, i in enumerate(program)]
+    self.bus.write_block(0x8600, program)
     self.mem_write_u16(0xFFFC, 0x8600)
 
   def reset(self):
@@ -486,15 +521,42 @@ class CPU(Mem):
   def run(self):
     self.run_with_callback()
 
+  def run_until(self, cycle: 'usize'):
+    # run uninterrupted; devices and interrupts are driven by bus.scheduler
+    bus = self.bus
+    while bus.cycles < cycle:
+      if self.run_with_callback():
+        break
+
+  def disable_ram_fast_path(self):
+    # counted: off while the debugger or bus stats need every access on
+    # the bus, back on when the last of them lets go
+    self.ram_fast_path_disabled += 1
+    self.handlers = HANDLERS
+
+  def enable_ram_fast_path(self):
+    self.ram_fast_path_disabled -= 1
+    if not self.ram_fast_path_disabled:
+      self.handlers = RAM_HANDLERS
+
   def run_with_callback(self):
-    _opcodes = opcodes.OPCODES_MAP
+    # one instruction through the generated handlers (see codegen.py)
+    code = self.mem_read(self.program_counter)
+    self.program_counter += 1
+    if self.handlers[code](self):
+      return True
+    if self.bus.tick(OP_CYCLES[code]):
+      self.poll_interrupts()
+
+  def step_reference(self):
+    # reference interpreter, kept in sync with the generated handlers
     code = self.mem_read(self.program_counter)
     self.program_counter += 1
     program_counter_state = self.program_counter
-    opcode = _opcodes.get(code)
+    mode = OP_MODE[code]
     # --- match
     if code in (0xa9, 0xa5, 0xb5, 0xad, 0xbd, 0xb9, 0xa1, 0xb1):  # 169, 165, 181, 173, 189, 185, 161, 177
-      self.lda(opcode.mode)
+      self.lda(mode)
     
     elif code == 0xAA:  # 170
       self.tax()
@@ -503,7 +565,7 @@ class CPU(Mem):
       self.inx()
     
     elif code == 0x00:  # 0
-      return 
+      return True
     
     # --- CLD
     elif code == 0xd8:  # 216
@@ -512,6 +574,7 @@ class CPU(Mem):
     # --- CLI
     elif code == 0x58:  # 88
       self.status.remove(CpuFlags.INTERRUPT_DISABLE)
+      self.irq_unmasked()
     
     # --- CLV
     elif code == 0xb8:  # 184
@@ -548,26 +611,27 @@ class CPU(Mem):
     # --- PLP
     elif code == 0x28:  # 40
       self.plp()
+      self.irq_unmasked()
 
     # --- ADC
-    elif code in (0x69, 0x65, 0x75, 0x6d, 0x7d, 0x79, 0x61):  # 105, 101, 117, 109, 125, 121, 97
-      self.adc(opcode.mode)
+    elif code in (0x69, 0x65, 0x75, 0x6d, 0x7d, 0x79, 0x61, 0x71):  # 105, 101, 117, 109, 125, 121, 97, 113
+      self.adc(mode)
 
     # --- SBC
     elif code in (0xe9, 0xe5, 0xf5, 0xed, 0xfd, 0xf9, 0xe1, 0xf1):  # 233, 229, 245, 237, 253, 249, 225, 241
-      self.sbc(opcode.mode)
+      self.sbc(mode)
 
     # --- AND
     elif code in (0x29, 0x25, 0x35, 0x2d, 0x3d, 0x39, 0x21, 0x31):  # 41, 37, 53, 45, 61, 57, 33, 49
-      self._and(opcode.mode)
+      self._and(mode)
 
     # --- EOR
     elif code in (0x49, 0x45, 0x55, 0x4d, 0x5d, 0x59, 0x41, 0x51):  # 73, 69, 85, 77, 93, 89, 65, 81
-      self.eor(opcode.mode)
+      self.eor(mode)
 
     # --- ORA
     elif code in (0x09, 0x05, 0x15, 0x0d, 0x1d, 0x19, 0x01, 0x11):  # 9, 5, 21, 13, 29, 25, 1, 17
-      self.ora(opcode.mode)
+      self.ora(mode)
 
     # --- LSR
     elif code == 0x4a:  # 74
@@ -575,7 +639,7 @@ class CPU(Mem):
 
     # --- LSR
     elif code in (0x46, 0x56, 0x4e, 0x5e):  # 70, 86, 78, 94
-      self.lsr(opcode.mode)
+      self.lsr(mode)
 
     # --- ASL
     elif code == 0x0a:  # 10
@@ -583,7 +647,7 @@ class CPU(Mem):
 
     # --- ASL
     elif code in (0x06, 0x16, 0x0e, 0x1e):  # 6, 22, 14, 30
-      self.asl(opcode.mode)
+      self.asl(mode)
 
     # --- ROL
     elif code == 0x2a:  # 42
@@ -591,7 +655,7 @@ class CPU(Mem):
 
     # --- ROL
     elif code in (0x26, 0x36, 0x2e, 0x3e):  # 38, 54, 46, 62
-      self.rol(opcode.mode)
+      self.rol(mode)
 
     # --- ROR
     elif code == 0x6a:  # 106
@@ -599,11 +663,11 @@ class CPU(Mem):
 
     # --- ROR
     elif code in (0x66, 0x76, 0x6e, 0x7e):  # 102, 118, 110, 126
-      self.ror(opcode.mode)
+      self.ror(mode)
 
     # --- INC
     elif code in (0xe6, 0xf6, 0xee, 0xfe):  # 230, 246, 238, 254
-      self.inc(opcode.mode)
+      self.inc(mode)
 
     # --- INY
     elif code == 0xc8:  # 200
@@ -611,7 +675,7 @@ class CPU(Mem):
 
     # --- DEC
     elif code in (0xc6, 0xd6, 0xce, 0xde):  # 198, 214, 206, 222
-      self.dec(opcode.mode)
+      self.dec(mode)
 
     # --- DEX
     elif code == 0xca:  # 202
@@ -623,15 +687,15 @@ class CPU(Mem):
 
     # --- CMP
     elif code in (0xc9, 0xc5, 0xd5, 0xcd, 0xdd, 0xd9, 0xc1, 0xd1):  # 201, 197, 213, 205, 221, 217, 193, 209
-      self.compare(opcode.mode, self.register_a)
+      self.compare(mode, self.register_a)
 
     # --- CPY
     elif code in (0xc0, 0xc4, 0xcc):  # 192, 196, 204
-      self.compare(opcode.mode, self.register_y)
+      self.compare(mode, self.register_y)
 
     # --- CPX
     elif code in (0xe0, 0xe4, 0xec):  # 224, 228, 236
-      self.compare(opcode.mode, self.register_x)
+      self.compare(mode, self.register_x)
 
     # --- JMP Absolute
     elif code == 0x4c:  # 76
@@ -670,6 +734,7 @@ class CPU(Mem):
       self.status.remove(CpuFlags.BREAK)
       self.status.insert(CpuFlags.BREAK2)
       self.program_counter = self.stack_pop_u16()
+      self.irq_unmasked()
 
     # --- BNE
     elif code == 0xd0:  # 208
@@ -704,29 +769,29 @@ class CPU(Mem):
 
     # --- BIT
     elif code in (0x24, 0x2c):  # 36, 44
-      self.bit(opcode.mode)
+      self.bit(mode)
 
     # --- STA
     elif code in (0x85, 0x95, 0x8d, 0x9d, 0x99, 0x81, 0x91):  # 133, 149, 141, 157, 153, 129, 145
-      self.sta(opcode.mode)
+      self.sta(mode)
 
     # --- STX
     elif code in (0x86, 0x96, 0x8e):  # 134, 150, 142
-      addr = self.get_operand_address(opcode.mode)
+      addr = self.get_operand_address(mode)
       self.mem_write(addr, self.register_x)
 
     # --- STY
     elif code in (0x84, 0x94, 0x8c):  # 132, 148, 140
-      addr = self.get_operand_address(opcode.mode)
+      addr = self.get_operand_address(mode)
       self.mem_write(addr, self.register_y)
 
     # --- LDX
     elif code in (0xa2, 0xa6, 0xb6, 0xae, 0xbe):  # 162, 166, 182, 174, 190
-      self.ldx(opcode.mode)
+      self.ldx(mode)
 
     # --- LDY
     elif code in (0xa0, 0xa4, 0xb4, 0xac, 0xbc):  # 160, 164, 180, 172, 188
-      self.ldy(opcode.mode)
+      self.ldy(mode)
 
     # --- NOP
     elif code == 0xea:  #234
@@ -758,11 +823,13 @@ class CPU(Mem):
       self.update_zero_and_negative_flags(self.register_a)
 
     else:
-      print('todo')
+      report(Diag.UNKNOWN_OPCODE, code, '${:02x} at ${:04x}', code, self.program_counter - 1)
       #break
 
-    if program_counter_state == self.program_counter:
-      self.program_counter += (opcode.len - 1)
-    
+    if program_counter_state == self.program_counter and code not in JUMPS:
+      self.program_counter += (OP_LEN[code] - 1)
+
+    if self.bus.tick(OP_CYCLES[code]):
+      self.poll_interrupts()
     return
 
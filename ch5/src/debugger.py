@@ -0,0 +1,209 @@
+from bisect import bisect_right
+from functools import partial
+from typing import NamedTuple
+
+from cpu import CPU, Mem
+from bus import Bus
+
+#  Breakpoints cost nothing while none are set: the debugger shadows
+#  cpu.run_with_callback (and bus.mem_read / bus.mem_write for watchpoints)
+#  with instance attributes only while it has something to check, and
+#  deletes them again when the last one is removed. Neither CPU nor Bus
+#  knows about the debugger. Watchpoints also turn off the CPU's direct
+#  zero page / stack access and the bus's fused 16-bit accesses so those
+#  bytes are seen.
+#
+#  A hit stops the step loop the same way BRK does: the instrumented
+#  run_with_callback returns True. PC breakpoints stop before the
+#  instruction executes, watchpoints after the instruction that touched
+#  the address has finished.
+
+
+class _HitKind(NamedTuple):
+  BREAK: str = 'break'
+  READ: str = 'read'
+  WRITE: str = 'write'
+
+
+HitKind = _HitKind()
+
+
+class Hit(NamedTuple):
+  kind: str
+  pc: 'u16'
+  addr: 'u16'
+  value: 'u8'
+
+
+class Watchpoint(NamedTuple):
+  start: 'u16'
+  end: 'u16'  # inclusive
+  read: bool
+  write: bool
+  condition: object  # (cpu, addr, value) -> bool, or None
+
+
+def _mirror_down(addr: 'u16') -> 'u16':
+  # RAM and PPU registers are matched on their canonical address
+  if addr < 0x2000:
+    return addr & 0x07ff
+  if addr < 0x4000:
+    return addr & 0x2007
+  return addr
+
+
+class IntervalIndex:
+  #  Overlapping [start, end] ranges merged into sorted disjoint spans, so a
+  #  miss is one bisect. Only a covered address scans the entries.
+  def __init__(self):
+    self.entries = []
+    self.starts = []
+    self.ends = []
+
+  def add(self, entry: 'Watchpoint'):
+    self.entries.append(entry)
+    self.rebuild()
+
+  def remove(self, entry: 'Watchpoint'):
+    self.entries.remove(entry)
+    self.rebuild()
+
+  def rebuild(self):
+    spans = []
+    for entry in sorted(self.entries, key=lambda e: (e.start, e.end)):
+      if spans and entry.start <= spans[-1][1] + 1:
+        spans[-1][1] = max(spans[-1][1], entry.end)
+      else:
+        spans.append([entry.start, entry.end])
+    self.starts = [start for start, _ in spans]
+    self.ends = [end for _, end in spans]
+
+  def covers(self, addr: 'u16') -> bool:
+    i = bisect_right(self.starts, addr) - 1
+    return i >= 0 and addr <= self.ends[i]
+
+  def find(self, addr: 'u16') -> 'Vec<Watchpoint>':
+    if not self.covers(addr):
+      return []
+    return [e for e in self.entries if e.start <= addr <= e.end]
+
+  def __len__(self) -> int:
+    return len(self.entries)
+
+
+class Debugger:
+  def __init__(self, cpu: 'CPU', on_hit=None):
+    self.cpu = cpu
+    self.bus = cpu.bus
+    self.breakpoints = {}  # pc -> condition(cpu) or None
+    self.reads = IntervalIndex()
+    self.writes = IntervalIndex()
+    self.on_hit = on_hit
+    self.hits = []
+    self.pending = None
+    self.resume_pc = None
+    self.step_pc = 0
+    self.holds_ram_fast_path = False
+
+  # --- breakpoints
+  def add_breakpoint(self, pc: 'u16', condition=None):
+    self.breakpoints[pc] = condition
+    self.install()
+
+  def remove_breakpoint(self, pc: 'u16'):
+    self.breakpoints.pop(pc, None)
+    self.install()
+
+  def add_watchpoint(self, start: 'u16', end: 'u16' = None, read: bool = False,
+                     write: bool = True, condition=None) -> 'Watchpoint':
+    start = _mirror_down(start)
+    end = start if end is None else _mirror_down(end)
+    watch = Watchpoint(start, end, read, write, condition)
+    if read:
+      self.reads.add(watch)
+    if write:
+      self.writes.add(watch)
+    self.install()
+    return watch
+
+  def remove_watchpoint(self, watch: 'Watchpoint'):
+    if watch.read:
+      self.reads.remove(watch)
+    if watch.write:
+      self.writes.remove(watch)
+    self.install()
+
+  def clear(self):
+    self.breakpoints.clear()
+    self.reads = IntervalIndex()
+    self.writes = IntervalIndex()
+    self.install()
+
+  @property
+  def active(self) -> bool:
+    return bool(self.breakpoints or self.reads or self.writes)
+
+  # --- instrumentation
+  def install(self):
+    cpu, bus = self.cpu, self.bus
+    self._swap(cpu, 'run_with_callback', self.step, self.active)
+    self._swap(bus, 'mem_read', self.mem_read, bool(self.reads))
+    self._swap(bus, 'mem_write', self.mem_write, bool(self.writes))
+    self._swap(bus, 'mem_read_u16', partial(Mem.mem_read_u16, bus), bool(self.reads))
+    self._swap(bus, 'mem_write_u16', partial(Mem.mem_write_u16, bus), bool(self.writes))
+    watching = bool(self.reads or self.writes)
+    if watching != self.holds_ram_fast_path:
+      if watching:
+        cpu.disable_ram_fast_path()
+      else:
+        cpu.enable_ram_fast_path()
+      self.holds_ram_fast_path = watching
+
+  @staticmethod
+  def _swap(obj, name: str, hook, enable: bool):
+    if enable:
+      setattr(obj, name, hook)
+    elif name in vars(obj):
+      delattr(obj, name)
+
+  def step(self) -> bool:
+    cpu = self.cpu
+    pc = cpu.program_counter
+    if pc in self.breakpoints and pc != self.resume_pc:
+      condition = self.breakpoints[pc]
+      if condition is None or condition(cpu):
+        self.resume_pc = pc
+        return self.hit(Hit(HitKind.BREAK, pc, pc, 0))
+    self.resume_pc = None
+    self.pending = None
+    self.step_pc = pc
+    halted = CPU.run_with_callback(cpu)
+    if self.pending is not None:
+      hit, self.pending = self.pending, None
+      return self.hit(hit) or halted
+    return halted
+
+  def mem_read(self, addr: 'u16') -> 'u8':
+    data = Bus.mem_read(self.bus, addr)
+    self.check(self.reads, HitKind.READ, addr, data)
+    return data
+
+  def mem_write(self, addr: 'u16', data: 'u8'):
+    Bus.mem_write(self.bus, addr, data)
+    self.check(self.writes, HitKind.WRITE, addr, data)
+
+  def check(self, index: 'IntervalIndex', kind: str, addr: 'u16', data: 'u8'):
+    # note: reads include opcode and operand fetches
+    addr = _mirror_down(addr)
+    if self.pending is not None or not index.covers(addr):
+      return
+    for watch in index.find(addr):
+      if watch.condition is None or watch.condition(self.cpu, addr, data):
+        self.pending = Hit(kind, self.step_pc, addr, data)
+        return
+
+  def hit(self, hit: 'Hit') -> bool:
+    self.hits.append(hit)
+    if self.on_hit is not None:
+      return self.on_hit(hit) is not False
+    return True
@@ -0,0 +1,73 @@
+import atexit
+import logging
+import time
+from collections import Counter
+from typing import NamedTuple
+
+logger = logging.getLogger('nes')
+
+
+class _Diag(NamedTuple):
+  UNMAPPED_READ: str = 'unmapped read'
+  UNMAPPED_WRITE: str = 'unmapped write'
+  ROM_WRITE: str = 'write to cartridge ROM'
+  PPU_WRITE_ONLY_READ: str = 'read from write-only PPU register'
+  PPU_READ_ONLY_WRITE: str = 'write to read-only PPU register'
+  PPU_BAD_ADDR: str = 'PPU access to unused $3000-$3EFF'
+  CHR_WRITE: str = 'write to CHR ROM'
+  UNKNOWN_OPCODE: str = 'unknown opcode'
+  UNSUPPORTED_MODE: str = 'unsupported addressing mode'
+
+
+Diag = _Diag()
+
+
+class Diagnostics:
+  #  Counts every event; logs only the first occurrence of each (kind, key)
+  #  and at most `burst` lines per kind within `interval` seconds.
+  def __init__(self, burst: int = 5, interval: float = 1.0, max_keys: int = 4096):
+    self.counts: 'Counter' = Counter()
+    self.seen: set = set()
+    self.burst = burst
+    self.interval = interval
+    self.max_keys = max_keys
+    self.window: dict = {}  # kind -> (window start, lines logged)
+    self.suppressed: 'Counter' = Counter()
+
+  def report(self, kind: str, key, fmt: str = '', *args):
+    self.counts[kind] += 1
+    if (kind, key) in self.seen or len(self.seen) >= self.max_keys:
+      return
+    self.seen.add((kind, key))
+    now = time.monotonic()
+    start, lines = self.window.get(kind, (now, 0))
+    if now - start >= self.interval:
+      start, lines = now, 0
+    if lines >= self.burst:
+      self.suppressed[kind] += 1
+      self.window[kind] = (start, lines)
+      return
+    self.window[kind] = (start, lines + 1)
+    if logger.isEnabledFor(logging.DEBUG):
+      logger.debug('%s: %s', kind, fmt.format(*args))
+
+  def summary(self) -> str:
+    lines = [f'{count:>10}  {kind}' for kind, count in self.counts.most_common()]
+    if self.suppressed:
+      lines.append(f'{sum(self.suppressed.values()):>10}  log lines suppressed')
+    return '\n'.join(lines)
+
+  def reset(self):
+    self.counts.clear()
+    self.seen.clear()
+    self.window.clear()
+    self.suppressed.clear()
+
+  def log_summary(self):
+    if self.counts:
+      logger.warning('emulator diagnostics:\n%s', self.summary())
+
+
+diagnostics = Diagnostics()
+report = diagnostics.report
+atexit.register(diagnostics.log_summary)
@@ -0,0 +1,231 @@
+import random
+from multiprocessing import Pool
+from typing import NamedTuple
+
+from cpu import CPU, Mem, BitFlags
+from opcodes import CPU_OPS_CODES
+
+#  Differential testing of CPU engines against the reference interpreter.
+#  A case is a random program plus random registers and RAM ($0000-$07FF)
+#  contents on a flat 64 KiB bus (no PPU, no mirrors, no interrupts). Both
+#  engines step in lockstep and the full machine state is compared after
+#  every instruction. A failing case is shrunk greedily (drop
+#  instructions, clear memory, zero registers) while it still fails.
+#    python difftest.py --cases 1000000 --engine handlers
+
+
+class FlatBus(Mem):
+  def __init__(self, memory: bytes = bytes(0x10000)):
+    self.memory = bytearray(memory)
+    self.cycles: 'usize' = 0
+    self.irq_sources = set()
+    # for the CPU's direct zero page / stack access
+    self.cpu_vram = self.memory
+    self.watched = bytes(64)
+
+  def mem_read(self, addr: 'u16') -> 'u8':
+    return self.memory[addr & 0xffff]
+
+  def mem_write(self, addr: 'u16', data: 'u8'):
+    self.memory[addr & 0xffff] = data
+
+  def mem_read_u16(self, pos: 'u16') -> 'u16':
+    return self.memory[pos & 0xffff] | (self.memory[(pos + 1) & 0xffff] << 8)
+
+  def write_block(self, addr: 'u16', data: 'Vec<u8>'):
+    for offset, value in enumerate(data):
+      self.memory[(addr + offset) & 0xffff] = value
+
+  def tick(self, cycles: 'u8') -> bool:
+    self.cycles += cycles
+    return False
+
+  def poll_nmi_status(self) -> bool:
+    return False
+
+  def request_interrupt_poll(self):
+    pass
+
+
+def bus_handlers(cpu: 'CPU'):
+  # generated handlers without the direct RAM fast path
+  if not cpu.ram_fast_path_disabled:
+    cpu.disable_ram_fast_path()
+  return CPU.run_with_callback(cpu)
+
+
+ENGINES = {
+  'reference': CPU.step_reference,
+  'handlers': CPU.run_with_callback,
+  'bus_handlers': bus_handlers,
+}
+
+
+class Case(NamedTuple):
+  seed: int
+  registers: tuple  # a, x, y, sp, status
+  origin: 'u16'
+  program: tuple  # tuple of instructions, each a bytes
+  memory: tuple  # ((addr, value), ...) outside the program
+
+  def image(self) -> bytes:
+    memory = bytearray(0x10000)
+    for addr, value in self.memory:
+      memory[addr] = value
+    addr = self.origin
+    for instruction in self.program:
+      for value in instruction:
+        memory[addr & 0xffff] = value
+        addr += 1
+    return bytes(memory)
+
+
+class Divergence(NamedTuple):
+  case: 'Case'
+  step: int
+  reference: tuple
+  candidate: tuple
+
+
+def random_case(seed: int, length: int = 16) -> 'Case':
+  rng = random.Random(seed)
+  program = []
+  for _ in range(length):
+    op = rng.choice(CPU_OPS_CODES)
+    operand = [rng.randrange(256) for _ in range(op.len - 1)]
+    if op.len == 3 and rng.random() < 0.5:
+      operand[1] &= 0x07  # absolute operands into the randomized RAM
+    program.append(bytes([op.code] + operand))
+  # zero page and stack hold pointers and pulls, the rest absolute data
+  memory = tuple((addr, rng.randrange(256)) for addr in range(0x0800)
+                 if rng.random() < 0.5)
+  registers = tuple(rng.randrange(256) for _ in range(5))
+  return Case(seed, registers, rng.randrange(0x0200, 0xff00), tuple(program), memory)
+
+
+def machine(case: 'Case') -> 'CPU':
+  cpu = CPU(FlatBus(case.image()))
+  a, x, y, sp, status = case.registers
+  cpu.register_a, cpu.register_x, cpu.register_y = a, x, y
+  cpu.stack_pointer = sp
+  cpu.status = BitFlags.from_bits_truncate(status)
+  cpu.program_counter = case.origin
+  return cpu
+
+
+def state(cpu: 'CPU') -> tuple:
+  return (cpu.register_a, cpu.register_x, cpu.register_y, cpu.stack_pointer,
+          int(cpu.status.bits), cpu.program_counter, cpu.bus.cycles,
+          bytes(cpu.bus.memory))
+
+
+def run_case(case: 'Case', candidate: str = 'handlers', reference: str = 'reference',
+             steps: int = None):
+  # -> Divergence or None
+  reference_step, candidate_step = ENGINES[reference], ENGINES[candidate]
+  expected, actual = machine(case), machine(case)
+  for step in range(steps or 4 * len(case.program)):
+    try:
+      halted = reference_step(expected)
+    except Exception as e:
+      halted = e
+    try:
+      candidate_halted = candidate_step(actual)
+    except Exception as e:
+      candidate_halted = e
+    left, right = state(expected), state(actual)
+    if left != right or repr(halted) != repr(candidate_halted):
+      return Divergence(case, step, left + (repr(halted),), right + (repr(candidate_halted),))
+    if halted:
+      return None
+  return None
+
+
+def shrink(case: 'Case', fails) -> 'Case':
+  # greedy: keep every simplification that still fails
+  progress = True
+  while progress:
+    progress = False
+    for i in reversed(range(len(case.program))):
+      smaller = case._replace(program=case.program[:i] + case.program[i + 1:])
+      if smaller.program and fails(smaller):
+        case, progress = smaller, True
+    chunk = len(case.memory)
+    while chunk:
+      for start in range(0, len(case.memory), chunk):
+        smaller = case._replace(memory=case.memory[:start] + case.memory[start + chunk:])
+        if fails(smaller):
+          case, progress = smaller, True
+          break
+      else:
+        chunk //= 2
+    for i, value in enumerate(case.registers):
+      if value:
+        registers = case.registers[:i] + (0,) + case.registers[i + 1:]
+        smaller = case._replace(registers=registers)
+        if fails(smaller):
+          case, progress = smaller, True
+  return case
+
+
+def check_seed(args: tuple):
+  seed, length, candidate = args
+  failure = run_case(random_case(seed, length), candidate)
+  if failure is None:
+    return None
+  minimal = shrink(failure.case, lambda c: run_case(c, candidate) is not None)
+  return run_case(minimal, candidate)
+
+
+def run_many(cases: int, seed: int = 0, length: int = 16, candidate: str = 'handlers',
+             processes: int = None, limit: int = 10) -> 'Vec<Divergence>':
+  jobs = ((seed + n, length, candidate) for n in range(cases))
+  failures = []
+  if processes == 1:
+    results = map(check_seed, jobs)
+    return [f for f in results if f is not None][:limit]
+  with Pool(processes) as pool:
+    for failure in pool.imap_unordered(check_seed, jobs, chunksize=256):
+      if failure is not None:
+        failures.append(failure)
+        if len(failures) >= limit:
+          pool.terminate()
+          break
+  return failures
+
+
+def describe(failure: 'Divergence') -> str:
+  names = ('A', 'X', 'Y', 'SP', 'P', 'PC', 'cycles', 'memory', 'halted')
+  case = failure.case
+  lines = [f'seed {case.seed}: diverged at step {failure.step}',
+           f'  origin ${case.origin:04x}  registers {case.registers}',
+           '  program ' + ' '.join(i.hex() for i in case.program),
+           f'  memory {case.memory}']
+  for name, left, right in zip(names, failure.reference, failure.candidate):
+    if left != right:
+      if name == 'memory':
+        diff = [n for n in range(0x10000) if left[n] != right[n]]
+        lines.append(f'  memory differs at {", ".join(f"${n:04x}" for n in diff[:8])}')
+      else:
+        lines.append(f'  {name}: reference {left!r} candidate {right!r}')
+  return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+  import argparse
+  import time
+
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--cases', type=int, default=100_000)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--length', type=int, default=16)
+  parser.add_argument('--engine', default='handlers', choices=sorted(ENGINES))
+  parser.add_argument('--processes', type=int, default=None)
+  options = parser.parse_args()
+  start = time.perf_counter()
+  failures = run_many(options.cases, options.seed, options.length, options.engine,
+                      options.processes)
+  for failure in failures:
+    print(describe(failure))
+  print(f'{options.cases} cases, {len(failures)} failures, '
+        f'{time.perf_counter() - start:.1f}s')
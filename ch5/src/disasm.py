@@ -0,0 +1,258 @@
+import hashlib
+import pathlib
+from typing import NamedTuple
+
+from opcodes import AddressingMode, OP_LEN, OP_MODE, OP_MNEMONIC
+
+#  Static analysis of PRG-ROM built on the opcodes tables.
+#  Instructions are decoded lazily from a memoryview of the ROM; code is
+#  found by following the reset/NMI/IRQ vectors and every branch, JSR and
+#  JMP target. Results are cached per ROM hash, in memory and optionally
+#  on disk through cache.CodeCache. Disk entries are also keyed on the
+#  analyzer (VERSION, the opcode tables and this file), so changing it
+#  never loads a stale code map.
+
+VERSION = 1
+
+NMI_VECTOR: 'u16' = 0xFFFA
+RESET_VECTOR: 'u16' = 0xFFFC
+IRQ_VECTOR: 'u16' = 0xFFFE
+
+BRANCHES = ('BNE', 'BEQ', 'BCS', 'BCC', 'BMI', 'BPL', 'BVS', 'BVC')
+TERMINATORS = ('RTS', 'RTI', 'BRK')
+
+# code/data map flags, one byte per PRG-ROM byte (0 = data / unknown)
+OPCODE: 'u8' = 0b0001
+OPERAND: 'u8' = 0b0010
+JUMP_TARGET: 'u8' = 0b0100
+ENTRY: 'u8' = 0b1000
+
+
+class Instruction(NamedTuple):
+  addr: 'u16'
+  code: 'u8'
+  mnemonic: str
+  len: 'u8'
+  mode: 'AddressingMode'
+  operand: 'u16'
+
+  def targets(self) -> 'Vec<u16>':
+    # static successors inside the address space, fall-through first
+    after = (self.addr + self.len) & 0xffff
+    if self.mnemonic in BRANCHES:
+      jump = self.operand if self.operand < 0x80 else self.operand - 0x100
+      return [after, (after + jump) & 0xffff]
+    elif self.code == 0x4c:  # JMP Absolute
+      return [self.operand]
+    elif self.code == 0x20:  # JSR
+      return [after, self.operand]
+    elif self.code == 0x6c or self.mnemonic in TERMINATORS:
+      return []
+    return [after]
+
+  def text(self) -> str:
+    mode = self.mode
+    op = self.operand
+    if self.mnemonic in BRANCHES:
+      arg = f'${self.targets()[1]:04x}'
+    elif self.code == 0x6c:
+      arg = f'(${op:04x})'
+    elif self.code in (0x4c, 0x20):
+      arg = f'${op:04x}'
+    elif self.len == 1:
+      arg = 'A' if self.mnemonic in ('ASL', 'LSR', 'ROL', 'ROR') else ''
+    else:
+      arg = {
+        AddressingMode.Immediate: f'#${op:02x}',
+        AddressingMode.ZeroPage: f'${op:02x}',
+        AddressingMode.ZeroPage_X: f'${op:02x},X',
+        AddressingMode.ZeroPage_Y: f'${op:02x},Y',
+        AddressingMode.Absolute: f'${op:04x}',
+        AddressingMode.Absolute_X: f'${op:04x},X',
+        AddressingMode.Absolute_Y: f'${op:04x},Y',
+        AddressingMode.Indirect_X: f'(${op:02x},X)',
+        AddressingMode.Indirect_Y: f'(${op:02x}),Y',
+      }.get(mode, '')
+    return f'{self.addr:04x}  {self.mnemonic} {arg}'.rstrip()
+
+
+class BasicBlock(NamedTuple):
+  start: 'u16'
+  end: 'u16'  # address after the last instruction
+  instructions: list
+  successors: list
+
+
+class CodeMap(NamedTuple):
+  sha1: str
+  flags: bytearray  # per PRG-ROM byte
+  instructions: dict  # addr -> Instruction, reachable code only
+  blocks: dict  # start addr -> BasicBlock
+  entries: dict  # 'reset' / 'nmi' / 'irq' -> addr
+
+  def is_code(self, addr: 'u16') -> bool:
+    return addr in self.instructions
+
+
+class Prg:
+  # PRG-ROM as seen from the CPU at $8000-$FFFF (16 KiB carts mirrored)
+  def __init__(self, prg_rom: 'Vec<u8>'):
+    self.view = memoryview(prg_rom)
+    self.size = len(prg_rom)
+
+  def offset(self, addr: 'u16'):
+    if addr < 0x8000 or self.size == 0:
+      return None
+    return (addr - 0x8000) % self.size
+
+  def read(self, addr: 'u16') -> 'u8':
+    return self.view[self.offset(addr)]
+
+  def read_u16(self, addr: 'u16') -> 'u16':
+    return self.read(addr) | (self.read((addr + 1) & 0xffff) << 8)
+
+
+def decode(prg: 'Prg', addr: 'u16'):
+  # Instruction at addr, or None for an unknown opcode / outside of ROM
+  if prg.offset(addr) is None:
+    return None
+  code = prg.read(addr)
+  mnemonic = OP_MNEMONIC[code]
+  length = OP_LEN[code]
+  if mnemonic is None or prg.offset((addr + length - 1) & 0xffff) is None:
+    return None
+  if length == 2:
+    operand = prg.read(addr + 1)
+  elif length == 3:
+    operand = prg.read_u16(addr + 1)
+  else:
+    operand = 0
+  return Instruction(addr, code, mnemonic, length, OP_MODE[code], operand)
+
+
+def iter_instructions(prg_rom: 'Vec<u8>', start: 'u16' = 0x8000, end: 'u16' = 0x10000):
+  # linear sweep, lazily; unknown bytes come out as None
+  prg = Prg(prg_rom)
+  addr = start
+  while addr < end:
+    instruction = decode(prg, addr)
+    yield addr, instruction
+    addr += instruction.len if instruction is not None else 1
+
+
+def analyze(prg_rom: 'Vec<u8>') -> 'CodeMap':
+  prg = Prg(prg_rom)
+  flags = bytearray(prg.size)
+  entries = {}
+  if prg.size:
+    entries = {'nmi': prg.read_u16(NMI_VECTOR),
+               'reset': prg.read_u16(RESET_VECTOR),
+               'irq': prg.read_u16(IRQ_VECTOR)}
+
+  # --- reachability
+  instructions = {}
+  leaders = set()
+  work = []
+  for addr in entries.values():
+    if prg.offset(addr) is not None:
+      flags[prg.offset(addr)] |= ENTRY
+      leaders.add(addr)
+      work.append(addr)
+  while work:
+    addr = work.pop()
+    while addr not in instructions:
+      instruction = decode(prg, addr)
+      if instruction is None:
+        break
+      instructions[addr] = instruction
+      flags[prg.offset(addr)] |= OPCODE
+      for n in range(1, instruction.len):
+        flags[prg.offset((addr + n) & 0xffff)] |= OPERAND
+      targets = instruction.targets()
+      if instruction.mnemonic in BRANCHES or instruction.code in (0x20, 0x4c):
+        target = targets[-1]
+        if prg.offset(target) is not None:
+          flags[prg.offset(target)] |= JUMP_TARGET
+          leaders.add(target)
+          work.append(target)
+        if instruction.code == 0x4c:
+          break
+        leaders.add(targets[0])
+      elif not targets:
+        break
+      addr = targets[0]
+
+  # --- basic blocks
+  blocks = {}
+  for start in sorted(leaders):
+    if start not in instructions:
+      continue
+    body = []
+    addr = start
+    while addr in instructions:
+      instruction = instructions[addr]
+      body.append(instruction)
+      addr = (addr + instruction.len) & 0xffff
+      targets = instruction.targets()
+      if targets != [addr] or addr in leaders:
+        break
+    successors = [t for t in body[-1].targets() if t in instructions]
+    blocks[start] = BasicBlock(start, addr, body, successors)
+
+  sha1 = hashlib.sha1(bytes(prg_rom)).hexdigest()
+  return CodeMap(sha1, flags, instructions, blocks, entries)
+
+
+_cache = {}
+
+
+def _dump(cmap: 'CodeMap') -> tuple:
+  # plain tuples/lists/bytes for marshal
+  return (bytes(cmap.flags),
+          [tuple(i) for i in cmap.instructions.values()],
+          [(b.start, b.end, [i.addr for i in b.instructions], b.successors)
+           for b in cmap.blocks.values()],
+          cmap.entries)
+
+
+def _load(sha1: str, data: tuple) -> 'CodeMap':
+  flags, instructions, blocks, entries = data
+  instructions = {i[0]: Instruction(*i) for i in instructions}
+  blocks = {start: BasicBlock(start, end, [instructions[a] for a in body], successors)
+            for start, end, body, successors in blocks}
+  return CodeMap(sha1, bytearray(flags), instructions, blocks, entries)
+
+
+def cache_key(sha1: str) -> str:
+  table = repr((OP_LEN, OP_MODE, OP_MNEMONIC))
+  source = pathlib.Path(__file__).read_bytes()
+  return hashlib.sha1(f'{VERSION}:{sha1}:{table}'.encode() + source).hexdigest()
+
+
+def code_map(prg_rom: 'Vec<u8>', cache: 'CodeCache' = None) -> 'CodeMap':
+  # analyze() once per distinct PRG-ROM; with a cache, once per machine
+  sha1 = hashlib.sha1(bytes(prg_rom)).hexdigest()
+  result = _cache.get(sha1)
+  if result is None and cache is not None:
+    data = cache.get_or_build('disasm', cache_key(sha1), lambda: _dump(analyze(prg_rom)))
+    result = _load(sha1, data)
+  elif result is None:
+    result = analyze(prg_rom)
+  _cache[sha1] = result
+  return result
+
+
+def listing(cmap: 'CodeMap') -> 'Vec<str>':
+  return [cmap.instructions[addr].text() for addr in sorted(cmap.instructions)]
+
+
+if __name__ == '__main__':
+  import sys
+  from cartridge import Rom
+
+  from cache import default_cache
+
+  rom = Rom(pathlib.Path(sys.argv[1]).read_bytes())
+  cmap = code_map(rom.prg_rom, default_cache())
+  print('\n'.join(listing(cmap)))
+  print(f'; {len(cmap.instructions)} instructions, {len(cmap.blocks)} blocks')
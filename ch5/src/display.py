@@ -0,0 +1,83 @@
+import importlib.util
+import os
+
+#  Display backends own the shared (h, w, 3) uint8 RGB framebuffer and a
+#  SinkPipeline over it: render into `framebuffer`, then present(). numpy,
+#  PIL and ui are imported by the backend that needs them, not by this
+#  module, so a server process that never opens a display never pays for
+#  them.
+#    pythonista: ui.ImageView, frames shown through PythonistaSink
+#    headless:   no window; hooks are called with (rgb, index) per frame
+#  NES_DISPLAY picks the backend, otherwise pythonista when `ui` exists.
+
+DISPLAY_ENV = 'NES_DISPLAY'
+
+
+class Display:
+  def __init__(self, width: 'usize', height: 'usize'):
+    import numpy as np
+    from sinks import SinkPipeline
+    self.width = width
+    self.height = height
+    # reused for every frame; sinks that keep a frame copy it themselves
+    self.framebuffer = np.zeros((height, width, 3), dtype=np.uint8)
+    self.sinks = SinkPipeline(self.framebuffer)
+
+  @property
+  def frames(self) -> 'usize':
+    return self.sinks.index
+
+  def add_sink(self, sink: 'FrameSink') -> 'FrameSink':
+    return self.sinks.add(sink)
+
+  def present(self):
+    self.sinks.push()
+
+  def close(self):
+    self.sinks.close()
+
+
+class HeadlessDisplay(Display):
+  def __init__(self, width: 'usize', height: 'usize', hooks=()):
+    super().__init__(width, height)
+    for hook in hooks:
+      self.add_hook(hook)
+
+  def add_hook(self, callback) -> 'RawSink':
+    # callback(rgb, index) sees the framebuffer itself, not a copy
+    from sinks import RawSink
+    return self.add_sink(RawSink(callback))
+
+
+class PythonistaDisplay(Display):
+  def __init__(self, width: 'usize', height: 'usize', factor: int = 10,
+               offload: bool = False):
+    super().__init__(width, height)
+    import ui
+    from sinks import PythonistaSink
+    self.view = ui.ImageView()
+    self.view.bg_color = 0
+    self.view.width = width * factor
+    self.view.height = height * factor
+    self.add_sink(PythonistaSink(self.view, factor=factor, offload=offload))
+
+
+BACKENDS = {
+  'headless': HeadlessDisplay,
+  'pythonista': PythonistaDisplay,
+}
+
+
+def default_backend() -> str:
+  name = os.environ.get(DISPLAY_ENV)
+  if name:
+    return name
+  return 'pythonista' if importlib.util.find_spec('ui') else 'headless'
+
+
+def open_display(width: 'usize', height: 'usize', backend: str = None,
+                 **options) -> 'Display':
+  name = backend or default_backend()
+  if name not in BACKENDS:
+    raise ValueError(f'unknown display backend {name}')
+  return BACKENDS[name](width, height, **options)
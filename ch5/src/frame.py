@@ -0,0 +1,14 @@
+import numpy as np
+
+
+class Frame:
+  WIDTH: 'usize' = 256
+  HEIGHT: 'usize' = 240
+
+  def __init__(self):
+    self.data = np.zeros((self.HEIGHT, self.WIDTH, 3), dtype=np.uint8)
+    # --- true where the background pixel is not the backdrop colour
+    self.bg_opaque = np.zeros((self.HEIGHT, self.WIDTH), dtype=bool)
+
+  def set_pixel(self, x: 'usize', y: 'usize', rgb: '(u8, u8, u8)'):
+    self.data[y, x] = rgb
@@ -0,0 +1,78 @@
+import time
+from typing import NamedTuple
+
+#  Adaptive frame skipping: emulation always runs, only render/present is
+#  dropped. `lag` is how far the frontend is behind its frame budget (wall
+#  time between begin() calls minus the budget, never below zero). A frame
+#  with something to draw is skipped when lag + this frame's emulation time
+#  + the expected render cost would not fit in one budget, but never more
+#  than `max_skip` frames in a row, so the picture keeps moving under any
+#  load. Nothing is lost by skipping: dirty rows stay dirty until the next
+#  rendered frame.
+#    skip = FrameSkip(budget=1 / 60, max_skip=4)
+#    skip.begin(); <emulate>; if skip.should_render(): <render>; skip.rendered()
+
+
+class FrameSkipStats(NamedTuple):
+  frames: 'usize'
+  rendered: 'usize'
+  skipped: 'usize'
+  longest_skip: 'usize'  # most frames skipped in a row
+  emulation_time: float  # seconds
+  render_time: float
+  lag: float
+
+
+class FrameSkip:
+  def __init__(self, budget: float = 1 / 60, max_skip: int = 4, clock=time.perf_counter):
+    self.budget = budget
+    self.max_skip = max_skip
+    self.clock = clock
+    # a long stall (debugger, app in background) must not mean skipping forever
+    self.max_lag = budget * (max_skip + 1)
+    self.started = None
+    self.render_started = None
+    self.render_cost = 0.0  # moving average of one render
+    self.lag = 0.0
+    self.frames = 0
+    self.rendered_frames = 0
+    self.skipped = 0
+    self.skip_run = 0
+    self.longest_skip = 0
+    self.emulation_time = 0.0
+    self.render_time = 0.0
+
+  def begin(self):
+    now = self.clock()
+    if self.started is not None:
+      lag = self.lag + (now - self.started) - self.budget
+      self.lag = min(max(lag, 0.0), self.max_lag)
+    self.started = now
+    self.frames += 1
+
+  def should_render(self, changed: bool = True) -> bool:
+    # changed: whether the frame has anything to draw at all
+    emulation = self.clock() - self.started
+    self.emulation_time += emulation
+    if not changed:
+      return False
+    if self.skip_run < self.max_skip and \
+        self.lag + emulation + self.render_cost > self.budget:
+      self.skipped += 1
+      self.skip_run += 1
+      self.longest_skip = max(self.longest_skip, self.skip_run)
+      return False
+    self.skip_run = 0
+    self.render_started = self.clock()
+    return True
+
+  def rendered(self):
+    cost = self.clock() - self.render_started
+    self.render_time += cost
+    self.render_cost += (cost - self.render_cost) * 0.25
+    self.rendered_frames += 1
+
+  def stats(self) -> 'FrameSkipStats':
+    return FrameSkipStats(self.frames, self.rendered_frames, self.skipped,
+                          self.longest_skip, self.emulation_time, self.render_time,
+                          self.lag)
@@ -0,0 +1,214 @@
+from random import randint
+import pathlib
+
+from cpu import CPU
+from cartridge import Rom
+from bus import Bus
+from inputqueue import InputQueue, InputKind
+from movie import MovieRecorder, set_joypad
+
+#  The snake game loop without any UI. A frame (run_frame) applies queued
+#  input, then steps (poke the RNG byte, run one instruction) for one PPU
+#  frame, which the PPU model only times for NTSC, or for `frame_cycles`
+#  CPU cycles when given (a PAL frame is CpuClock.PAL / Region.PAL, the
+#  snake demo uses SNAKE_FRAME_CYCLES). It ends with a movie FRAME record
+#  and a redraw of the dirty screen rows ($0200-$05ff, 32x32) into the
+#  display framebuffer, unless a FrameSkip says there is no time for it.
+#  run_instruction is instruction pacing, for tests and tracing: the same
+#  input and redraw around a single step, and no movie FRAME record.
+#  __main__ wraps it in Pythonista views; run this file to play it headless.
+
+# the snake moves every 2351 cycles: about 10 moves a second at 60 fps
+SNAKE_FRAME_CYCLES: float = 2351 * 10 / 60
+
+PATH = '../'
+ROM = 'snake'
+NES_PATH = pathlib.Path(PATH + ROM + '.nes')
+
+BLACK = '#000000'
+WHITE = '#ffffff'
+GREY = '#808080'
+RED = '#ff0000'
+GREEN = '#008000'
+BLUE = '#0000ff'
+MAGENTA = '#ff00ff'
+YELLOW = '#ffff00'
+CYAN = '#00ffff'
+
+
+def palette(c_byt: 'u8'):
+  if c_byt == 0:  # 0 => BLACK
+    return BLACK
+  elif c_byt == 1:  # 1 => WHITE
+    return WHITE
+  elif c_byt in (2, 9):  # 2 | 9 => GREY
+    return GREY
+  elif c_byt in (3, 10):  # 3 | 10 => RED
+    return RED
+  elif c_byt in (4, 11):  # 4 | 11 => GREEN
+    return GREEN
+  elif c_byt in (5, 12):  # 5 | 12 => BLUE
+    return BLUE
+  elif c_byt in (6, 13):  # 6 | 13 => MAGENTA
+    return MAGENTA
+  elif c_byt in (7, 14):  # 7 | 14 => YELLOW
+    return YELLOW
+  else:  # _ => CYAN
+    return CYAN
+
+
+def color(byt: str) -> '(u8, u8, u8)':
+  return int(byt[1:3], 16), int(byt[3:5], 16), int(byt[5:7], 16)
+
+
+COLORS: '[(u8, u8, u8); 256]' = [color(palette(byt)) for byt in range(256)]
+
+
+def show_canvas(_cpu, screen: 'np.ndarray', rows: 'Vec<usize>' = range(32)):
+  # only the given screen rows (32 bytes each from 0x200) are redrawn
+  canvas = _cpu.bus.cpu_vram
+  for x in rows:
+    line = screen[x]
+    for y in range(32):
+      line[y] = COLORS[canvas[0x200 + x * 32 + y]]
+  return screen
+
+
+class Game:
+  def __init__(self, display: 'Display', nes_bytes: bytes = None,
+               movie_path: 'pathlib.Path' = None, frameskip: 'FrameSkip' = None,
+               frame_cycles: float = None):
+    nes_bytes = nes_bytes or pathlib.Path.read_bytes(NES_PATH)
+    bus = Bus(Rom(nes_bytes))
+    self.cpu = CPU(bus)
+    self.cpu.reset()
+    self.display = display
+    self.frameskip = frameskip
+    self.frame_cycles = frame_cycles
+    self.frame_end: float = 0.0  # absolute, so fractional cycles carry over
+    self.movie = None
+    self.poke = self.cpu.mem_write
+    self.joypad = lambda port, status: set_joypad(bus, port, status)
+    if movie_path is not None:
+      self.movie = MovieRecorder(movie_path, self.cpu, nes_bytes)
+      self.poke = self.movie.poke
+      self.joypad = self.movie.joypad
+    # filled from UI threads, applied here at the start of a tick
+    self.inputs = InputQueue()
+    self.screen_region = bus.watch(0x200, 0x600)
+    self.screen_generation = bus.generation
+    show_canvas(self.cpu, display.framebuffer)
+    display.present()
+
+  def read_screen_state(self, _cpu: '&CPU') -> 'Vec<usize>':
+    # dirty screen rows since the last redraw, O(1) when nothing changed
+    bus = _cpu.bus
+    if not bus.changed_since(self.screen_region, self.screen_generation):
+      return []
+    rows = bus.dirty_rows(self.screen_region, self.screen_generation)
+    self.screen_generation = bus.generation
+    return rows
+
+  def apply_input(self, event: 'InputEvent'):
+    if event.kind == InputKind.POKE:
+      self.poke(event.target, event.value)
+    elif event.kind == InputKind.BUTTON:
+      bus = self.cpu.bus
+      joypad = bus.joypad2 if event.target else bus.joypad1
+      button, pressed = event.value >> 1, event.value & 1
+      status = joypad.button_status | button if pressed else joypad.button_status & ~button
+      self.joypad(event.target, status & 0xff)
+
+  def begin_tick(self):
+    if self.frameskip is not None:
+      self.frameskip.begin()
+    if self.inputs.pending:  # unlocked peek; drain() takes the lock
+      for event in self.inputs.drain():
+        self.apply_input(event)
+
+  def step(self) -> bool:
+    if self.movie is not None:
+      self.movie.rng(0xfe, randint(1, 16))
+    else:
+      self.cpu.mem_write(0xfe, randint(1, 16))
+    return self.cpu.run_with_callback()
+
+  def render(self):
+    changed = self.cpu.bus.changed_since(self.screen_region, self.screen_generation)
+    frameskip = self.frameskip
+    if frameskip is not None:
+      changed = frameskip.should_render(changed)
+    if changed:
+      show_canvas(self.cpu, self.display.framebuffer, self.read_screen_state(self.cpu))
+      self.display.present()
+      if frameskip is not None:
+        frameskip.rendered()
+
+  def run_instruction(self) -> bool:
+    # instruction pacing: input, one step, redraw; not a movie frame
+    self.begin_tick()
+    halted = self.step()
+    self.render()
+    return halted
+
+  def run_frame(self) -> bool:
+    # one frame of emulation, then one render
+    self.begin_tick()
+    bus = self.cpu.bus
+    halted = False
+    if self.frame_cycles is None:
+      # one PPU frame (about 29781 CPU cycles)
+      ppu = bus.ppu
+      frame = ppu.frame_count
+      while ppu.frame_count == frame and not halted:
+        halted = self.step()
+    else:
+      self.frame_end = max(self.frame_end, bus.cycles) + self.frame_cycles
+      while bus.cycles < self.frame_end and not halted:
+        halted = self.step()
+    if self.movie is not None:
+      self.movie.frame()
+    self.render()
+    return halted
+
+  def close(self):
+    if self.movie is not None:
+      self.movie.close()
+    self.display.close()
+
+
+if __name__ == '__main__':
+  import argparse
+
+  from display import open_display
+  from frameskip import FrameSkip
+  from governor import SpeedGovernor, Region, CpuClock, UNTHROTTLED
+  from sinks import PngSnapshotSink
+
+  # python game.py --frames 600 --speed max --png snake.png
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--frames', type=int, default=600)
+  parser.add_argument('--speed', default='1', choices=['1', '2', '4', 'max'])
+  parser.add_argument('--region', default='ntsc', choices=['ntsc', 'pal'])
+  parser.add_argument('--png', default=None)
+  parser.add_argument('--max-skip', type=int, default=0)
+  options = parser.parse_args()
+  frameskip = FrameSkip(max_skip=options.max_skip) if options.max_skip else None
+  pal = options.region == 'pal'
+  governor = SpeedGovernor(Region.PAL if pal else Region.NTSC,
+                           UNTHROTTLED if options.speed == 'max' else int(options.speed))
+  # the PPU is NTSC only, so PAL frames are counted in CPU cycles
+  game = Game(open_display(32, 32, 'headless'), frameskip=frameskip,
+              frame_cycles=CpuClock.PAL / Region.PAL if pal else None)
+  snapshot = game.display.add_sink(PngSnapshotSink(factor=10))
+  for _ in range(options.frames):
+    if game.run_frame():
+      break
+    governor.pace()
+  print(f'{game.display.frames} frames presented')
+  print(governor.stats())
+  if frameskip is not None:
+    print(frameskip.stats())
+  if options.png:
+    snapshot.snapshot(options.png)
+  game.close()
@@ -0,0 +1,130 @@
+import time
+from collections import deque
+from typing import NamedTuple
+
+#  Paces emulated frames against the wall clock. Deadlines are absolute
+#  (origin + n * period), so sleep overshoot and slow frames are paid back
+#  on the following frames instead of accumulating as drift. When the
+#  emulation falls more than `max_lag` frames behind (scaled by the
+#  multiplier), the debt beyond that is dropped (a resync) rather than run
+#  at full speed to catch up.
+#    pace(): after every frame, sleeps until the next deadline (loops you own)
+#    due():  frames to run now, never sleeps (callback hosts like ui.View);
+#            host ticks with nothing due count as idle time
+#  multiplier 2 or 4 runs faster than the console; UNTHROTTLED never waits.
+
+
+class _Region(NamedTuple):
+  NTSC: float = 60.0988
+  PAL: float = 50.007
+
+
+Region = _Region()
+
+
+class _CpuClock(NamedTuple):
+  # Hz; CpuClock.PAL / Region.PAL is a PAL frame in CPU cycles
+  NTSC: float = 1789773.0
+  PAL: float = 1662607.0
+
+
+CpuClock = _CpuClock()
+UNTHROTTLED: int = 0
+
+
+class GovernorStats(NamedTuple):
+  frames: 'usize'
+  elapsed: float  # seconds since the first frame
+  fps: float  # average since the first frame
+  recent_fps: float  # over the last `window` frames
+  target_fps: float  # 0.0 when unthrottled
+  idle_time: float  # seconds slept in pace() or waited between due() calls
+  resyncs: 'usize'
+
+
+class SpeedGovernor:
+  def __init__(self, rate: float = Region.NTSC, multiplier: int = 1, max_lag: int = 4,
+               window: int = 60, clock=time.perf_counter, sleep=time.sleep):
+    self.rate = rate
+    self.max_lag = max_lag
+    self.clock = clock
+    self.sleep = sleep
+    self.started = None
+    self.deadline = None
+    self.frames = 0
+    self.idle_time = 0.0
+    self.idle_since = None  # last due() that had nothing to run
+    self.resyncs = 0
+    self.recent = deque(maxlen=window)
+    self.set_speed(multiplier)
+
+  def set_speed(self, multiplier: int, rate: float = None):
+    # restarts the deadlines, so a speed change never bursts
+    self.multiplier = multiplier
+    if rate is not None:
+      self.rate = rate
+    self.period = 1 / (self.rate * multiplier) if multiplier else 0.0
+    self.deadline = None
+
+  @property
+  def target_fps(self) -> float:
+    return self.rate * self.multiplier
+
+  def count(self, now: float, frames: int = 1):
+    if self.started is None:
+      self.started = now
+    self.frames += frames
+    self.recent.extend([now] * frames)
+
+  def pace(self) -> float:
+    # -> seconds slept
+    now = self.clock()
+    self.count(now)
+    if not self.multiplier:
+      return 0.0
+    if self.deadline is None:
+      self.deadline = now
+    self.deadline += self.period
+    wait = self.deadline - now
+    if wait <= 0:
+      if -wait > self.max_lag * self.period:
+        self.deadline = now
+        self.resyncs += 1
+      return 0.0
+    self.sleep(wait)
+    slept = self.clock() - now
+    self.idle_time += slept
+    return slept
+
+  def due(self, max_frames: int = None) -> int:
+    # frames that should have run by now, counted as run
+    limit = max_frames or self.max_lag * max(self.multiplier, 1)
+    now = self.clock()
+    if self.idle_since is not None:
+      self.idle_time += now - self.idle_since
+      self.idle_since = None
+    if not self.multiplier:
+      self.count(now, limit)
+      return limit
+    if self.deadline is None:
+      self.deadline = now
+    frames = int((now - self.deadline) // self.period) + 1 if now >= self.deadline else 0
+    # the excess over `limit` is skipped, not run later
+    self.deadline += frames * self.period
+    if frames > limit:
+      frames = limit
+      self.resyncs += 1
+    if frames:
+      self.count(now, frames)
+    else:
+      self.idle_since = now
+    return frames
+
+  def stats(self) -> 'GovernorStats':
+    elapsed = (self.recent[-1] - self.started) if self.recent else 0.0
+    span = self.recent[-1] - self.recent[0] if len(self.recent) > 1 else 0.0
+    return GovernorStats(
+      self.frames, elapsed,
+      (self.frames - 1) / elapsed if elapsed else 0.0,
+      (len(self.recent) - 1) / span if span else 0.0,
+      self.target_fps, self.idle_time, self.resyncs)
@@ -0,0 +1,67 @@
+import threading
+import time
+from typing import NamedTuple
+
+#  UI threads push timestamped events, the emulation thread drains them at
+#  a frame boundary (Game.run_frame before the frame runs). The lock is only
+#  held to append or to swap the pending list out, never while emulating,
+#  and the CPU never reads anything the UI thread writes. Applied events go
+#  through the movie recorder when one is active, so a session replays
+#  with the same cycle stamps.
+
+
+class _InputKind(NamedTuple):
+  BUTTON: int = 1  # port, (button << 1) | pressed
+  POKE: int = 2  # addr, value: e.g. the snake demo's key byte at $ff
+
+
+InputKind = _InputKind()
+
+
+class InputEvent(NamedTuple):
+  time: float
+  kind: int
+  target: 'u16'
+  value: 'u16'
+
+
+class InputQueue:
+  def __init__(self, clock=time.perf_counter):
+    self.clock = clock
+    self.lock = threading.Lock()
+    self.pending: 'Vec<InputEvent>' = []
+    self.applied: 'usize' = 0
+
+  def push(self, kind: int, target: 'u16', value: 'u16') -> 'InputEvent':
+    event = InputEvent(self.clock(), kind, target, value)
+    with self.lock:
+      self.pending.append(event)
+    return event
+
+  def press(self, button: 'JoypadButton', pressed: bool = True, port: int = 0):
+    return self.push(InputKind.BUTTON, port, (button << 1) | pressed)
+
+  def release(self, button: 'JoypadButton', port: int = 0):
+    return self.press(button, False, port)
+
+  def poke(self, addr: 'u16', value: 'u8'):
+    return self.push(InputKind.POKE, addr, value)
+
+  def drain(self, until: float = None) -> 'Vec<InputEvent>':
+    # events stamped at or before `until` (all when None), oldest first;
+    # later ones wait for the next frame
+    with self.lock:
+      pending, self.pending = self.pending, []
+    pending.sort(key=lambda event: event.time)
+    if until is not None:
+      due = [event for event in pending if event.time <= until]
+      if len(due) != len(pending):
+        with self.lock:
+          self.pending[:0] = pending[len(due):]
+      pending = due
+    self.applied += len(pending)
+    return pending
+
+  def __len__(self) -> int:
+    with self.lock:
+      return len(self.pending)
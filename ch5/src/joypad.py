@@ -0,0 +1,46 @@
+from typing import NamedTuple
+
+#  Standard controller behind $4016 (port 1) and $4017 (port 2). Writing
+#  bit 0 of $4016 sets the strobe on both ports; while it is high every
+#  read returns button A, after it drops each read shifts out the next
+#  button (A, B, Select, Start, Up, Down, Left, Right), then 1s.
+
+
+class _JoypadButton(NamedTuple):
+  RIGHT: int = 0b1000_0000
+  LEFT: int = 0b0100_0000
+  DOWN: int = 0b0010_0000
+  UP: int = 0b0001_0000
+  START: int = 0b0000_1000
+  SELECT: int = 0b0000_0100
+  BUTTON_B: int = 0b0000_0010
+  BUTTON_A: int = 0b0000_0001
+
+
+JoypadButton = _JoypadButton()
+
+
+class Joypad:
+  def __init__(self):
+    self.strobe: bool = False
+    self.button_index: 'u8' = 0
+    self.button_status: 'JoypadButton' = 0
+
+  def write(self, data: 'u8'):
+    self.strobe = data & 1 == 1
+    if self.strobe:
+      self.button_index = 0
+
+  def read(self) -> 'u8':
+    if self.button_index > 7:
+      return 1
+    response = (self.button_status & (1 << self.button_index)) >> self.button_index
+    if not self.strobe and self.button_index <= 7:
+      self.button_index += 1
+    return response
+
+  def set_button_pressed_status(self, button: 'JoypadButton', pressed: bool):
+    if pressed:
+      self.button_status |= button
+    else:
+      self.button_status &= ~button & 0xff
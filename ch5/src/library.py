@@ -0,0 +1,157 @@
+import hashlib
+import os
+import pathlib
+import sqlite3
+from typing import NamedTuple
+
+from cartridge import parse_header
+
+#  SQLite index of .nes files: iNES header fields and the sha1 of the whole
+#  file (the same hash movie.rom_hash uses). A rescan only reads files
+#  whose size or mtime changed, and drops rows for files that are gone.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS roms (
+  path TEXT PRIMARY KEY,
+  name TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  mtime_ns INTEGER NOT NULL,
+  sha1 TEXT NOT NULL,
+  ines INTEGER NOT NULL,
+  ines_ver INTEGER NOT NULL,
+  mapper INTEGER NOT NULL,
+  prg_rom_size INTEGER NOT NULL,
+  chr_rom_size INTEGER NOT NULL,
+  mirroring INTEGER NOT NULL,
+  trainer INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS roms_sha1 ON roms (sha1);
+CREATE INDEX IF NOT EXISTS roms_mapper ON roms (mapper);
+'''
+
+COLUMNS = ('path', 'name', 'size', 'mtime_ns', 'sha1', 'ines', 'ines_ver',
+           'mapper', 'prg_rom_size', 'chr_rom_size', 'mirroring', 'trainer')
+
+
+class RomEntry(NamedTuple):
+  path: str
+  name: str
+  size: 'usize'
+  mtime_ns: int
+  sha1: str
+  ines: bool
+  ines_ver: 'u8'
+  mapper: 'u8'
+  prg_rom_size: 'usize'
+  chr_rom_size: 'usize'
+  mirroring: 'Mirroring'
+  trainer: bool
+
+
+class ScanResult(NamedTuple):
+  added: int
+  updated: int
+  unchanged: int
+  removed: int
+
+
+def read_entry(path: 'pathlib.Path', stat=None) -> 'RomEntry':
+  # header from the first 16 bytes, sha1 streamed over the rest
+  stat = stat or path.stat()
+  digest = hashlib.sha1()
+  with open(path, 'rb') as f:
+    head = f.read(16)
+    digest.update(head)
+    for chunk in iter(lambda: f.read(1 << 16), b''):
+      digest.update(chunk)
+  if len(head) < 16:
+    head = head.ljust(16, b'\x00')
+  header = parse_header(head)
+  return RomEntry(str(path), path.stem, stat.st_size, stat.st_mtime_ns,
+                  digest.hexdigest(), header.ines, header.ines_ver, header.mapper,
+                  header.prg_rom_size, header.chr_rom_size,
+                  header.screen_mirroring, header.trainer)
+
+
+class RomLibrary:
+  def __init__(self, db_path: 'pathlib.Path' = ':memory:'):
+    self.db = sqlite3.connect(str(db_path))
+    self.db.executescript(SCHEMA)
+
+  def close(self):
+    self.db.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def scan(self, *directories: 'pathlib.Path') -> 'ScanResult':
+    added = updated = unchanged = removed = 0
+    seen = set()
+    with self.db:
+      for directory in directories:
+        directory = pathlib.Path(directory).resolve()
+        prefix = os.path.join(str(directory), '')
+        known = {path: (size, mtime) for path, size, mtime in self.db.execute(
+          'SELECT path, size, mtime_ns FROM roms WHERE substr(path, 1, ?) = ?',
+          (len(prefix), prefix))}
+        for path in directory.rglob('*'):
+          if path.suffix.lower() != '.nes' or not path.is_file():
+            continue
+          key = str(path)
+          seen.add(key)
+          stat = path.stat()
+          if known.get(key) == (stat.st_size, stat.st_mtime_ns):
+            unchanged += 1
+            continue
+          if key in known:
+            updated += 1
+          else:
+            added += 1
+          self.db.execute(
+            f'INSERT OR REPLACE INTO roms VALUES ({", ".join("?" * len(COLUMNS))})',
+            read_entry(path, stat))
+        gone = [(path,) for path in known if path not in seen]
+        self.db.executemany('DELETE FROM roms WHERE path = ?', gone)
+        removed += len(gone)
+    return ScanResult(added, updated, unchanged, removed)
+
+  def find(self, name: str = None, **fields) -> 'Vec<RomEntry>':
+    # find(mapper=0), find(name='snake*'), find(mirroring=Mirroring.VERTICAL)
+    where, args = [], []
+    if name is not None:
+      where.append('name GLOB ?')
+      args.append(name)
+    for column, value in fields.items():
+      if column not in COLUMNS:
+        raise ValueError(f'unknown column {column}')
+      where.append(f'{column} = ?')
+      args.append(value)
+    sql = 'SELECT * FROM roms'
+    if where:
+      sql += ' WHERE ' + ' AND '.join(where)
+    return [self._entry(row) for row in self.db.execute(sql + ' ORDER BY name', args)]
+
+  def by_hash(self, sha1: str) -> 'Vec<RomEntry>':
+    return self.find(sha1=sha1)
+
+  def __len__(self) -> int:
+    return self.db.execute('SELECT COUNT(*) FROM roms').fetchone()[0]
+
+  @staticmethod
+  def _entry(row: tuple) -> 'RomEntry':
+    entry = RomEntry(*row)
+    return entry._replace(ines=bool(entry.ines), trainer=bool(entry.trainer))
+
+
+if __name__ == '__main__':
+  import sys
+
+  # python library.py index.db <dir>...
+  with RomLibrary(sys.argv[1]) as library:
+    print(library.scan(*sys.argv[2:]))
+    for entry in library.find():
+      print(f'{entry.mapper:>3}  {entry.prg_rom_size >> 10:>4}K  '
+            f'{entry.chr_rom_size >> 10:>4}K  {entry.sha1[:10]}  {entry.path}')
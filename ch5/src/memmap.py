@@ -0,0 +1,6 @@
+#  Constants shared by the bus and the generated CPU handlers. Kept free of
+#  imports so codegen can use them while cpu and bus are still loading.
+
+# write tracking granularity: 32 bytes (one row of the snake screen)
+DIRTY_BLOCK_SHIFT: 'u8' = 5
+DIRTY_BLOCKS: 'usize' = 0x800 >> DIRTY_BLOCK_SHIFT
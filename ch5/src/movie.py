@@ -0,0 +1,119 @@
+import hashlib
+import pathlib
+import struct
+from typing import NamedTuple
+
+from cpu import CPU
+from bus import Bus
+from cartridge import Rom
+
+#  Movie file
+#    header: MAGIC, sha1 of the .nes file (20 bytes)
+#    record: cycle (u64), kind (u8), addr (u16), value (u8)
+#  Every write the frontend makes into the machine (key bytes, RNG seeds,
+#  joypad button state: addr is the port) is stamped with bus.cycles, and
+#  FRAME marks the end of a frontend tick.
+#  Replaying runs the CPU up to each stamp and re-applies the write.
+
+MAGIC = b'NESMOV\x00\x01'
+RECORD = struct.Struct('<QBHB')
+
+
+class _MovieEvent(NamedTuple):
+  INPUT: int = 1
+  RNG: int = 2
+  FRAME: int = 3
+  JOYPAD: int = 4
+
+
+MovieEvent = _MovieEvent()
+
+
+class Record(NamedTuple):
+  cycle: 'usize'
+  kind: int
+  addr: 'u16'
+  value: 'u8'
+
+
+def rom_hash(nes_bytes: bytes) -> bytes:
+  return hashlib.sha1(nes_bytes).digest()
+
+
+def ram_hash(bus: 'Bus') -> str:
+  return hashlib.blake2b(bytes(bus.cpu_vram), digest_size=8).hexdigest()
+
+
+class MovieRecorder:
+  def __init__(self, path: 'pathlib.Path', cpu: 'CPU', nes_bytes: bytes):
+    self.cpu = cpu
+    self.file = open(path, 'wb')
+    self.file.write(MAGIC + rom_hash(nes_bytes))
+
+  def record(self, kind: int, addr: 'u16' = 0, value: 'u8' = 0):
+    self.file.write(RECORD.pack(self.cpu.bus.cycles, kind, addr, value))
+
+  def poke(self, addr: 'u16', value: 'u8', kind: int = MovieEvent.INPUT):
+    self.record(kind, addr, value)
+    self.cpu.mem_write(addr, value)
+
+  def rng(self, addr: 'u16', value: 'u8'):
+    self.poke(addr, value, MovieEvent.RNG)
+
+  def joypad(self, port: int, status: 'u8'):
+    self.record(MovieEvent.JOYPAD, port, status)
+    set_joypad(self.cpu.bus, port, status)
+
+  def frame(self):
+    self.record(MovieEvent.FRAME)
+
+  def close(self):
+    self.file.close()
+
+
+def set_joypad(bus: 'Bus', port: int, status: 'u8'):
+  (bus.joypad2 if port else bus.joypad1).button_status = status
+
+
+def read_movie(path: 'pathlib.Path'):
+  # -> (rom sha1, generator of Record)
+  f = open(path, 'rb')
+  if f.read(len(MAGIC)) != MAGIC:
+    f.close()
+    raise ValueError(f'{path} is not a movie file')
+  sha1 = f.read(20)
+
+  def records():
+    with f:
+      while True:
+        raw = f.read(RECORD.size)
+        if len(raw) < RECORD.size:
+          return
+        yield Record(*RECORD.unpack(raw))
+  return sha1, records()
+
+
+def replay(path: 'pathlib.Path', nes_bytes: bytes, frame_hash=ram_hash):
+  # yields frame_hash(bus) at every FRAME record
+  sha1, records = read_movie(path)
+  if sha1 != rom_hash(nes_bytes):
+    raise ValueError('movie was recorded with a different ROM')
+  bus = Bus(Rom(nes_bytes))
+  cpu = CPU(bus)
+  cpu.reset()
+  for record in records:
+    cpu.run_until(record.cycle)
+    if record.kind == MovieEvent.FRAME:
+      yield frame_hash(bus)
+    elif record.kind == MovieEvent.JOYPAD:
+      set_joypad(bus, record.addr, record.value)
+    else:
+      cpu.mem_write(record.addr, record.value)
+
+
+if __name__ == '__main__':
+  import sys
+
+  movie, nes = sys.argv[1], sys.argv[2]
+  for n, digest in enumerate(replay(movie, pathlib.Path(nes).read_bytes())):
+    print(n, digest)
@@ -1,4 +1,20 @@
-from cpu import AddressingMode
+from typing import NamedTuple
+
+
+class _AddressingMode(NamedTuple):
+  Immediate: int = 1
+  ZeroPage: int = 2
+  ZeroPage_X: int = 3
+  ZeroPage_Y: int = 4
+  Absolute: int = 5
+  Absolute_X: int = 6
+  Absolute_Y: int = 7
+  Indirect_X: int = 8
+  Indirect_Y: int = 9
+  NoneAddressing: int = 10
+
+
+AddressingMode = _AddressingMode()
 
 
 class OpCode:
@@ -242,6 +258,31 @@ OPCODES_MAP = {}
 for cpuop in CPU_OPS_CODES:
   OPCODES_MAP.update({cpuop.code: cpuop})
 
+#  Flat per-opcode tables indexed by the opcode byte. Unknown opcodes are
+#  1 byte / 2 cycles (a NOP) with mnemonic None.
+#  PAGE_CROSS marks reads that take +1 cycle when the indexed address
+#  crosses a page; stores and read-modify-write always pay it.
+_NO_PAGE_PENALTY = ('STA', 'STX', 'STY', 'ASL', 'LSR', 'ROL', 'ROR', 'INC', 'DEC')
+
+OP_LEN = bytearray([1] * 256)
+OP_CYCLES = bytearray([2] * 256)
+OP_MODE = bytearray([AddressingMode.NoneAddressing] * 256)
+OP_PAGE_CROSS = bytearray(256)
+OP_MNEMONIC = [None] * 256
+for cpuop in CPU_OPS_CODES:
+  OP_LEN[cpuop.code] = cpuop.len
+  OP_CYCLES[cpuop.code] = cpuop.cycles
+  OP_MODE[cpuop.code] = cpuop.mode
+  OP_MNEMONIC[cpuop.code] = cpuop.mnemonic
+  OP_PAGE_CROSS[cpuop.code] = cpuop.mode in (
+    AddressingMode.Absolute_X, AddressingMode.Absolute_Y,
+    AddressingMode.Indirect_Y) and cpuop.mnemonic not in _NO_PAGE_PENALTY
+OP_LEN = bytes(OP_LEN)
+OP_CYCLES = bytes(OP_CYCLES)
+OP_MODE = bytes(OP_MODE)
+OP_PAGE_CROSS = bytes(OP_PAGE_CROSS)
+OP_MNEMONIC = tuple(OP_MNEMONIC)
+
 if __name__ == '__main__':
   pass
 
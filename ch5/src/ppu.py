@@ -0,0 +1,289 @@
+from enum import IntFlag
+
+from cartridge import Mirroring
+from diagnostics import report, Diag
+
+
+class ControlRegister(IntFlag):
+  """  PPUCTRL ($2000)
+      http://wiki.nesdev.com/w/index.php/PPU_registers
+
+    7 6 5 4 3 2 1 0
+    V P H B S I N N
+    | | | | | | +-+--- Base nametable address
+    | | | | | +------- VRAM address increment (0: +1, 1: +32)
+    | | | | +--------- Sprite pattern table address for 8x8 sprites
+    | | | +----------- Background pattern table address
+    | | +------------- Sprite size (0: 8x8, 1: 8x16)
+    | +--------------- PPU master/slave select
+    +----------------- Generate an NMI at the start of vblank
+    """
+  NAMETABLE1 = 0b0000_0001
+  NAMETABLE2 = 0b0000_0010
+  VRAM_ADD_INCREMENT = 0b0000_0100
+  SPRITE_PATTERN_ADDR = 0b0000_1000
+  BACKROUND_PATTERN_ADDR = 0b0001_0000
+  SPRITE_SIZE = 0b0010_0000
+  MASTER_SLAVE_SELECT = 0b0100_0000
+  GENERATE_NMI = 0b1000_0000
+  NULL = 0
+
+
+class MaskRegister(IntFlag):
+  """  PPUMASK ($2001)
+
+    7 6 5 4 3 2 1 0
+    B G R s b M m G
+    | | | | | | | +--- Greyscale
+    | | | | | | +----- Show background in leftmost 8 pixels
+    | | | | | +------- Show sprites in leftmost 8 pixels
+    | | | | +--------- Show background
+    | | | +----------- Show sprites
+    +-+-+------------- Emphasize red, green, blue
+    """
+  GREYSCALE = 0b0000_0001
+  LEFTMOST_8PXL_BACKGROUND = 0b0000_0010
+  LEFTMOST_8PXL_SPRITE = 0b0000_0100
+  SHOW_BACKGROUND = 0b0000_1000
+  SHOW_SPRITES = 0b0001_0000
+  EMPHASISE_RED = 0b0010_0000
+  EMPHASISE_GREEN = 0b0100_0000
+  EMPHASISE_BLUE = 0b1000_0000
+  NULL = 0
+
+
+class StatusRegister(IntFlag):
+  """  PPUSTATUS ($2002)
+
+    7 6 5 4 3 2 1 0
+    V S O . . . . .
+    | | | +-+-+-+-+--- open bus
+    | | +------------- Sprite overflow
+    | +--------------- Sprite 0 hit
+    +----------------- Vertical blank has started
+    """
+  SPRITE_OVERFLOW = 0b0010_0000
+  SPRITE_ZERO_HIT = 0b0100_0000
+  VBLANK_STARTED = 0b1000_0000
+  NULL = 0
+
+
+#  NTSC timing: 341 dots x 262 scanlines, 3 dots per CPU cycle
+DOTS_PER_SCANLINE: 'usize' = 341
+SCANLINES_PER_FRAME: 'usize' = 262
+VISIBLE_SCANLINES: 'usize' = 240
+VBLANK_SCANLINE: 'usize' = 241
+PRE_RENDER_SCANLINE: 'usize' = 261
+DOTS_PER_FRAME: 'usize' = DOTS_PER_SCANLINE * SCANLINES_PER_FRAME
+DOTS_PER_CPU_CYCLE: 'usize' = 3
+
+VBLANK_DOT: 'usize' = VBLANK_SCANLINE * DOTS_PER_SCANLINE + 1
+PRE_RENDER_DOT: 'usize' = PRE_RENDER_SCANLINE * DOTS_PER_SCANLINE + 1
+NEVER: 'usize' = DOTS_PER_FRAME + 1
+
+# Horizontal:
+#   [ A ] [ a ]
+#   [ B ] [ b ]
+# Vertical:
+#   [ A ] [ B ]
+#   [ a ] [ b ]
+# physical 1 KiB VRAM page behind each of the nametables $2000/$2400/$2800/$2C00
+NAMETABLE_PAGES = {
+  Mirroring.VERTICAL: (0, 1, 0, 1),
+  Mirroring.HORIZONTAL: (0, 0, 1, 1),
+  Mirroring.FOUR_SCREEN: (0, 1, 2, 3),
+}
+
+
+class NesPPU:
+  def __init__(self, chr_rom: 'Vec<u8>', mirroring: 'Mirroring'):
+    self.chr_rom: 'Vec<u8>' = chr_rom
+    self.palette_table: '[u8; 32]' = bytearray(32)
+    # 2 KiB on the console, the upper half only used by four-screen carts
+    self.vram: '[u8; 4096]' = bytearray(4096)
+    self.nametables: '[memoryview; 4]' = None
+    self.set_mirroring(mirroring)
+    self.oam_addr: 'u8' = 0
+    self.oam_data: '[u8; 256]' = bytearray(256)
+    self.ctrl: 'ControlRegister' = ControlRegister.NULL
+    self.mask: 'MaskRegister' = MaskRegister.NULL
+    self.status: 'StatusRegister' = StatusRegister.NULL
+    self.addr: 'u16' = 0
+    self.scroll_x: 'u8' = 0
+    self.scroll_y: 'u8' = 0
+    self.w_latch: bool = False
+    self.internal_data_buf: 'u8' = 0
+    self.nmi_interrupt: bool = False
+
+    # --- catch-up state: the PPU only runs when somebody needs it
+    self.last_cpu_cycle: 'usize' = 0
+    self.position: 'usize' = 0  # dot within the frame (scanline * 341 + dot)
+    self.rendered_lines: 'usize' = 0
+    self.sprite_zero_dot = None
+    self.frame_count: 'usize' = 0
+    # renderer(ppu, start, end) -> (scanline, x) of sprite 0 hit or None
+    self.renderer = None
+    self.frame_callback = None
+
+  @property
+  def scanline(self) -> 'u16':
+    return self.position // DOTS_PER_SCANLINE
+
+  @property
+  def dot(self) -> 'u16':
+    return self.position % DOTS_PER_SCANLINE
+
+  def catch_up(self, cpu_cycle: 'usize'):
+    dots = (cpu_cycle - self.last_cpu_cycle) * DOTS_PER_CPU_CYCLE
+    if dots <= 0:
+      return
+    self.last_cpu_cycle = cpu_cycle
+    target = self.position + dots
+    while target >= DOTS_PER_FRAME:
+      self.run_to(DOTS_PER_FRAME)
+      self.end_frame()
+      target -= DOTS_PER_FRAME
+    self.run_to(target)
+
+  def run_to(self, target: 'usize'):
+    # --- render every scanline that finished since the last catch-up
+    done = min(target // DOTS_PER_SCANLINE, VISIBLE_SCANLINES)
+    if done > self.rendered_lines:
+      if self.renderer is not None:
+        hit = self.renderer(self, self.rendered_lines, done)
+        if hit is not None and self.sprite_zero_dot is None:
+          self.sprite_zero_dot = hit[0] * DOTS_PER_SCANLINE + hit[1] + 1
+      self.rendered_lines = done
+    if self.sprite_zero_dot is not None and target >= self.sprite_zero_dot:
+      self.status |= StatusRegister.SPRITE_ZERO_HIT
+      self.sprite_zero_dot = NEVER
+    if self.position < VBLANK_DOT <= target:
+      self.status |= StatusRegister.VBLANK_STARTED
+      if self.ctrl & ControlRegister.GENERATE_NMI:
+        self.nmi_interrupt = True
+    if self.position < PRE_RENDER_DOT <= target:
+      self.status &= ~(StatusRegister.VBLANK_STARTED
+                       | StatusRegister.SPRITE_ZERO_HIT
+                       | StatusRegister.SPRITE_OVERFLOW)
+    self.position = target
+
+  def end_frame(self):
+    self.position = 0
+    self.rendered_lines = 0
+    self.sprite_zero_dot = None
+    self.frame_count += 1
+    if self.frame_callback is not None:
+      self.frame_callback(self)
+
+  def next_sync_cycle(self) -> 'usize':
+    # CPU cycle at which vblank starts or the frame ends, whichever is next
+    if self.position < VBLANK_DOT:
+      target = VBLANK_DOT
+    else:
+      target = DOTS_PER_FRAME
+    dots = target - self.position
+    return self.last_cpu_cycle + -(-dots // DOTS_PER_CPU_CYCLE)
+
+  def poll_nmi_interrupt(self) -> bool:
+    nmi = self.nmi_interrupt
+    self.nmi_interrupt = False
+    return nmi
+
+  def sprite_size(self) -> 'u8':
+    return 16 if self.ctrl & ControlRegister.SPRITE_SIZE else 8
+
+  def sprt_pattern_addr(self) -> 'u16':
+    return 0x1000 if self.ctrl & ControlRegister.SPRITE_PATTERN_ADDR else 0
+
+  def bknd_pattern_addr(self) -> 'u16':
+    return 0x1000 if self.ctrl & ControlRegister.BACKROUND_PATTERN_ADDR else 0
+
+  def vram_addr_increment(self) -> 'u8':
+    return 32 if self.ctrl & ControlRegister.VRAM_ADD_INCREMENT else 1
+
+  def write_to_ctrl(self, value: 'u8'):
+    before_nmi_status = self.ctrl & ControlRegister.GENERATE_NMI
+    self.ctrl = ControlRegister(value)
+    if (not before_nmi_status and self.ctrl & ControlRegister.GENERATE_NMI
+        and self.status & StatusRegister.VBLANK_STARTED):
+      self.nmi_interrupt = True
+
+  def write_to_mask(self, value: 'u8'):
+    self.mask = MaskRegister(value)
+
+  def read_status(self) -> 'u8':
+    data = int(self.status)
+    self.status &= ~StatusRegister.VBLANK_STARTED
+    self.w_latch = False
+    return data
+
+  def write_to_oam_addr(self, value: 'u8'):
+    self.oam_addr = value
+
+  def write_to_oam_data(self, value: 'u8'):
+    self.oam_data[self.oam_addr] = value
+    self.oam_addr = (self.oam_addr + 1) & 0xff
+
+  def read_oam_data(self) -> 'u8':
+    return self.oam_data[self.oam_addr]
+
+  def write_to_scroll(self, value: 'u8'):
+    if not self.w_latch:
+      self.scroll_x = value
+    else:
+      self.scroll_y = value
+    self.w_latch = not self.w_latch
+
+  def write_to_ppu_addr(self, value: 'u8'):
+    if not self.w_latch:
+      self.addr = ((value & 0x3f) << 8) | (self.addr & 0xff)
+    else:
+      self.addr = (self.addr & 0xff00) | value
+    self.w_latch = not self.w_latch
+
+  def increment_vram_addr(self):
+    self.addr = (self.addr + self.vram_addr_increment()) & 0x3fff
+
+  def set_mirroring(self, mirroring: 'Mirroring'):
+    # resolved once here (and again whenever a mapper switches it), so a
+    # nametable access is just `nametables[(addr >> 10) & 3][addr & 0x3ff]`
+    self.mirroring = mirroring
+    pages = memoryview(self.vram)
+    self.nametables = [
+      pages[page * 0x400:(page + 1) * 0x400] for page in NAMETABLE_PAGES[mirroring]]
+
+  def write_to_data(self, value: 'u8'):
+    addr = self.addr
+    if addr in range(0, 0x2000):
+      report(Diag.CHR_WRITE, addr, '${:04x}', addr)
+    elif addr in range(0x2000, 0x3000):
+      self.nametables[(addr >> 10) & 3][addr & 0x3ff] = value
+    elif addr in range(0x3000, 0x3f00):
+      report(Diag.PPU_BAD_ADDR, addr, '${:04x}', addr)
+    else:
+      # $3F10/$3F14/$3F18/$3F1C are mirrors of $3F00/$3F04/$3F08/$3F0C
+      index = addr & 0x1f
+      if index & 0x13 == 0x10:
+        index -= 0x10
+      self.palette_table[index] = value
+    self.increment_vram_addr()
+
+  def read_data(self) -> 'u8':
+    addr = self.addr
+    self.increment_vram_addr()
+    if addr in range(0, 0x2000):
+      result = self.internal_data_buf
+      self.internal_data_buf = self.chr_rom[addr] if addr < len(self.chr_rom) else 0
+      return result
+    elif addr in range(0x2000, 0x3000):
+      result = self.internal_data_buf
+      self.internal_data_buf = self.nametables[(addr >> 10) & 3][addr & 0x3ff]
+      return result
+    elif addr in range(0x3000, 0x3f00):
+      report(Diag.PPU_BAD_ADDR, addr, '${:04x}', addr)
+      return 0
+    else:
+      index = addr & 0x1f
+      if index & 0x13 == 0x10:
+        index -= 0x10
+      return self.palette_table[index]
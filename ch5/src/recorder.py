@@ -0,0 +1,108 @@
+import pathlib
+import struct
+import zlib
+
+import numpy as np
+
+from sinks import FrameSink, scale
+
+#  Recording container
+#    header: MAGIC, width (u16), height (u16), channels (u8)
+#    chunk:  frame count (u32), compressed size (u32), zlib data
+#  A chunk holds up to `chunk_frames` frames, each XORed with the frame
+#  before it (the first frame against black), so an unchanged pixel is a
+#  zero byte. Only the previous frame and one chunk are kept in memory.
+
+MAGIC = b'NESREC\x00\x01'
+HEADER = struct.Struct('<HHB')
+CHUNK = struct.Struct('<II')
+
+
+class FrameRecorder(FrameSink):
+  def __init__(self, path: 'pathlib.Path', width: int, height: int,
+               channels: int = 3, chunk_frames: int = 60, level: int = 6):
+    self.file = open(path, 'wb')
+    self.file.write(MAGIC + HEADER.pack(width, height, channels))
+    self.shape = (height, width, channels)
+    self.previous = np.zeros(self.shape, dtype=np.uint8)
+    self.delta = np.zeros(self.shape, dtype=np.uint8)
+    self.chunk_frames = chunk_frames
+    self.level = level
+    self.frames = 0
+    self.chunk = []
+    self.chunk_count = 0
+    self.compressor = zlib.compressobj(level)
+
+  def write(self, rgb: 'np.ndarray', index: int = None):
+    np.bitwise_xor(rgb, self.previous, out=self.delta)
+    self.previous[...] = rgb
+    self.chunk.append(self.compressor.compress(self.delta.tobytes()))
+    self.chunk_count += 1
+    self.frames += 1
+    if self.chunk_count >= self.chunk_frames:
+      self.flush()
+
+  def flush(self):
+    if not self.chunk_count:
+      return
+    self.chunk.append(self.compressor.flush())
+    data = b''.join(self.chunk)
+    self.file.write(CHUNK.pack(self.chunk_count, len(data)))
+    self.file.write(data)
+    self.chunk = []
+    self.chunk_count = 0
+    self.compressor = zlib.compressobj(self.level)
+
+  def close(self):
+    if self.file.closed:
+      return
+    self.flush()
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def read_frames(path: 'pathlib.Path'):
+  # yields one reusable (h, w, c) array per frame
+  with open(path, 'rb') as f:
+    if f.read(len(MAGIC)) != MAGIC:
+      raise ValueError(f'{path} is not a frame recording')
+    width, height, channels = HEADER.unpack(f.read(HEADER.size))
+    shape = (height, width, channels)
+    size = width * height * channels
+    frame = np.zeros(shape, dtype=np.uint8)
+    while True:
+      head = f.read(CHUNK.size)
+      if len(head) < CHUNK.size:
+        return
+      count, length = CHUNK.unpack(head)
+      decompressor = zlib.decompressobj()
+      data = f.read(length)
+      for _ in range(count):
+        # inflate one frame at a time
+        raw = decompressor.decompress(data, size)
+        while len(raw) < size and decompressor.unconsumed_tail:
+          raw += decompressor.decompress(decompressor.unconsumed_tail, size - len(raw))
+        data = decompressor.unconsumed_tail
+        delta = np.frombuffer(raw, dtype=np.uint8).reshape(shape)
+        np.bitwise_xor(frame, delta, out=frame)
+        yield frame
+
+
+def convert(path: 'pathlib.Path', out: 'pathlib.Path', fps: float = 60,
+            factor: int = 1):
+  # offline: GIF for a .gif target, animated PNG for .png
+  # (PIL collects the frames of an animation before writing)
+  from PIL import Image
+  fmt = 'GIF' if pathlib.Path(out).suffix.lower() == '.gif' else 'PNG'
+  images = (Image.fromarray(scale(frame, factor).copy())
+            for frame in read_frames(path))
+  first = next(images, None)
+  if first is None:
+    raise ValueError(f'{path} has no frames')
+  first.save(out, fmt, save_all=True, append_images=images,
+             duration=round(1000 / fps), loop=0)
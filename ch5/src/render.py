@@ -0,0 +1,63 @@
+import numpy as np
+
+from frame import Frame
+from palette import SYSTEM_PALETTE
+from ppu import NesPPU, MaskRegister, StatusRegister
+import sprites
+
+_SYSTEM_RGB = np.array(SYSTEM_PALETTE, dtype=np.uint8)
+_COLS = np.arange(Frame.WIDTH, dtype=np.int32)[None, :]
+
+
+def nametable_bytes(ppu: 'NesPPU') -> 'np.ndarray':
+  # the four logical nametables $2000-$2FFF laid out flat (4 x 1 KiB)
+  return np.frombuffer(b''.join(ppu.nametables), dtype=np.uint8)
+
+
+def render_background(ppu: 'NesPPU', frame: 'Frame', start: 'usize', end: 'usize'):
+  palette = np.frombuffer(bytes(ppu.palette_table), dtype=np.uint8)
+  patterns = sprites.decode_patterns(bytes(ppu.chr_rom))
+  if not ppu.mask & MaskRegister.SHOW_BACKGROUND or len(patterns) == 0:
+    frame.data[start:end] = _SYSTEM_RGB[palette[0] & 0x3f]
+    frame.bg_opaque[start:end] = False
+    return
+
+  # --- scrolled coordinates over the 512x480 nametable plane
+  rows = np.arange(start, end, dtype=np.int32)[:, None]
+  base = int(ppu.ctrl) & 0b11
+  x = (_COLS + ppu.scroll_x + (base & 1) * 256) % 512
+  y = (rows + ppu.scroll_y + (base >> 1) * 240) % 480
+  table = (x >> 8) + (y >= 240) * 2
+  y = y % 240
+  tile_x = (x & 0xff) >> 3
+  tile_y = y >> 3
+
+  nametables = nametable_bytes(ppu)
+  offset = table * 0x400
+  tile = nametables[offset + tile_y * 32 + tile_x].astype(np.int32)
+  attr = nametables[offset + 0x3c0 + (tile_y >> 2) * 8 + (tile_x >> 2)]
+  palette_idx = (attr >> (((tile_y & 2) << 1) | (tile_x & 2))) & 0b11
+
+  bank = ppu.bknd_pattern_addr() >> 4
+  pixel = patterns[(bank + tile) % len(patterns), y & 7, x & 7]
+  opaque = pixel != 0
+  if not ppu.mask & MaskRegister.LEFTMOST_8PXL_BACKGROUND:
+    opaque[:, :8] = False
+  colour = np.where(opaque, palette[palette_idx * 4 + pixel], palette[0]) & 0x3f
+  frame.data[start:end] = _SYSTEM_RGB[colour]
+  frame.bg_opaque[start:end] = opaque
+
+
+class Renderer:
+  def __init__(self, frame: 'Frame' = None):
+    self.frame = frame if frame is not None else Frame()
+
+  def __call__(self, ppu: 'NesPPU', start: 'usize', end: 'usize'):
+    # render scanlines [start, end) in one go, report sprite 0 hit
+    render_background(ppu, self.frame, start, end)
+    table = sprites.evaluate_sprites(ppu)
+    hit = None
+    if not ppu.status & StatusRegister.SPRITE_ZERO_HIT:
+      hit = sprites.sprite_zero_hit(ppu, self.frame, table, start, end)
+    sprites.render_sprites(ppu, self.frame, table, start, end)
+    return hit
@@ -0,0 +1,63 @@
+import heapq
+from typing import NamedTuple
+
+NEVER: 'usize' = 1 << 62
+
+
+class _Event(NamedTuple):
+  PPU_SYNC: int = 1  # vblank start / frame end, raises NMI when enabled
+  MAPPER_IRQ: int = 2  # cartridge IRQ counters, see Bus.schedule_mapper_irq
+  APU_FRAME_IRQ: int = 3
+  DMA_STALL: int = 4  # data: stolen CPU cycles
+  INTERRUPT_POLL: int = 5  # re-check the IRQ line after I flag clears
+
+
+Event = _Event()
+
+
+class Scheduler:
+  #  (cycle, seq, event, generation, data) entries on a heap. Cancelling
+  #  an event bumps its generation so stale entries are dropped on pop.
+  def __init__(self):
+    self.queue: list = []
+    self.seq: 'usize' = 0
+    self.generation: dict = {}
+    self.handlers: dict = {}
+    self.next_cycle: 'usize' = NEVER
+
+  def schedule(self, cycle: 'usize', event: 'Event', data=None):
+    self.seq += 1
+    heapq.heappush(
+      self.queue, (cycle, self.seq, event, self.generation.get(event, 0), data))
+    if cycle < self.next_cycle:
+      self.next_cycle = cycle
+
+  def cancel(self, event: 'Event'):
+    self.generation[event] = self.generation.get(event, 0) + 1
+
+  def reschedule(self, cycle: 'usize', event: 'Event', data=None):
+    self.cancel(event)
+    self.schedule(cycle, event, data)
+
+  def pending(self, event: 'Event') -> bool:
+    gen = self.generation.get(event, 0)
+    return any(e[2] == event and e[3] == gen for e in self.queue)
+
+  def run_until(self, cycle: 'usize'):
+    # dispatch every live event due at or before `cycle`, in cycle order
+    queue = self.queue
+    while queue and queue[0][0] <= cycle:
+      at, _, event, gen, data = heapq.heappop(queue)
+      if gen != self.generation.get(event, 0):
+        continue
+      self.handlers[event](at, data)
+    self.next_cycle = self.peek()
+
+  def peek(self) -> 'usize':
+    queue = self.queue
+    while queue:
+      _, _, event, gen, _ = queue[0]
+      if gen == self.generation.get(event, 0):
+        return queue[0][0]
+      heapq.heappop(queue)
+    return NEVER
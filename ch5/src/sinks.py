@@ -0,0 +1,161 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import pathlib
+import struct
+
+import numpy as np
+
+#  Frame sinks all read the same shared (h, w, 3) uint8 RGB buffer. Only
+#  sinks that really need a compressed image encode, and encoding can run
+#  on a worker thread (the buffer is copied before it is handed over).
+
+
+def scale(rgb: 'np.ndarray', factor: int) -> 'np.ndarray':
+  # nearest neighbour, keeps pixel art sharp
+  if factor == 1:
+    return rgb
+  return rgb.repeat(factor, axis=0).repeat(factor, axis=1)
+
+
+def encode_png(rgb: 'np.ndarray', compress_level: int = 1) -> bytes:
+  from PIL import Image
+  with BytesIO() as bIO:
+    Image.fromarray(rgb).save(bIO, 'png', compress_level=compress_level)
+    return bIO.getvalue()
+
+
+def encode_bmp(rgb: 'np.ndarray') -> bytes:
+  # uncompressed 24 bit BMP: no zlib, no PIL, just a header and BGR rows
+  height, width, _ = rgb.shape
+  row = width * 3
+  pad = (4 - row % 4) % 4
+  pixels = np.zeros((height, row + pad), dtype=np.uint8)
+  pixels[:, :row] = rgb[::-1, :, ::-1].reshape(height, row)
+  body = pixels.tobytes()
+  header = struct.pack('<2sIHHI', b'BM', 54 + len(body), 0, 0, 54)
+  info = struct.pack('<IiiHHIIiiII', 40, width, height, 1, 24, 0, len(body),
+                     2835, 2835, 0, 0)
+  return header + info + body
+
+
+def encode_ppm(rgb: 'np.ndarray') -> bytes:
+  height, width, _ = rgb.shape
+  return b'P6 %d %d 255\n' % (width, height) + rgb.tobytes()
+
+
+class FrameSink:
+  def write(self, rgb: 'np.ndarray', index: int):
+    pass
+
+  def close(self):
+    pass
+
+
+class RawSink(FrameSink):
+  # no copy and no encoding: consumers read the shared buffer directly
+  def __init__(self, callback=None):
+    self.rgb = None
+    self.index = -1
+    self.callback = callback
+
+  def write(self, rgb: 'np.ndarray', index: int):
+    self.rgb = rgb
+    self.index = index
+    if self.callback is not None:
+      self.callback(rgb, index)
+
+  def tobytes(self) -> bytes:
+    return b'' if self.rgb is None else self.rgb.tobytes()
+
+
+class PngSnapshotSink(FrameSink):
+  # remembers the buffer; encodes only when a snapshot is asked for
+  def __init__(self, factor: int = 1):
+    self.rgb = None
+    self.factor = factor
+
+  def write(self, rgb: 'np.ndarray', index: int):
+    self.rgb = rgb
+
+  def snapshot(self, path: 'pathlib.Path' = None) -> bytes:
+    if self.rgb is None:
+      return b''
+    data = encode_png(scale(self.rgb, self.factor))
+    if path is not None:
+      pathlib.Path(path).write_bytes(data)
+    return data
+
+
+class FileSequenceSink(FrameSink):
+  def __init__(self, directory: 'pathlib.Path', fmt: str = 'png',
+               every: int = 1, factor: int = 1, workers: int = 1):
+    self.directory = pathlib.Path(directory)
+    self.directory.mkdir(parents=True, exist_ok=True)
+    self.fmt = fmt
+    self.every = every
+    self.factor = factor
+    self.encode = {'png': encode_png, 'bmp': encode_bmp, 'ppm': encode_ppm}[fmt]
+    self.executor = ThreadPoolExecutor(workers) if workers else None
+
+  def save(self, rgb: 'np.ndarray', index: int):
+    path = self.directory / f'frame_{index:06d}.{self.fmt}'
+    path.write_bytes(self.encode(scale(rgb, self.factor)))
+
+  def write(self, rgb: 'np.ndarray', index: int):
+    if index % self.every:
+      return
+    if self.executor is None:
+      self.save(rgb, index)
+    else:
+      self.executor.submit(self.save, rgb.copy(), index)
+
+  def close(self):
+    if self.executor is not None:
+      self.executor.shutdown(wait=True)
+
+
+class PythonistaSink(FrameSink):
+  #  ui.Image.from_data wants encoded bytes; an uncompressed BMP avoids the
+  #  PNG encode/decode round trip. With offload the image is built on a
+  #  single worker thread, so frames still land in order.
+  def __init__(self, image_view: 'ui.ImageView', factor: int = 10,
+               offload: bool = False):
+    import ui
+    self.ui = ui
+    self.image_view = image_view
+    self.factor = factor
+    self.executor = ThreadPoolExecutor(1) if offload else None
+
+  def show(self, rgb: 'np.ndarray'):
+    self.image_view.image = self.ui.Image.from_data(
+      encode_bmp(scale(rgb, self.factor)))
+
+  def write(self, rgb: 'np.ndarray', index: int):
+    if self.executor is None:
+      self.show(rgb)
+    else:
+      self.executor.submit(self.show, rgb.copy())
+
+  def close(self):
+    if self.executor is not None:
+      self.executor.shutdown(wait=True)
+
+
+class SinkPipeline:
+  def __init__(self, rgb: 'np.ndarray', sinks: 'Vec<FrameSink>' = ()):
+    self.rgb = rgb
+    self.sinks = list(sinks)
+    self.index = 0
+
+  def add(self, sink: 'FrameSink') -> 'FrameSink':
+    self.sinks.append(sink)
+    return sink
+
+  def push(self):
+    for sink in self.sinks:
+      sink.write(self.rgb, self.index)
+    self.index += 1
+
+  def close(self):
+    for sink in self.sinks:
+      sink.close()
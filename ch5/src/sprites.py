@@ -0,0 +1,150 @@
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+
+from frame import Frame
+from palette import SYSTEM_PALETTE
+from ppu import NesPPU, MaskRegister, StatusRegister
+
+#  OAM entry (4 bytes x 64)
+#    0: Y position of top of sprite (drawn from scanline y + 1)
+#    1: tile index
+#    2: attributes
+#       7 6 5 4 3 2 1 0
+#       V H P . . . p p
+#       | | |       +-+--- palette (4 to 7)
+#       | | +------------- priority (0: in front of background, 1: behind)
+#       | +--------------- flip horizontally
+#       +----------------- flip vertically
+#    3: X position of left side of sprite
+
+SPRITE_COUNT: 'usize' = 64
+SPRITES_PER_LINE: 'usize' = 8
+PRIORITY_BEHIND: 'u8' = 0b0010_0000
+FLIP_HORIZONTAL: 'u8' = 0b0100_0000
+FLIP_VERTICAL: 'u8' = 0b1000_0000
+
+_SYSTEM_RGB = np.array(SYSTEM_PALETTE, dtype=np.uint8)
+_LINES = np.arange(Frame.HEIGHT, dtype=np.int16)[:, None]
+
+
+class SpriteTable(NamedTuple):
+  y: 'np.ndarray'  # top scanline (OAM y + 1)
+  tile: 'np.ndarray'
+  attr: 'np.ndarray'
+  x: 'np.ndarray'
+  height: int
+  pixels: 'np.ndarray'  # (64, height, 8) colour indices 0..3, already flipped
+  visible: 'np.ndarray'  # (240, 64) sprite is drawn on that scanline
+  overflow: 'np.ndarray'  # (240,) more than 8 sprites on that scanline
+
+
+@lru_cache(maxsize=4)
+def decode_patterns(chr_rom: bytes) -> 'np.ndarray':
+  # (tiles, 8, 8) of 2 bit colour indices, bit planes combined
+  if len(chr_rom) < 16:
+    return np.zeros((0, 8, 8), dtype=np.uint8)
+  planes = np.frombuffer(chr_rom, dtype=np.uint8, count=len(chr_rom) & ~0xf)
+  bits = np.unpackbits(planes.reshape(-1, 2, 8), axis=2).reshape(-1, 2, 8, 8)
+  return bits[:, 0] | (bits[:, 1] << 1)
+
+
+def evaluate_sprites(ppu: 'NesPPU') -> 'SpriteTable':
+  oam = np.frombuffer(bytes(ppu.oam_data), dtype=np.uint8).reshape(SPRITE_COUNT, 4)
+  y = oam[:, 0].astype(np.int16) + 1
+  tile = oam[:, 1]
+  attr = oam[:, 2]
+  x = oam[:, 3].astype(np.int16)
+  height = ppu.sprite_size()
+
+  # --- 8 sprites per scanline, lower OAM index wins
+  in_range = (_LINES >= y) & (_LINES < y + height)
+  rank = np.cumsum(in_range, axis=1)
+  visible = in_range & (rank <= SPRITES_PER_LINE)
+  overflow = rank[:, -1] > SPRITES_PER_LINE
+
+  patterns = decode_patterns(bytes(ppu.chr_rom))
+  if len(patterns) == 0:
+    pixels = np.zeros((SPRITE_COUNT, height, 8), dtype=np.uint8)
+  elif height == 8:
+    bank = ppu.sprt_pattern_addr() >> 4
+    pixels = np.take(patterns, bank + tile.astype(np.int32), axis=0, mode='wrap')
+  else:
+    # --- 8x16: bit 0 of the tile index selects the pattern table
+    top = (tile & 1).astype(np.int32) * 256 + (tile & 0xfe)
+    pixels = np.concatenate(
+      (np.take(patterns, top, axis=0, mode='wrap'),
+       np.take(patterns, top + 1, axis=0, mode='wrap')),
+      axis=1)
+
+  flip_h = (attr & FLIP_HORIZONTAL) != 0
+  flip_v = (attr & FLIP_VERTICAL) != 0
+  pixels = np.where(flip_h[:, None, None], pixels[:, :, ::-1], pixels)
+  pixels = np.where(flip_v[:, None, None], pixels[:, ::-1, :], pixels)
+  return SpriteTable(y, tile, attr, x, height, pixels, visible, overflow)
+
+
+def _sprite_pixels(table: 'SpriteTable', start: 'usize', end: 'usize'):
+  # screen coordinates of every opaque, evaluated sprite pixel
+  height = table.height
+  index = np.broadcast_to(
+    np.arange(SPRITE_COUNT, dtype=np.int16)[:, None, None], table.pixels.shape)
+  rows = table.y[:, None, None] + np.arange(height, dtype=np.int16)[None, :, None]
+  cols = table.x[:, None, None] + np.arange(8, dtype=np.int16)[None, None, :]
+  rows = np.broadcast_to(rows, table.pixels.shape)
+  cols = np.broadcast_to(cols, table.pixels.shape)
+  keep = (table.pixels != 0) & (rows >= start) & (rows < end) & (cols < Frame.WIDTH)
+  rows, cols, index = rows[keep], cols[keep], index[keep]
+  on_line = table.visible[rows, index]
+  return (rows[on_line], cols[on_line], index[on_line],
+          table.pixels[keep][on_line])
+
+
+def sprite_zero_hit(ppu: 'NesPPU', frame: 'Frame', table: 'SpriteTable' = None,
+                    start: 'usize' = 0, end: 'usize' = Frame.HEIGHT):
+  # first (scanline, x) in raster order where sprite 0 overlaps background
+  mask = ppu.mask
+  if not (mask & MaskRegister.SHOW_BACKGROUND and mask & MaskRegister.SHOW_SPRITES):
+    return None
+  if table is None:
+    table = evaluate_sprites(ppu)
+  rows, cols, index, _ = _sprite_pixels(table, start, end)
+  hit = (index == 0) & (cols != 255) & frame.bg_opaque[rows, cols]
+  if not (mask & MaskRegister.LEFTMOST_8PXL_BACKGROUND
+          and mask & MaskRegister.LEFTMOST_8PXL_SPRITE):
+    hit &= cols >= 8
+  if not hit.any():
+    return None
+  first = np.argmin(rows[hit].astype(np.int32) * Frame.WIDTH + cols[hit])
+  return int(rows[hit][first]), int(cols[hit][first])
+
+
+def render_sprites(ppu: 'NesPPU', frame: 'Frame', table: 'SpriteTable' = None,
+                   start: 'usize' = 0, end: 'usize' = Frame.HEIGHT) -> 'SpriteTable':
+  if table is None:
+    table = evaluate_sprites(ppu)
+  if not ppu.mask & MaskRegister.SHOW_SPRITES:
+    return table
+  rows, cols, index, values = _sprite_pixels(table, start, end)
+  if not ppu.mask & MaskRegister.LEFTMOST_8PXL_SPRITE:
+    left = cols >= 8
+    rows, cols, index, values = rows[left], cols[left], index[left], values[left]
+
+  # --- front-most (lowest index) opaque sprite pixel owns the screen pixel
+  owner = np.full((Frame.HEIGHT, Frame.WIDTH), SPRITE_COUNT, dtype=np.int16)
+  np.minimum.at(owner, (rows, cols), index)
+  won = owner[rows, cols] == index
+  rows, cols, index, values = rows[won], cols[won], index[won], values[won]
+
+  # --- a behind-background owner hides lower priority sprites too
+  palette = np.frombuffer(bytes(ppu.palette_table), dtype=np.uint8)
+  behind = (table.attr[index] & PRIORITY_BEHIND) != 0
+  draw = ~(behind & frame.bg_opaque[rows, cols])
+  rows, cols, index, values = rows[draw], cols[draw], index[draw], values[draw]
+  colour = palette[0x10 + (table.attr[index] & 0b11) * 4 + values] & 0x3f
+  frame.data[rows, cols] = _SYSTEM_RGB[colour]
+
+  if table.overflow[start:end].any():
+    ppu.status |= StatusRegister.SPRITE_OVERFLOW
+  return table
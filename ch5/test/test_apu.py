@@ -0,0 +1,160 @@
+import sys
+import pathlib
+
+import numpy as np
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU
+from bus import Bus
+from cartridge import Rom
+from scheduler import Event
+import apu
+from apu import Apu, Resampler, CPU_HZ, NATIVE_RATE
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+FRAME = 29781
+
+
+def dominant(samples: 'np.ndarray', rate: float) -> float:
+  spectrum = np.abs(np.fft.rfft(samples - samples.mean()))
+  return np.fft.rfftfreq(len(samples), 1 / rate)[spectrum.argmax()]
+
+
+def play_a440(unit: 'Apu', cycle: int = 0):
+  timer = round(CPU_HZ / (16 * 440)) - 1
+  unit.write(cycle, 0x4015, 0b0000_0001)
+  unit.write(cycle, 0x4000, 0b1011_1111)  # 50% duty, halt, constant volume 15
+  unit.write(cycle, 0x4002, timer & 0xff)
+  unit.write(cycle, 0x4003, timer >> 8)
+
+
+def test_pulse_pitch_at_native_and_output_rate():
+  blocks = []
+  unit = Apu()
+  # without resampling the block is a view of the APU's own buffer
+  unit.enable_output(lambda block: blocks.append(block.copy()), sample_rate=None)
+  play_a440(unit)
+  for n in range(1, 11):
+    unit.end_frame(n * FRAME)
+  native = np.concatenate(blocks)
+  assert abs(dominant(native, NATIVE_RATE) - 440) < 5
+
+  blocks.clear()
+  unit = Apu()
+  unit.enable_output(blocks.append, sample_rate=48000)
+  play_a440(unit)
+  for n in range(1, 11):
+    unit.end_frame(n * FRAME)
+  out = np.concatenate(blocks)
+  assert out.dtype == np.float32
+  assert len(out) == pytest.approx(10 * FRAME / CPU_HZ * 48000, abs=2)
+  assert abs(dominant(out, 48000) - 440) < 5
+  assert 0 <= out.min() and out.max() < 1
+
+
+def test_writes_are_logged_until_replayed():
+  unit = Apu()
+  play_a440(unit, 100)
+  assert len(unit.log) == 4 and unit.pulse1.length == 0
+  assert unit.read_status(50) == 0  # before the writes
+  assert unit.read_status(200) & 1
+  assert not unit.log
+
+
+def test_length_counter_expires_without_output():
+  unit = Apu()
+  unit.write(0, 0x4015, 0b0000_1111)
+  unit.write(0, 0x400c, 0b0000_1111)  # noise, length counter running
+  unit.write(0, 0x400f, 0b0001_1000)  # length index 3 -> 2 half frames
+  assert unit.read_status(10) == 0b1000
+  unit.end_frame(FRAME)
+  assert unit.read_status(FRAME) == 0b1000  # one half frame clock so far
+  unit.end_frame(2 * FRAME)
+  assert unit.read_status(2 * FRAME) == 0
+
+
+def test_frame_changes_follow_write_cycles():
+  blocks = []
+  unit = Apu()
+  unit.enable_output(blocks.append, sample_rate=None)
+  unit.write(FRAME // 2, 0x4011, 0x7f)  # DMC direct load halfway through
+  samples = unit.end_frame(FRAME)
+  half = len(samples) // 2
+  # the idle triangle holds step 0 (level 15)
+  assert (samples[:half - 2] == samples[0]).all()
+  assert (samples[half + 2:] == samples[-1]).all() and samples[-1] > samples[0]
+
+
+def test_dmc_plays_sample_bytes():
+  reads = []
+  unit = Apu(lambda addr: reads.append(addr) or 0xff)
+  unit.write(0, 0x4010, 0x0f)  # fastest rate, 54 cycles per bit
+  unit.write(0, 0x4012, 0x00)  # $c000
+  unit.write(0, 0x4013, 0x00)  # 1 byte
+  unit.write(0, 0x4015, 0x10)
+  assert unit.read_status(1) & 0x10
+  # the timer only picks up the new rate after the power-on period
+  unit.end_frame(428 + 54 * 24)
+  assert reads == [0xc000]
+  assert unit.dmc.level == 16  # eight 1 bits, +2 each
+  assert not unit.read_status(428 + 54 * 24) & 0x10
+
+
+def test_resampler_blocks_match_one_pass():
+  rate = NATIVE_RATE
+  signal = np.sin(np.arange(40000) * 2 * np.pi * 300 / rate).astype(np.float32)
+  whole = Resampler(rate, 44100).process(signal)
+  chunked = Resampler(rate, 44100)
+  parts = np.concatenate([chunked.process(signal[i:i + 3723])
+                          for i in range(0, len(signal), 3723)])
+  assert len(parts) == len(whole)
+  assert np.allclose(parts, whole, atol=1e-5)
+
+
+def test_bus_routes_registers_and_frame_irq():
+  bus = Bus(Rom(SNAKE.read_bytes()))
+  CPU(bus)
+  bus.mem_write(0x4015, 0b0000_0001)
+  bus.mem_write(0x4003, 0b0000_1000)
+  assert bus.apu.log[-1] == (bus.cycles, 0x4003, 0b0000_1000)
+  assert bus.mem_read(0x4015) & 1
+  bus.mem_write(0x4017, 0)  # 4-step mode, IRQ enabled
+  bus.tick(255)
+  assert not bus.irq_sources
+  while bus.cycles < 29830:
+    bus.tick(255)
+  assert bus.irq_sources & (1 << Event.APU_FRAME_IRQ)
+  assert bus.mem_read(0x4015) & 0x40
+  assert not bus.irq_sources
+  assert not bus.mem_read(0x4015) & 0x40
+  bus.mem_write(0x4017, 0x40)  # inhibit
+  assert not bus.scheduler.pending(Event.APU_FRAME_IRQ)
+
+
+def test_frame_irq_inhibit_releases_the_irq_line():
+  # LDA #$40 / STA $4017 without reading $4015 first
+  bus = Bus(Rom(SNAKE.read_bytes()))
+  CPU(bus)
+  bus.mem_write(0x4017, 0)
+  while not bus.irq_sources:
+    bus.tick(255)
+  bus.mem_write(0x4017, 0x40)
+  assert not bus.irq_sources
+  assert not bus.apu.frame_interrupt
+  assert not bus.scheduler.pending(Event.APU_FRAME_IRQ)
+
+
+def test_frame_end_synthesizes_from_the_bus():
+  bus = Bus(Rom(SNAKE.read_bytes()))
+  blocks = []
+  bus.apu.enable_output(blocks.append)
+  play_a440(bus.apu, bus.cycles)
+  while bus.ppu.frame_count < 3:
+    bus.tick(100)
+  assert len(blocks) == 3
+  assert all(abs(len(b) - 800) <= 2 for b in blocks)
+
+
+if __name__ == '__main__':
+  pytest.main()
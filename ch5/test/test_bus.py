@@ -0,0 +1,102 @@
+import sys
+import pathlib
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU
+from bus import Bus
+from cartridge import Rom
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+def new_bus() -> 'Bus':
+  return Bus(Rom(SNAKE.read_bytes()))
+
+
+def test_write_block_wraps_ram_mirrors():
+  bus = new_bus()
+  bus.write_block(0x07fe, bytes([1, 2, 3, 4]))
+  assert bus.cpu_vram[0x7fe:0x800] == bytes([1, 2])
+  assert bus.cpu_vram[0:2] == bytes([3, 4])
+  assert bus.read_block(0x0ffe, 4) == bytes([1, 2, 3, 4])
+  assert bus.read_block(0x1ffe, 4)[:2] == bytes([1, 2])
+
+
+def test_fused_u16_matches_byte_reads():
+  bus = new_bus()
+  bus.write_block(0x0000, bytes(range(256)) * 8)
+  for pos in (0x0000, 0x0010, 0x07fe, 0x07ff, 0x0fff, 0x1ffe, 0x1fff,
+              0x8000, 0xbfff, 0xc000, 0xfffc, 0xfffe, 0xffff):
+    expected = bus.mem_read(pos) | (bus.mem_read((pos + 1) & 0xffff) << 8)
+    assert bus.mem_read_u16(pos) == expected, hex(pos)
+
+
+def test_fused_u16_write_wraps_and_marks_dirty():
+  bus = new_bus()
+  bus.mem_write_u16(0x0ffe, 0xbeef)
+  assert bus.cpu_vram[0x7fe:0x800] == bytes([0xef, 0xbe])
+  bus.mem_write_u16(0x07ff, 0x1234)
+  assert bus.cpu_vram[0x7ff] == 0x34 and bus.cpu_vram[0] == 0x12
+  screen = bus.watch(0x200, 0x600)
+  seen = bus.generation
+  bus.mem_write_u16(0x021f, 0x0101)  # straddles two rows
+  assert bus.dirty_rows(screen, seen) == [0, 1]
+
+
+def test_read_block_prg_rom():
+  bus = new_bus()
+  assert bus.read_block(0xfffa, 6) == bytes(bus.rom.prg_rom[-6:])
+  assert bus.read_block(0x8600, 3) == bytes(bus.mem_read(0x8600 + i) for i in range(3))
+
+
+def test_oam_dma_copies_page_and_stalls():
+  bus = new_bus()
+  bus.write_block(0x0200, bytes(range(256)))
+  bus.mem_write(0x2003, 0x10)
+  before = bus.cycles
+  bus.mem_write(0x4014, 0x02)
+  assert bus.ppu.oam_data[0x10] == 0
+  assert bus.ppu.oam_data[0xff] == 0xef
+  assert bus.ppu.oam_data[0x00] == 0xf0
+  assert bus.tick(0)  # the stall is applied by the scheduler
+  assert bus.cycles - before == 513
+  bus.mem_write(0x4014, 0x02)  # starts on an odd cycle
+  bus.tick(0)
+  assert bus.cycles - before == 513 + 514
+
+
+def test_dirty_rows_for_watched_range():
+  bus = new_bus()
+  screen = bus.watch(0x200, 0x600)
+  seen = bus.generation
+  bus.mem_write(0x0010, 1)  # zero page is not watched
+  assert not bus.changed_since(screen, seen)
+  bus.mem_write(0x0200 + 32 * 3 + 5, 1)
+  bus.mem_write(0x0a00 + 32 * 7, 2)  # mirror of 0x0200
+  assert bus.changed_since(screen, seen)
+  assert bus.dirty_rows(screen, seen) == [3, 7]
+  seen = bus.generation
+  bus.mem_write(0x0200 + 32 * 3 + 5, 1)  # same value
+  assert not bus.changed_since(screen, seen)
+  bus.write_block(0x05e0, bytes([9] * 32))
+  assert bus.dirty_rows(screen, seen) == [31]
+
+
+def test_overlapping_watches_both_see_writes():
+  bus = new_bus()
+  screen = bus.watch(0x200, 0x600)
+  recorder = bus.watch(0x400, 0x800)
+  seen = bus.generation
+  bus.mem_write(0x0410, 1)
+  assert bus.changed_since(screen, seen) and bus.changed_since(recorder, seen)
+  assert bus.dirty_rows(screen, seen) == [16]
+  assert bus.dirty_rows(recorder, seen) == [0]
+  seen = bus.generation
+  bus.mem_write(0x0210, 1)
+  assert bus.changed_since(screen, seen) and not bus.changed_since(recorder, seen)
+
+
+if __name__ == '__main__':
+  pytest.main()
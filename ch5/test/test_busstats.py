@@ -0,0 +1,71 @@
+import sys
+import pathlib
+import random
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU, HANDLERS, RAM_HANDLERS
+from bus import Bus
+from cartridge import Rom
+from busstats import BusStats
+from debugger import Debugger
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+def test_counts_regions_and_uninstalls():
+  cpu = CPU(Bus(Rom(SNAKE.read_bytes())))
+  cpu.reset()
+  rng = random.Random(1)
+  with BusStats(cpu.bus) as stats:
+    assert 'mem_read' in vars(cpu.bus)
+    for _ in range(2000):
+      cpu.mem_write(0xfe, rng.randint(1, 255))
+      cpu.run_with_callback()
+    cpu.mem_read(0x0810)
+  assert 'mem_read' not in vars(cpu.bus) and 'mem_write' not in vars(cpu.bus)
+  regions = stats.regions()
+  assert regions['prg rom'][0] > regions['zero page'][0] > 0
+  assert regions['prg rom'][1] == 0
+  assert regions['stack'][1] > 0
+  assert regions['ram mirrors'] == (1, 0)
+  assert stats.writes[0xfe] == 2000
+  assert sum(r for r, _ in stats.pages()) == sum(stats.reads)
+  addr, reads, writes = stats.hottest(1)[0]
+  assert reads + writes == max(r + w for r, w in zip(stats.reads, stats.writes))
+  assert 'zero page' in stats.summary()
+
+
+def test_wraps_existing_hooks():
+  bus = Bus(Rom(SNAKE.read_bytes()))
+  seen = []
+  bus.mem_write = lambda addr, data: seen.append(addr)
+  stats = BusStats(bus).install()
+  bus.mem_write(0x10, 1)
+  stats.uninstall()
+  assert seen == [0x10] and stats.writes[0x10] == 1
+  bus.mem_write(0x11, 1)
+  assert seen == [0x10, 0x11]
+
+
+def test_debugger_watchpoint_survives_stats():
+  cpu = CPU(Bus(Rom(SNAKE.read_bytes())))
+  cpu.reset()
+  debugger = Debugger(cpu)
+  debugger.add_watchpoint(0x00, 0xff)
+  BusStats(cpu.bus).install().uninstall()
+  assert cpu.handlers is HANDLERS
+  for _ in range(100):
+    if cpu.run_with_callback():
+      break
+  assert debugger.hits and debugger.hits[-1].addr <= 0xff
+  stats = BusStats(cpu.bus).install()
+  debugger.clear()
+  assert cpu.handlers is HANDLERS  # stats still count zero page
+  stats.uninstall()
+  assert cpu.handlers is RAM_HANDLERS and cpu.ram_fast_path_disabled == 0
+
+
+if __name__ == '__main__':
+  pytest.main()
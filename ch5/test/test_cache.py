@@ -0,0 +1,79 @@
+import sys
+import pathlib
+import os
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU
+from cartridge import Rom
+from cache import CodeCache
+import codegen
+import disasm
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+def test_roundtrip_and_integrity(tmp_path):
+  cache = CodeCache(tmp_path)
+  assert cache.get('x', 'abc') is None
+  assert cache.put('x', 'abc', {'a': [1, 2, b'3']})
+  assert cache.get('x', 'abc') == {'a': [1, 2, b'3']}
+  path = cache.path('x', 'abc')
+  raw = bytearray(path.read_bytes())
+  raw[-1] ^= 0xff
+  path.write_bytes(bytes(raw))
+  assert cache.get('x', 'abc') is None
+  assert not path.exists()
+  assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_evicts_least_recently_used(tmp_path):
+  cache = CodeCache(tmp_path, max_bytes=3200)
+  for n, key in enumerate(('a', 'b', 'c')):
+    cache.put('blob', key, bytes(1000))
+    os.utime(cache.path('blob', key), ns=(n * 10**9, n * 10**9))
+  # 'a' is the oldest; reading it makes 'b' the one to go
+  assert cache.get('blob', 'a') is not None
+  cache.put('blob', 'd', bytes(1000))
+  assert [cache.get('blob', k) is not None for k in 'abcd'] == [True, False, True, True]
+  assert cache.size() <= 3200
+
+
+def test_code_map_survives_the_cache(tmp_path):
+  prg = Rom(SNAKE.read_bytes()).prg_rom
+  fresh = disasm.analyze(prg)
+  disasm._cache.clear()
+  disasm.code_map(prg, CodeCache(tmp_path))
+  disasm._cache.clear()
+  cached = disasm.code_map(prg, CodeCache(tmp_path))
+  assert cached.instructions == fresh.instructions
+  assert cached.blocks == fresh.blocks
+  assert cached.flags == fresh.flags
+
+
+def test_code_map_key_tracks_the_analyzer(tmp_path, monkeypatch):
+  prg = Rom(SNAKE.read_bytes()).prg_rom
+  cache = CodeCache(tmp_path)
+  disasm._cache.clear()
+  disasm.code_map(prg, cache)
+  key = disasm.cache_key(disasm.code_map(prg).sha1)
+  assert cache.get('disasm', key) is not None
+  monkeypatch.setattr(disasm, 'VERSION', disasm.VERSION + 1)
+  assert disasm.cache_key(disasm.code_map(prg).sha1) != key
+  disasm._cache.clear()
+  disasm.code_map(prg, cache)
+  assert cache.misses == 2 and len(cache.entries()) == 2
+
+
+def test_compiled_handlers_roundtrip(tmp_path):
+  cache = CodeCache(tmp_path)
+  code = compile(codegen.generate(), '<_cpu_ops>', 'exec')
+  cache.put('ops', codegen.cache_key(), code)
+  namespace = {}
+  exec(cache.get('ops', codegen.cache_key()), namespace)
+  assert len(namespace['HANDLERS']) == 256
+
+
+if __name__ == '__main__':
+  pytest.main()
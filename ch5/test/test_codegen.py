@@ -0,0 +1,112 @@
+import sys
+import pathlib
+import random
+import subprocess
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU, CpuFlags, HANDLERS, RAM_HANDLERS
+from bus import Bus
+from cartridge import Rom
+import codegen
+import opcodes
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+def state(cpu: 'CPU') -> tuple:
+  return (cpu.register_a, cpu.register_x, cpu.register_y, cpu.stack_pointer,
+          cpu.program_counter, int(cpu.status.bits), bytes(cpu.bus.cpu_vram),
+          cpu.bus.cycles)
+
+
+def test_every_official_opcode_has_a_handler():
+  names = {codegen.handler_name(op) for op in opcodes.CPU_OPS_CODES}
+  assert len(names) == len(opcodes.CPU_OPS_CODES)
+  assert {'lda_abs_x', 'adc_ind_y', 'asl_acc', 'jmp_ind'} <= names
+  assert len(HANDLERS) == 256
+  assert HANDLERS[0x71].__name__ == 'adc_ind_y'
+  assert HANDLERS[0x02].__name__ == 'unknown'
+  assert RAM_HANDLERS[0xb5].__name__ == 'lda_zp_x_ram'
+  assert RAM_HANDLERS[0x20].__name__ == 'jsr_ram'
+  assert RAM_HANDLERS[0xbd] is HANDLERS[0xbd]
+
+
+@pytest.mark.parametrize('module', ['opcodes', 'codegen', 'disasm', 'bus', 'cpu'])
+def test_module_imports_on_its_own(module):
+  src = str(pathlib.Path.cwd().parent / 'src')
+  subprocess.run([sys.executable, '-c', f'import {module}'], cwd=src, check=True)
+
+
+def test_generated_module_is_cached(tmp_path):
+  path = tmp_path / '_cpu_ops.py'
+  handlers, ram_handlers = codegen.load_handlers(path)
+  assert path.exists() and len(handlers) == len(ram_handlers) == 256
+  mtime = path.stat().st_mtime_ns
+  codegen.load_handlers(path)
+  assert path.stat().st_mtime_ns == mtime
+
+
+def test_build_replaces_the_module_atomically(tmp_path, monkeypatch):
+  path = tmp_path / '_cpu_ops.py'
+  path.write_text('# an older build\n')
+
+  def fail(src, dst):
+    raise OSError('disk full')
+  monkeypatch.setattr(codegen.os, 'replace', fail)
+  with pytest.raises(OSError):
+    codegen.build(path)
+  assert path.read_text() == '# an older build\n'
+  assert list(tmp_path.iterdir()) == [path]
+  monkeypatch.undo()
+  codegen.build(path)
+  assert codegen._is_current(path) and list(tmp_path.iterdir()) == [path]
+
+
+def test_handlers_match_reference_on_snake():
+  nes = SNAKE.read_bytes()
+  fast, reference = CPU(Bus(Rom(nes))), CPU(Bus(Rom(nes)))
+  fast.reset()
+  reference.reset()
+  rng = random.Random(1)
+  for _ in range(5000):
+    value = rng.randint(1, 255)
+    fast.mem_write(0xfe, value)
+    reference.mem_write(0xfe, value)
+    fast.run_with_callback()
+    reference.step_reference()
+    assert state(fast) == state(reference)
+
+
+def test_ram_fast_path_keeps_dirty_tracking():
+  cpu = CPU(Bus(Rom(SNAKE.read_bytes())))
+  cpu.reset()
+  region = cpu.bus.watch(0x0000, 0x00ff)
+  generation = cpu.bus.generation
+  # LDA #$07; STA $41
+  cpu.bus.cpu_vram[0x300:0x304] = [0xa9, 0x07, 0x85, 0x41]
+  cpu.program_counter = 0x0300
+  cpu.run_with_callback()
+  cpu.run_with_callback()
+  assert cpu.bus.cpu_vram[0x41] == 7
+  assert cpu.bus.changed_since(region, generation)
+
+
+@pytest.mark.parametrize('step', ['run_with_callback', 'step_reference'])
+def test_shift_and_rotate_stay_in_8_bits(step):
+  cpu = CPU(Bus(Rom(SNAKE.read_bytes())))
+  cpu.reset()
+  run = getattr(cpu, step)
+  cpu.bus.cpu_vram[0x10] = 0x81
+  cpu.status.insert(CpuFlags.CARRY)
+  cpu.bus.cpu_vram[0x300:0x304] = [0x66, 0x10, 0x26, 0x10]  # ROR $10; ROL $10
+  cpu.program_counter = 0x0300
+  run()
+  assert cpu.bus.cpu_vram[0x10] == 0xc0 and cpu.status.contains(CpuFlags.CARRY)
+  run()
+  assert cpu.bus.cpu_vram[0x10] == 0x81 and cpu.status.contains(CpuFlags.CARRY)
+
+
+if __name__ == '__main__':
+  pytest.main()
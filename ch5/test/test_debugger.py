@@ -0,0 +1,78 @@
+import sys
+import pathlib
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU
+from bus import Bus
+from cartridge import Rom
+from debugger import Debugger, HitKind, IntervalIndex, Watchpoint
+
+
+def machine(program: 'Vec<u8>') -> 'CPU':
+  prg = bytearray(0x8000)
+  prg[0:len(program)] = program
+  prg[0x7ffa:0x8000] = bytes([0x00, 0x80, 0x00, 0x80, 0x00, 0x80])
+  cpu = CPU(Bus(Rom(b'NES\x1a' + bytes([2, 0, 0, 0]) + bytes(8) + bytes(prg))))
+  cpu.reset()
+  return cpu
+
+
+# loop: INX; STX $10; LDA $0810; JMP loop
+LOOP = [0xe8, 0x86, 0x10, 0xad, 0x10, 0x08, 0x4c, 0x00, 0x80]
+
+
+def test_no_instrumentation_without_breakpoints():
+  cpu = machine(LOOP)
+  debugger = Debugger(cpu)
+  debugger.add_breakpoint(0x8003)
+  debugger.add_watchpoint(0x10, read=True)
+  assert 'run_with_callback' in vars(cpu) and 'mem_read' in vars(cpu.bus)
+  debugger.clear()
+  assert 'run_with_callback' not in vars(cpu)
+  assert 'mem_read' not in vars(cpu.bus) and 'mem_write' not in vars(cpu.bus)
+
+
+def test_conditional_breakpoint_stops_before_instruction():
+  cpu = machine(LOOP)
+  debugger = Debugger(cpu)
+  debugger.add_breakpoint(0x8003, lambda cpu: cpu.register_x == 3)
+  cpu.run_until(10_000)
+  assert cpu.program_counter == 0x8003
+  assert cpu.register_x == 3
+  assert debugger.hits[-1].kind == HitKind.BREAK
+  # resuming steps over the breakpoint
+  assert not cpu.run_with_callback()
+  assert cpu.program_counter == 0x8006
+
+
+def test_watchpoints_match_mirrors_and_report_instruction():
+  cpu = machine(LOOP)
+  debugger = Debugger(cpu)
+  debugger.add_watchpoint(0x0010, write=True, condition=lambda cpu, addr, value: value == 2)
+  cpu.run_until(10_000)
+  assert debugger.hits[-1] == (HitKind.WRITE, 0x8001, 0x0010, 2)
+  assert cpu.program_counter == 0x8003
+  debugger.clear()
+  debugger.add_watchpoint(0x1010, read=True, write=False)
+  cpu.run_until(10_000)
+  assert debugger.hits[-1] == (HitKind.READ, 0x8003, 0x0010, 2)
+
+
+def test_interval_index_merges_overlaps():
+  index = IntervalIndex()
+  a = Watchpoint(0x10, 0x1f, False, True, None)
+  b = Watchpoint(0x18, 0x30, False, True, None)
+  index.add(a)
+  index.add(b)
+  index.add(Watchpoint(0x100, 0x100, False, True, None))
+  assert index.starts == [0x10, 0x100]
+  assert index.find(0x1a) == [a, b]
+  assert index.find(0x31) == []
+  index.remove(a)
+  assert not index.covers(0x10)
+
+
+if __name__ == '__main__':
+  pytest.main()
@@ -0,0 +1,43 @@
+import sys
+import pathlib
+import logging
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU
+from bus import Bus
+from cartridge import Rom
+from diagnostics import Diagnostics, Diag, diagnostics
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+def test_counts_everything_logs_once_per_key(caplog):
+  diag = Diagnostics(burst=2)
+  with caplog.at_level(logging.DEBUG, logger='nes'):
+    for _ in range(100):
+      diag.report(Diag.ROM_WRITE, 0x8000, '${:04x}', 0x8000)
+    for addr in range(10):
+      diag.report(Diag.UNMAPPED_READ, addr, '${:04x}', addr)
+  assert diag.counts[Diag.ROM_WRITE] == 100
+  assert diag.counts[Diag.UNMAPPED_READ] == 10
+  assert len(caplog.records) == 3  # 1 ROM_WRITE + burst of 2 UNMAPPED_READ
+  assert diag.suppressed[Diag.UNMAPPED_READ] == 8
+  assert 'write to cartridge ROM' in diag.summary()
+
+
+def test_bus_never_prints(capsys):
+  diagnostics.reset()
+  bus = Bus(Rom(SNAKE.read_bytes()))
+  cpu = CPU(bus)
+  for _ in range(50):
+    cpu.mem_write(0x8000, 1)
+    cpu.mem_read(0x5000)
+  assert capsys.readouterr().out == ''
+  assert diagnostics.counts[Diag.ROM_WRITE] == 50
+  assert diagnostics.counts[Diag.UNMAPPED_READ] == 50
+
+
+if __name__ == '__main__':
+  pytest.main()
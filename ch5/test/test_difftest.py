@@ -0,0 +1,53 @@
+import sys
+import pathlib
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU
+import difftest
+
+
+def buggy(cpu: 'CPU'):
+  # INX without the 8 bit wrap
+  if cpu.bus.mem_read(cpu.program_counter) == 0xe8 and cpu.register_x == 0xff:
+    cpu.program_counter += 1
+    cpu.register_x = 0x100
+    return cpu.bus.tick(2)
+  return CPU.run_with_callback(cpu)
+
+
+@pytest.mark.parametrize('engine', ['handlers', 'bus_handlers'])
+def test_handlers_match_reference(engine):
+  assert difftest.run_many(300, seed=1, candidate=engine, processes=1) == []
+
+
+def test_divergence_is_shrunk(monkeypatch):
+  monkeypatch.setitem(difftest.ENGINES, 'buggy', buggy)
+  case = difftest.Case(0, (1, 0xfe, 2, 0xfd, 0x24), 0x0400,
+                       (b'\xa9\x10', b'\xe8', b'\x85\x20', b'\xe8', b'\xea'),
+                       ((0x10, 1), (0x20, 2)))
+  failure = difftest.run_case(case, 'buggy')
+  assert failure is not None and failure.step == 3
+  minimal = difftest.shrink(case, lambda c: difftest.run_case(c, 'buggy') is not None)
+  assert minimal.program == (b'\xe8', b'\xe8')
+  assert minimal.memory == ()
+  assert minimal.registers == (0, 0xfe, 0, 0, 0)
+  assert 'X: reference 0 candidate 256' in difftest.describe(difftest.run_case(minimal, 'buggy'))
+
+
+def test_random_cases_are_reproducible():
+  assert difftest.random_case(7) == difftest.random_case(7)
+  assert difftest.machine(difftest.random_case(7)).program_counter == difftest.random_case(7).origin
+
+
+def test_random_cases_fill_all_of_ram():
+  cases = [difftest.random_case(seed) for seed in range(20)]
+  addrs = {addr for case in cases for addr, _ in case.memory}
+  assert min(addrs) < 0x0100 and 0x0600 < max(addrs) < 0x0800
+  absolute = [i for case in cases for i in case.program if len(i) == 3 and i[2] < 0x08]
+  assert len(absolute) > 20
+
+
+if __name__ == '__main__':
+  pytest.main()
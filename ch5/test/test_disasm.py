@@ -0,0 +1,72 @@
+import sys
+import pathlib
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU
+from cartridge import Rom
+import disasm
+import opcodes
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+def prg(code: 'Vec<u8>', reset: 'u16' = 0x8000, nmi: 'u16' = 0x8000) -> bytearray:
+  # 16 KiB bank, mirrored at $C000
+  data = bytearray(0x4000)
+  data[:len(code)] = bytes(code)
+  data[0x3ffa:0x4000] = bytes([nmi & 0xff, nmi >> 8, reset & 0xff, reset >> 8, 0, 0])
+  return data
+
+
+def test_follows_branches_and_skips_data():
+  cmap = disasm.analyze(prg([
+    0xa2, 0x03,        # 8000 LDX #$03
+    0xca,              # 8002 DEX
+    0xd0, 0xfd,        # 8003 BNE $8002
+    0x4c, 0x0a, 0x80,  # 8005 JMP $800a
+    0xff, 0xff,        # 8008 data
+    0x60,              # 800a RTS
+  ]))
+  assert sorted(cmap.instructions) == [0x8000, 0x8002, 0x8003, 0x8005, 0x800a]
+  assert not cmap.is_code(0x8008)
+  assert cmap.flags[8] == 0
+  assert cmap.flags[1] == disasm.OPERAND
+  assert cmap.flags[2] == disasm.OPCODE | disasm.JUMP_TARGET
+  assert sorted(cmap.blocks) == [0x8000, 0x8002, 0x8005, 0x800a]
+  assert cmap.blocks[0x8002].successors == [0x8005, 0x8002]
+  assert cmap.blocks[0x8005].successors == [0x800a]
+  assert cmap.blocks[0x800a].successors == []
+  assert cmap.instructions[0x8003].text() == '8003  BNE $8002'
+
+
+def test_vectors_use_mirrored_bank():
+  cmap = disasm.analyze(prg([0xea, 0x00], reset=0xc000, nmi=0x8000))
+  assert cmap.entries['reset'] == 0xc000
+  assert 0xc000 in cmap.instructions and 0x8000 in cmap.instructions
+
+
+def test_snake_listing_is_cached():
+  rom = Rom(SNAKE.read_bytes())
+  cmap = disasm.code_map(rom.prg_rom)
+  assert disasm.code_map(rom.prg_rom) is cmap
+  assert cmap.entries['reset'] == 0x8600
+  assert disasm.listing(cmap)[0] == '8600  JSR $8606'
+  assert cmap.blocks[0x8600].successors == [0x8603, 0x8606]
+
+
+def test_opcode_tables_match_map():
+  for code in range(256):
+    op = opcodes.OPCODES_MAP.get(code)
+    if op is None:
+      assert opcodes.OP_MNEMONIC[code] is None and opcodes.OP_LEN[code] == 1
+      continue
+    assert (opcodes.OP_LEN[code], opcodes.OP_CYCLES[code], opcodes.OP_MODE[code]) == \
+      (op.len, op.cycles, op.mode)
+  assert opcodes.OP_PAGE_CROSS[0xbd] and opcodes.OP_PAGE_CROSS[0xb1]
+  assert not opcodes.OP_PAGE_CROSS[0x9d] and not opcodes.OP_PAGE_CROSS[0xad]
+
+
+if __name__ == '__main__':
+  pytest.main()
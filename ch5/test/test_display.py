@@ -0,0 +1,63 @@
+import sys
+import pathlib
+import subprocess
+
+import numpy as np
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+import display
+from display import open_display, HeadlessDisplay
+from game import Game, COLORS, show_canvas
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+def test_core_imports_stay_light():
+  code = ('import sys, game, display; '
+          'print(sorted({"numpy", "PIL", "ui"} & set(sys.modules)))')
+  out = subprocess.run([sys.executable, '-c', code], cwd=pathlib.Path.cwd().parent / 'src',
+                       capture_output=True, text=True, check=True).stdout
+  assert out.strip() == '[]'
+
+
+def test_headless_reuses_framebuffer_and_calls_hooks():
+  seen = []
+  screen = open_display(4, 3, 'headless',
+                        hooks=[lambda rgb, index: seen.append((id(rgb), index, rgb.sum()))])
+  assert isinstance(screen, HeadlessDisplay)
+  buffer = screen.framebuffer
+  assert buffer.shape == (3, 4, 3) and buffer.dtype == np.uint8
+  screen.present()
+  buffer[1, 2] = (1, 2, 3)
+  screen.present()
+  assert screen.framebuffer is buffer
+  assert seen == [(id(buffer), 0, 0), (id(buffer), 1, 6)]
+  assert screen.frames == 2
+
+
+def test_backend_selection(monkeypatch):
+  monkeypatch.setenv(display.DISPLAY_ENV, 'headless')
+  assert display.default_backend() == 'headless'
+  with pytest.raises(ValueError):
+    open_display(32, 32, 'vga')
+
+
+def test_game_renders_headless():
+  screen = open_display(32, 32, 'headless')
+  game = Game(screen, SNAKE.read_bytes())
+  for _ in range(5000):
+    game.run_instruction()
+  assert screen.frames > 1
+  # rows touched by the last instruction are drawn on the next tick
+  show_canvas(game.cpu, screen.framebuffer, game.read_screen_state(game.cpu))
+  ram = game.cpu.bus.cpu_vram
+  expected = np.array([[COLORS[ram[0x200 + x * 32 + y]] for y in range(32)]
+                       for x in range(32)], dtype=np.uint8)
+  assert np.array_equal(screen.framebuffer, expected)
+  assert screen.framebuffer.any()
+  game.close()
+
+
+if __name__ == '__main__':
+  pytest.main()
@@ -0,0 +1,84 @@
+import sys
+import pathlib
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from frameskip import FrameSkip
+from display import open_display
+from game import Game
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+class FakeClock:
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self) -> float:
+    return self.now
+
+
+def run_frame(skip: 'FrameSkip', clock: 'FakeClock', emulate: float, render: float,
+              changed: bool = True) -> bool:
+  skip.begin()
+  clock.now += emulate
+  drawn = skip.should_render(changed)
+  if drawn:
+    clock.now += render
+    skip.rendered()
+  return drawn
+
+
+def test_renders_every_frame_within_budget():
+  clock = FakeClock()
+  skip = FrameSkip(budget=0.01, max_skip=4, clock=clock)
+  for _ in range(20):
+    assert run_frame(skip, clock, 0.004, 0.002)
+    clock.now += 0.004  # idle until the next frame
+  stats = skip.stats()
+  assert (stats.frames, stats.rendered, stats.skipped) == (20, 20, 0)
+  assert stats.lag == pytest.approx(0)
+
+
+def test_skips_under_load_but_never_more_than_max_skip():
+  clock = FakeClock()
+  skip = FrameSkip(budget=0.01, max_skip=3, clock=clock)
+  drawn = [run_frame(skip, clock, 0.009, 0.005) for _ in range(40)]
+  stats = skip.stats()
+  assert stats.skipped > 0 and stats.rendered > 0
+  assert stats.longest_skip == 3
+  assert stats.frames == 40
+  assert stats.emulation_time == pytest.approx(40 * 0.009)
+  assert stats.render_time == pytest.approx(stats.rendered * 0.005)
+  assert ''.join('R' if d else '.' for d in drawn[10:]).count('....') == 0
+
+
+def test_recovers_after_load_and_ignores_empty_frames():
+  clock = FakeClock()
+  skip = FrameSkip(budget=0.01, max_skip=4, clock=clock)
+  for _ in range(10):
+    run_frame(skip, clock, 0.02, 0.002)
+  assert skip.stats().skipped
+  for _ in range(10):
+    assert not run_frame(skip, clock, 0.001, 0.0, changed=False)
+  assert skip.lag == 0
+  before = skip.stats().skipped
+  assert run_frame(skip, clock, 0.001, 0.001)
+  assert skip.stats().skipped == before
+
+
+def test_game_keeps_emulating_while_skipping():
+  clock = iter(range(10**9)).__next__  # every frame takes far longer than its budget
+  skip = FrameSkip(budget=0.5, max_skip=10**6, clock=clock)
+  screen = open_display(32, 32, 'headless')
+  game = Game(screen, SNAKE.read_bytes(), frameskip=skip)
+  for _ in range(3000):
+    game.run_instruction()
+  assert screen.frames == 1  # only the first picture from the constructor
+  assert skip.stats().skipped > 0
+  assert game.read_screen_state(game.cpu)  # still dirty for the next render
+
+
+if __name__ == '__main__':
+  pytest.main()
@@ -0,0 +1,158 @@
+import sys
+import pathlib
+import random
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from governor import SpeedGovernor, Region, CpuClock, UNTHROTTLED
+from display import open_display
+from game import Game
+import movie
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+class FakeTime:
+  #  clock plus a sleep that overshoots like a real one
+  def __init__(self, overshoot: float = 0.0):
+    self.now = 0.0
+    self.overshoot = overshoot
+    self.slept = 0.0
+
+  def clock(self) -> float:
+    return self.now
+
+  def sleep(self, seconds: float):
+    self.now += seconds + self.overshoot
+    self.slept += seconds + self.overshoot
+
+
+def run(governor: 'SpeedGovernor', time: 'FakeTime', frames: int, work: float):
+  for _ in range(frames):
+    time.now += work
+    governor.pace()
+
+
+@pytest.mark.parametrize('rate', [Region.NTSC, Region.PAL])
+def test_paces_to_console_rate_without_drift(rate):
+  time = FakeTime(overshoot=0.001)  # every sleep is 1 ms late
+  governor = SpeedGovernor(rate, clock=time.clock, sleep=time.sleep)
+  run(governor, time, 600, 0.004)
+  stats = governor.stats()
+  assert stats.frames == 600
+  assert stats.fps == pytest.approx(rate, rel=1e-3)
+  assert stats.recent_fps == pytest.approx(rate, rel=1e-3)
+  assert stats.idle_time == pytest.approx(time.slept)
+  assert stats.resyncs == 0
+
+
+def test_multiplier_and_unthrottled():
+  time = FakeTime()
+  governor = SpeedGovernor(Region.NTSC, 4, clock=time.clock, sleep=time.sleep)
+  run(governor, time, 240, 0.001)
+  assert governor.stats().fps == pytest.approx(4 * Region.NTSC, rel=5e-3)
+
+  governor.set_speed(UNTHROTTLED)
+  before = time.slept
+  run(governor, time, 100, 0.001)
+  assert time.slept == before
+  assert governor.stats().target_fps == 0.0
+  assert governor.stats().recent_fps == pytest.approx(1000, rel=1e-3)
+
+
+def test_slow_frames_are_caught_up_then_resynced():
+  time = FakeTime()
+  governor = SpeedGovernor(Region.NTSC, clock=time.clock, sleep=time.sleep, max_lag=4)
+  period = 1 / Region.NTSC
+  run(governor, time, 10, 0.0)
+  time.now += 2 * period  # one hiccup: paid back without sleeping
+  run(governor, time, 3, 0.0)
+  assert governor.resyncs == 0
+  time.now += 1.0  # a long stall: not worth racing to catch up
+  run(governor, time, 3, 0.0)
+  assert governor.resyncs == 1
+  start = time.now
+  run(governor, time, 60, 0.0)
+  assert time.now - start == pytest.approx(60 * period, rel=0.05)
+
+
+def test_due_counts_frames_for_callback_hosts():
+  time = FakeTime()
+  governor = SpeedGovernor(Region.NTSC, clock=time.clock, sleep=time.sleep, max_lag=4)
+  assert governor.due() == 1
+  assert governor.due() == 0
+  time.now += 1 / 60  # a 60 Hz host is a little slower than 60.0988
+  frames = 0
+  for _ in range(600):
+    frames += governor.due()
+    time.now += 1 / 60
+  assert frames == pytest.approx(10 * Region.NTSC, abs=2)
+  time.now += 5.0  # only max_lag frames of the debt are run
+  assert governor.due() == 4 and governor.resyncs == 1
+  assert governor.due() == 0
+
+
+def test_due_keeps_up_at_4x_with_a_jittery_host():
+  rng = random.Random(3)
+  time = FakeTime()
+  governor = SpeedGovernor(Region.NTSC, 4, clock=time.clock, sleep=time.sleep)
+  start = time.now
+  frames = 0
+  for _ in range(600):
+    frames += governor.due()
+    time.now += 1 / 60 + rng.uniform(-0.002, 0.002)
+  expected = (time.now - start) * 4 * Region.NTSC
+  assert frames == pytest.approx(expected, rel=0.015)
+  assert governor.resyncs == 0
+
+
+def test_due_counts_ticks_with_nothing_due_as_idle():
+  time = FakeTime()
+  governor = SpeedGovernor(30.0, clock=time.clock, sleep=time.sleep)
+  frames = 0
+  for _ in range(600):  # 10 s of a 60 Hz host, every other tick is empty
+    frames += governor.due()
+    time.now += 1 / 60
+  assert frames == pytest.approx(300, abs=1)
+  assert governor.stats().idle_time == pytest.approx(5.0, abs=2 / 60)
+  assert time.slept == 0.0
+
+
+def test_run_frame_emulates_one_ppu_frame():
+  game = Game(open_display(32, 32, 'headless'), SNAKE.read_bytes())
+  bus = game.cpu.bus
+  before = bus.cycles
+  game.run_frame()
+  assert bus.ppu.frame_count == 1
+  assert 29781 - 7 <= bus.cycles - before <= 29781 + 7
+
+
+def test_run_frame_with_a_cycle_budget():
+  assert CpuClock.PAL / Region.PAL == pytest.approx(33247.5, abs=0.5)
+  game = Game(open_display(32, 32, 'headless'), SNAKE.read_bytes(), frame_cycles=1000.5)
+  bus = game.cpu.bus
+  before = bus.cycles
+  for _ in range(4):
+    assert not game.run_frame()
+  # overshoot is paid back by the next frame, so only the last one shows
+  assert 4002 <= bus.cycles - before <= 4002 + 7
+  assert bus.ppu.frame_count == 0
+
+
+def test_run_frame_records_one_movie_frame_per_frame(tmp_path):
+  path = tmp_path / 'snake.mov'
+  game = Game(open_display(32, 32, 'headless'), SNAKE.read_bytes(), movie_path=path)
+  hashes = []
+  for _ in range(3):
+    game.run_frame()
+    hashes.append(movie.ram_hash(game.cpu.bus))
+  game.run_instruction()  # instruction pacing is not a frame
+  game.close()
+  kinds = [r.kind for r in movie.read_movie(path)[1]]
+  assert kinds.count(movie.MovieEvent.FRAME) == 3
+  assert list(movie.replay(path, SNAKE.read_bytes())) == hashes
+
+
+if __name__ == '__main__':
+  pytest.main()
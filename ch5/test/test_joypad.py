@@ -0,0 +1,108 @@
+import sys
+import pathlib
+import threading
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU
+from bus import Bus
+from cartridge import Rom
+from joypad import Joypad, JoypadButton
+from inputqueue import InputQueue, InputKind
+from display import open_display
+from game import Game
+import movie
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+def read_all(bus: 'Bus', addr: int = 0x4016) -> list:
+  bus.mem_write(0x4016, 1)
+  bus.mem_write(0x4016, 0)
+  return [bus.mem_read(addr) for _ in range(10)]
+
+
+def test_strobe_and_shift_register():
+  pad = Joypad()
+  pad.set_button_pressed_status(JoypadButton.BUTTON_A, True)
+  pad.set_button_pressed_status(JoypadButton.START, True)
+  pad.set_button_pressed_status(JoypadButton.RIGHT, True)
+  pad.write(1)
+  assert [pad.read() for _ in range(3)] == [1, 1, 1]  # strobe high: A only
+  pad.write(0)
+  assert [pad.read() for _ in range(10)] == [1, 0, 0, 1, 0, 0, 0, 1, 1, 1]
+  pad.set_button_pressed_status(JoypadButton.RIGHT, False)
+  assert pad.button_status == JoypadButton.BUTTON_A | JoypadButton.START
+
+
+def test_bus_ports_share_the_strobe():
+  bus = Bus(Rom(SNAKE.read_bytes()))
+  bus.joypad1.set_button_pressed_status(JoypadButton.UP, True)
+  bus.joypad2.set_button_pressed_status(JoypadButton.BUTTON_B, True)
+  assert read_all(bus) == [0, 0, 0, 0, 1, 0, 0, 0, 1, 1]
+  assert [bus.mem_read(0x4017) for _ in range(2)] == [0, 1]
+  assert not bus.apu.log  # $4016 is not an APU register
+
+
+def test_queue_is_thread_safe_and_ordered():
+  ticks = iter(range(10**6))
+  inputs = InputQueue(clock=lambda: next(ticks))
+  lock = threading.Lock()
+
+  def producer():
+    for n in range(500):
+      with lock:  # keep the fake clock's iterator single threaded
+        inputs.poke(0xff, n & 0xff)
+
+  threads = [threading.Thread(target=producer) for _ in range(4)]
+  for thread in threads:
+    thread.start()
+  drained = []
+  while any(thread.is_alive() for thread in threads) or len(inputs):
+    drained += inputs.drain()
+  for thread in threads:
+    thread.join()
+  drained += inputs.drain()
+  assert len(drained) == 2000 == inputs.applied
+  assert [event.time for event in drained] == sorted(event.time for event in drained)
+
+
+def test_drain_until_keeps_later_events():
+  now = [0.0]
+  inputs = InputQueue(clock=lambda: now[0])
+  inputs.press(JoypadButton.START)
+  now[0] = 2.0
+  inputs.release(JoypadButton.START)
+  first = inputs.drain(until=1.0)
+  assert [(e.kind, e.value) for e in first] == [(InputKind.BUTTON, JoypadButton.START << 1 | 1)]
+  assert len(inputs) == 1
+  assert [e.value for e in inputs.drain()] == [JoypadButton.START << 1]
+
+
+def test_game_applies_input_between_ticks_and_replays(tmp_path):
+  path = tmp_path / 'snake.mov'
+  # frames of about one instruction each
+  game = Game(open_display(32, 32, 'headless'), SNAKE.read_bytes(), movie_path=path,
+              frame_cycles=3.0)
+  hashes = []
+  for tick in range(2000):
+    if tick == 500:
+      game.inputs.poke(0xff, 0x73)
+      game.inputs.press(JoypadButton.DOWN)
+      assert game.cpu.bus.cpu_vram[0xff] != 0x73  # nothing applied yet
+    if tick == 900:
+      game.inputs.release(JoypadButton.DOWN)
+    game.run_frame()
+    if tick == 500:
+      assert game.cpu.bus.joypad1.button_status == JoypadButton.DOWN
+    hashes.append(movie.ram_hash(game.cpu.bus))
+  assert game.cpu.bus.joypad1.button_status == 0
+  game.close()
+  assert list(movie.replay(path, SNAKE.read_bytes())) == hashes
+  kinds = [r.kind for r in movie.read_movie(path)[1]]
+  assert kinds.count(movie.MovieEvent.JOYPAD) == 2
+
+
+if __name__ == '__main__':
+  pytest.main()
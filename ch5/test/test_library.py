@@ -0,0 +1,55 @@
+import sys
+import pathlib
+import os
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cartridge import Mirroring, parse_header
+from library import RomLibrary
+from movie import rom_hash
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+def ines(prg_banks: int, chr_banks: int, flags6: int = 0, flags7: int = 0) -> bytes:
+  return b'NES\x1a' + bytes([prg_banks, chr_banks, flags6, flags7]) + bytes(8) + \
+    bytes(prg_banks * 0x4000 + chr_banks * 0x2000)
+
+
+def test_parse_header():
+  header = parse_header(ines(2, 1, 0b0100_0101, 0b0001_0000))
+  assert header.ines and header.trainer
+  assert header.mapper == 0x14
+  assert (header.prg_rom_size, header.chr_rom_size) == (0x8000, 0x2000)
+  assert header.screen_mirroring == Mirroring.VERTICAL
+
+
+def test_incremental_scan(tmp_path):
+  (tmp_path / 'sub').mkdir()
+  (tmp_path / 'snake.nes').write_bytes(SNAKE.read_bytes())
+  (tmp_path / 'sub' / 'mmc1.NES').write_bytes(ines(8, 0, 0x10))
+  (tmp_path / 'notes.txt').write_text('not a rom')
+  with RomLibrary(tmp_path / 'index.db') as library:
+    assert library.scan(tmp_path) == (2, 0, 0, 0)
+    assert library.scan(tmp_path) == (0, 0, 2, 0)
+    snake, = library.find(name='snake*')
+    assert snake.sha1 == rom_hash(SNAKE.read_bytes()).hex()
+    assert library.by_hash(snake.sha1) == [snake]
+    mmc1, = library.find(mapper=1)
+    assert mmc1.prg_rom_size == 8 * 0x4000 and mmc1.mirroring == Mirroring.HORIZONTAL
+
+    path = tmp_path / 'sub' / 'mmc1.NES'
+    path.write_bytes(ines(8, 2, 0x11))
+    os.utime(path, ns=(1, 1))
+    (tmp_path / 'snake.nes').unlink()
+    assert library.scan(tmp_path) == (0, 1, 0, 1)
+    assert [e.chr_rom_size for e in library.find()] == [0x4000]
+    assert len(library) == 1
+  # the index persists
+  with RomLibrary(tmp_path / 'index.db') as library:
+    assert library.scan(tmp_path) == (0, 0, 1, 0)
+
+
+if __name__ == '__main__':
+  pytest.main()
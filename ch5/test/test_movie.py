@@ -0,0 +1,51 @@
+import sys
+import pathlib
+from random import Random
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU
+from bus import Bus
+from cartridge import Rom
+import movie
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+def record_session(path, ticks: int = 3000):
+  # same shape as Game.run_instruction: RNG poke, sometimes a key, one step
+  nes_bytes = SNAKE.read_bytes()
+  cpu = CPU(Bus(Rom(nes_bytes)))
+  cpu.reset()
+  rng = Random(7)
+  rec = movie.MovieRecorder(path, cpu, nes_bytes)
+  hashes = []
+  for tick in range(ticks):
+    rec.rng(0xfe, rng.randint(1, 16))
+    if tick % 500 == 250:
+      rec.poke(0xff, rng.choice([0x77, 0x73, 0x61, 0x64]))
+    cpu.run_with_callback()
+    rec.frame()
+    hashes.append(movie.ram_hash(cpu.bus))
+  rec.close()
+  return hashes
+
+
+def test_replay_reproduces_ram_hashes(tmp_path):
+  path = tmp_path / 'snake.mov'
+  hashes = record_session(path)
+  replayed = list(movie.replay(path, SNAKE.read_bytes()))
+  assert replayed == hashes
+  assert len(set(hashes)) > 1
+
+
+def test_replay_rejects_other_rom(tmp_path):
+  path = tmp_path / 'snake.mov'
+  record_session(path, ticks=1)
+  with pytest.raises(ValueError):
+    list(movie.replay(path, SNAKE.read_bytes() + b'\x00'))
+
+
+if __name__ == '__main__':
+  pytest.main()
@@ -0,0 +1,121 @@
+import sys
+import pathlib
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU
+from bus import Bus
+from cartridge import Rom, Mirroring
+from ppu import NesPPU, StatusRegister, DOTS_PER_FRAME, VBLANK_SCANLINE
+from palette import SYSTEM_PALETTE
+from render import Renderer
+
+SNAKE = pathlib.Path.cwd().parent / 'snake.nes'
+
+
+def new_ppu() -> 'NesPPU':
+  return NesPPU(bytes(0x2000), Mirroring.HORIZONTAL)
+
+
+def test_ppu_vram_writes():
+  ppu = new_ppu()
+  ppu.write_to_ppu_addr(0x23)
+  ppu.write_to_ppu_addr(0x05)
+  ppu.write_to_data(0x66)
+  assert ppu.vram[0x0305] == 0x66
+
+
+def test_ppu_vram_reads_are_buffered():
+  ppu = new_ppu()
+  ppu.vram[0x0305] = 0x66
+  ppu.write_to_ppu_addr(0x23)
+  ppu.write_to_ppu_addr(0x05)
+  ppu.read_data()  # load into buffer
+  assert ppu.addr == 0x2306
+  ppu.write_to_ppu_addr(0x23)
+  ppu.write_to_ppu_addr(0x05)
+  ppu.read_data()
+  assert ppu.read_data() == 0x66
+
+
+def test_ppu_horizontal_mirror():
+  ppu = new_ppu()
+  ppu.write_to_ppu_addr(0x24)
+  ppu.write_to_ppu_addr(0x05)
+  ppu.write_to_data(0x66)  # write to a
+  ppu.write_to_ppu_addr(0x28)
+  ppu.write_to_ppu_addr(0x05)
+  ppu.write_to_data(0x77)  # write to B
+  ppu.write_to_ppu_addr(0x20)
+  ppu.write_to_ppu_addr(0x05)
+  ppu.read_data()
+  assert ppu.read_data() == 0x66  # read from A
+  ppu.write_to_ppu_addr(0x2C)
+  ppu.write_to_ppu_addr(0x05)
+  ppu.read_data()
+  assert ppu.read_data() == 0x77  # read from b
+
+
+def test_ppu_vertical_mirror_and_repoint():
+  ppu = NesPPU(bytes(0x2000), Mirroring.VERTICAL)
+  ppu.write_to_ppu_addr(0x20)
+  ppu.write_to_ppu_addr(0x05)
+  ppu.write_to_data(0x66)  # write to A
+  assert ppu.nametables[2][0x05] == 0x66  # a aliases A
+  ppu.set_mirroring(Mirroring.HORIZONTAL)
+  assert ppu.nametables[1][0x05] == 0x66
+  assert ppu.nametables[2][0x05] == 0
+
+
+def test_read_status_resets_vblank_and_latch():
+  ppu = new_ppu()
+  ppu.status |= StatusRegister.VBLANK_STARTED
+  ppu.write_to_ppu_addr(0x21)
+  status = ppu.read_status()
+  assert status >> 7 == 1
+  assert not ppu.status & StatusRegister.VBLANK_STARTED
+  ppu.write_to_ppu_addr(0x23)
+  ppu.write_to_ppu_addr(0x05)
+  assert ppu.addr == 0x2305
+
+
+def test_catch_up_renders_elapsed_scanlines_in_bulk():
+  ppu = new_ppu()
+  calls = []
+  ppu.renderer = lambda _ppu, start, end: calls.append((start, end))
+  ppu.write_to_ctrl(0b1000_0000)
+  ppu.catch_up(1000)
+  assert ppu.position == 3000
+  ppu.catch_up(ppu.next_sync_cycle())
+  assert ppu.scanline == VBLANK_SCANLINE
+  assert ppu.status & StatusRegister.VBLANK_STARTED
+  assert ppu.poll_nmi_interrupt()
+  assert not ppu.poll_nmi_interrupt()
+  assert calls == [(0, 8), (8, 240)]
+  ppu.catch_up(ppu.next_sync_cycle())
+  assert ppu.frame_count == 1
+  assert not ppu.status & StatusRegister.VBLANK_STARTED
+
+
+def test_renderer_fills_frame():
+  ppu = new_ppu()
+  ppu.renderer = Renderer()
+  ppu.palette_table[0] = 0x21
+  ppu.catch_up(DOTS_PER_FRAME // 3)
+  assert tuple(ppu.renderer.frame.data[239, 255]) == SYSTEM_PALETTE[0x21]
+
+
+def test_bus_syncs_ppu_on_register_access():
+  bus = Bus(Rom(SNAKE.read_bytes()))
+  cpu = CPU(bus)
+  cpu.reset()
+  for _ in range(100):
+    cpu.run_with_callback()
+  assert bus.ppu.last_cpu_cycle == 0
+  bus.mem_read(0x2002)
+  assert bus.ppu.last_cpu_cycle == bus.cycles > 0
+
+
+if __name__ == '__main__':
+  pytest.main()
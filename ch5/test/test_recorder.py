@@ -0,0 +1,43 @@
+import sys
+import pathlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+import recorder
+
+
+def frames(count: int):
+  rgb = np.zeros((32, 32, 3), dtype=np.uint8)
+  for n in range(count):
+    rgb[n % 32, (n * 7) % 32] = (n, 255 - n, 3)
+    yield rgb
+
+
+def test_round_trip_across_chunks(tmp_path):
+  path = tmp_path / 'run.rec'
+  with recorder.FrameRecorder(path, 32, 32, chunk_frames=4) as rec:
+    for rgb in frames(10):
+      rec.write(rgb)
+  expected = [rgb.copy() for rgb in frames(10)]
+  got = [rgb.copy() for rgb in recorder.read_frames(path)]
+  assert len(got) == 10
+  assert all(np.array_equal(a, b) for a, b in zip(expected, got))
+  assert path.stat().st_size < 32 * 32 * 3
+
+
+def test_convert_to_gif(tmp_path):
+  path = tmp_path / 'run.rec'
+  with recorder.FrameRecorder(path, 32, 32) as rec:
+    for rgb in frames(3):
+      rec.write(rgb)
+  recorder.convert(path, tmp_path / 'run.gif', factor=2)
+  image = Image.open(tmp_path / 'run.gif')
+  assert image.size == (64, 64)
+  assert image.n_frames == 3
+
+
+if __name__ == '__main__':
+  pytest.main()
@@ -0,0 +1,134 @@
+import sys
+import pathlib
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cpu import CPU, CpuFlags
+from bus import Bus
+from cartridge import Rom
+from scheduler import Scheduler, Event, NEVER
+
+
+def test_events_dispatch_in_cycle_order():
+  scheduler = Scheduler()
+  seen = []
+  scheduler.handlers[Event.MAPPER_IRQ] = lambda cycle, data: seen.append(('irq', cycle))
+  scheduler.handlers[Event.DMA_STALL] = lambda cycle, data: seen.append(('dma', data))
+  scheduler.schedule(30, Event.MAPPER_IRQ)
+  scheduler.schedule(10, Event.DMA_STALL, 513)
+  assert scheduler.next_cycle == 10
+  scheduler.run_until(20)
+  assert seen == [('dma', 513)]
+  assert scheduler.next_cycle == 30
+  scheduler.run_until(30)
+  assert seen == [('dma', 513), ('irq', 30)]
+  assert scheduler.next_cycle == NEVER
+
+
+def test_cancelled_events_are_dropped():
+  scheduler = Scheduler()
+  seen = []
+  scheduler.handlers[Event.MAPPER_IRQ] = lambda cycle, data: seen.append(cycle)
+  scheduler.schedule(10, Event.MAPPER_IRQ)
+  scheduler.reschedule(50, Event.MAPPER_IRQ)
+  assert scheduler.peek() == 50
+  scheduler.run_until(40)
+  assert seen == []
+  scheduler.run_until(50)
+  assert seen == [50]
+
+
+def nrom(program: 'Vec<u8>', nmi: 'Vec<u8>', irq: 'Vec<u8>' = (0x40,)) -> 'Rom':
+  prg = bytearray(0x8000)
+  prg[0:len(program)] = program
+  prg[0x1000:0x1000 + len(nmi)] = nmi
+  prg[0x2000:0x2000 + len(irq)] = irq
+  prg[0x7ffa:0x8000] = bytes([0x00, 0x90, 0x00, 0x80, 0x00, 0xa0])
+  return Rom(b'NES\x1a' + bytes([2, 0, 0, 0]) + bytes(8) + bytes(prg))
+
+
+def test_vblank_nmi_is_serviced():
+  # LDA #$80; STA $2000; loop: JMP loop / NMI: INX; RTI
+  rom = nrom([0xa9, 0x80, 0x8d, 0x00, 0x20, 0x4c, 0x05, 0x80], [0xe8, 0x40])
+  bus = Bus(rom)
+  cpu = CPU(bus)
+  cpu.reset()
+  cpu.run_until(29781 * 3)
+  assert cpu.register_x == 3
+  assert cpu.program_counter in (0x8005, 0x8006, 0x8007)
+
+
+def test_irq_respects_interrupt_disable():
+  # SEI; loop: JMP loop / IRQ: INY; RTI
+  rom = nrom([0x78, 0x4c, 0x01, 0x80], [0x40], [0xc8, 0x40])
+  bus = Bus(rom)
+  cpu = CPU(bus)
+  cpu.reset()
+  bus.scheduler.schedule(100, Event.MAPPER_IRQ)
+  cpu.run_until(200)
+  assert cpu.register_y == 0
+  cpu.status.remove(CpuFlags.INTERRUPT_DISABLE)
+  cpu.irq_unmasked()
+  cpu.run_until(220)
+  assert cpu.register_y >= 1
+  bus.acknowledge_irq(Event.MAPPER_IRQ)
+  cpu.run_until(260)
+  count = cpu.register_y
+  cpu.run_until(400)
+  assert cpu.register_y == count
+
+
+def test_nmi_due_during_irq_entry_is_taken():
+  # LDA #$80; STA $2000; CLI; loop: JMP loop / NMI: INX; JMP self
+  # IRQ: JMP self, so only the interrupt entry itself can poll the NMI
+  rom = nrom([0xa9, 0x80, 0x8d, 0x00, 0x20, 0x58, 0x4c, 0x06, 0x80],
+             [0xe8, 0x4c, 0x01, 0x90], [0x4c, 0x00, 0xa0])
+  bus = Bus(rom)
+  cpu = CPU(bus)
+  cpu.reset()
+  vblank = bus.ppu_sync_cycle
+  cpu.run_until(vblank - 10)
+  # the IRQ is taken 3 cycles later, its 7 entry cycles cross vblank
+  bus.scheduler.schedule(bus.cycles + 3, Event.APU_FRAME_IRQ)
+  cpu.run_until(vblank + 10)
+  assert cpu.register_x == 1
+  assert cpu.mem_read_u16(0x0100 + cpu.stack_pointer + 2) == 0xa000
+
+
+def test_mapper_irq_is_taken_and_acknowledged():
+  # CLI; loop: JMP loop / IRQ: INY; RTI
+  rom = nrom([0x58, 0x4c, 0x01, 0x80], [0x40], [0xc8, 0x40])
+  bus = Bus(rom)
+  cpu = CPU(bus)
+  cpu.reset()
+  bus.schedule_mapper_irq(300)
+  cpu.run_until(290)
+  assert cpu.register_y == 0
+  cpu.run_until(320)
+  assert cpu.register_y >= 1
+  bus.acknowledge_mapper_irq()
+  cpu.run_until(360)  # an IRQ entered before the acknowledge still runs
+  count = cpu.register_y
+  cpu.run_until(600)
+  assert cpu.register_y == count
+  bus.schedule_mapper_irq(700)
+  bus.acknowledge_mapper_irq()  # disabled before it fired
+  cpu.run_until(900)
+  assert cpu.register_y == count and not bus.irq_sources
+
+
+def test_oam_dma_stall_is_a_scheduled_event():
+  # LDA #$02; STA $4014; loop: JMP loop
+  bus = Bus(nrom([0xa9, 0x02, 0x8d, 0x14, 0x40, 0x4c, 0x05, 0x80], [0x40]))
+  cpu = CPU(bus)
+  cpu.reset()
+  cpu.run_with_callback()
+  before = bus.cycles
+  cpu.run_with_callback()
+  assert bus.cycles - before == 4 + 513 + (before & 1)
+  assert not bus.scheduler.pending(Event.DMA_STALL)
+
+
+if __name__ == '__main__':
+  pytest.main()
@@ -0,0 +1,45 @@
+import sys
+import pathlib
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from sinks import (SinkPipeline, RawSink, PngSnapshotSink, FileSequenceSink,
+                   encode_bmp)
+
+
+def gradient() -> 'np.ndarray':
+  rgb = np.zeros((5, 7, 3), dtype=np.uint8)
+  rgb[..., 0] = np.arange(7) * 30
+  rgb[..., 1] = np.arange(5)[:, None] * 50
+  return rgb
+
+
+def test_bmp_round_trip():
+  rgb = gradient()
+  image = Image.open(BytesIO(encode_bmp(rgb)))
+  assert np.array_equal(np.asarray(image.convert('RGB')), rgb)
+
+
+def test_pipeline_shares_buffer_and_encodes_on_demand(tmp_path):
+  rgb = gradient()
+  pipeline = SinkPipeline(rgb)
+  raw = pipeline.add(RawSink())
+  snap = pipeline.add(PngSnapshotSink(factor=2))
+  files = pipeline.add(FileSequenceSink(tmp_path, fmt='ppm', every=2))
+  for _ in range(3):
+    pipeline.push()
+  pipeline.close()
+  assert raw.rgb is rgb
+  assert raw.index == 2
+  image = Image.open(BytesIO(snap.snapshot()))
+  assert image.size == (14, 10)
+  assert sorted(p.name for p in tmp_path.iterdir()) == \
+    ['frame_000000.ppm', 'frame_000002.ppm']
+
+
+if __name__ == '__main__':
+  pytest.main()
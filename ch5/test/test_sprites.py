@@ -0,0 +1,90 @@
+import sys
+import pathlib
+
+import pytest
+
+sys.path.append(str(pathlib.Path.cwd().parent) + '/src')
+from cartridge import Mirroring
+from frame import Frame
+from palette import SYSTEM_PALETTE
+from ppu import NesPPU, MaskRegister, StatusRegister
+import sprites
+
+
+def new_ppu() -> 'NesPPU':
+  # tile 1: left column solid (colour 1), tile 2: every pixel colour 3
+  chr_rom = bytearray(0x2000)
+  for row in range(8):
+    chr_rom[16 + row] = 0b1000_0000
+    chr_rom[32 + row] = 0xff
+    chr_rom[32 + 8 + row] = 0xff
+  ppu = NesPPU(bytes(chr_rom), Mirroring.HORIZONTAL)
+  ppu.mask = MaskRegister.SHOW_SPRITES | MaskRegister.SHOW_BACKGROUND | \
+    MaskRegister.LEFTMOST_8PXL_SPRITE | MaskRegister.LEFTMOST_8PXL_BACKGROUND
+  ppu.palette_table[0x11] = 0x30
+  ppu.palette_table[0x13] = 0x16
+  ppu.oam_data[:] = b'\xff' * 256  # y = 0xff hides every sprite
+  return ppu
+
+
+def put_sprite(ppu, index, x, y, tile, attr=0):
+  ppu.oam_data[index * 4:index * 4 + 4] = bytes([y - 1, tile, attr, x])
+
+
+def test_sprite_drawn_with_palette():
+  ppu = new_ppu()
+  put_sprite(ppu, 0, 10, 20, 1)
+  frame = Frame()
+  sprites.render_sprites(ppu, frame)
+  assert tuple(frame.data[20, 10]) == SYSTEM_PALETTE[0x30]
+  assert tuple(frame.data[27, 10]) == SYSTEM_PALETTE[0x30]
+  assert tuple(frame.data[20, 11]) == (0, 0, 0)
+  assert tuple(frame.data[28, 10]) == (0, 0, 0)
+
+
+def test_horizontal_flip():
+  ppu = new_ppu()
+  put_sprite(ppu, 0, 10, 20, 1, sprites.FLIP_HORIZONTAL)
+  frame = Frame()
+  sprites.render_sprites(ppu, frame)
+  assert tuple(frame.data[20, 10]) == (0, 0, 0)
+  assert tuple(frame.data[20, 17]) == SYSTEM_PALETTE[0x30]
+
+
+def test_lower_index_wins_and_behind_background():
+  ppu = new_ppu()
+  put_sprite(ppu, 0, 10, 20, 1)
+  put_sprite(ppu, 1, 10, 20, 2)
+  put_sprite(ppu, 2, 40, 20, 2, sprites.PRIORITY_BEHIND)
+  frame = Frame()
+  frame.bg_opaque[20, 40] = True
+  sprites.render_sprites(ppu, frame)
+  assert tuple(frame.data[20, 10]) == SYSTEM_PALETTE[0x30]
+  assert tuple(frame.data[20, 11]) == SYSTEM_PALETTE[0x16]
+  assert tuple(frame.data[20, 40]) == (0, 0, 0)
+  assert tuple(frame.data[21, 40]) == SYSTEM_PALETTE[0x16]
+
+
+def test_eight_sprites_per_scanline():
+  ppu = new_ppu()
+  for i in range(9):
+    put_sprite(ppu, i, i * 10, 50, 2)
+  frame = Frame()
+  table = sprites.render_sprites(ppu, frame)
+  assert table.overflow[50]
+  assert ppu.status & StatusRegister.SPRITE_OVERFLOW
+  assert tuple(frame.data[50, 70]) == SYSTEM_PALETTE[0x16]
+  assert tuple(frame.data[50, 80]) == (0, 0, 0)
+
+
+def test_sprite_zero_hit_position():
+  ppu = new_ppu()
+  put_sprite(ppu, 0, 100, 30, 2)
+  frame = Frame()
+  assert sprites.sprite_zero_hit(ppu, frame) is None
+  frame.bg_opaque[33, 104:] = True
+  assert sprites.sprite_zero_hit(ppu, frame) == (33, 104)
+
+
+if __name__ == '__main__':
+  pytest.main()